@@ -1,52 +1,2815 @@
 # pip install PyMuPDF ttkbootstrap Pillow
 
+import time
+_STARTUP_T0 = time.perf_counter()  # início da importação (relatório de inicialização)
+
 import os
+import re
 import sys
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+import atexit
 import traceback
-from copy import deepcopy
+import marshal
+import shutil
+import tempfile
+import zlib
+import csv
+import string
+from itertools import islice
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import io
+import multiprocessing
+import threading
+import queue
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+# extras para o sistema de licença
+import json
+import uuid
+import hashlib
+import datetime
+import argparse
+
+# Interface gráfica: importada só quando uma janela é criada (load_gui); lote, mala direta,
+# servidor e scripts usam EditorSession sem carregar Tk
+tk = filedialog = simpledialog = messagebox = tb = ImageTk = None
+
+# ================== LOGGER DIÁRIO ==================
+BASE_DIR = os.path.dirname(sys.executable if getattr(sys, "frozen", False) else __file__)
+LOG_DIR = os.path.join(BASE_DIR, "logs")
+LOG_FILE = os.path.join(LOG_DIR, "app.log")
+JOURNAL_DIR = os.path.join(BASE_DIR, "journal")  # diário de edições da sessão (recuperação após queda)
+STARTUP_REPORT = os.path.join(LOG_DIR, "startup.jsonl")  # tempos de cada abertura (StartupTimer)
+logger = logging.getLogger("pdf_editor")
+
+
+_log_listener = None
+
+
+def setup_logging(level=None):
+    """Log diário em arquivo + exceções não tratadas. Chamado por quem executa o programa
+    (janela, lote, mala direta, servidor); importar o módulo não cria pastas nem handlers.
+
+    Quem loga só põe o registro numa fila (QueueHandler); a escrita no arquivo acontece na thread
+    do QueueListener, nunca na thread do Tk. Nível: PDF_EDITOR_LOG_LEVEL (padrão INFO).
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+    os.makedirs(LOG_DIR, exist_ok=True)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level or os.getenv("PDF_EDITOR_LOG_LEVEL", "INFO").upper())
+    handler = TimedRotatingFileHandler(LOG_FILE, when="midnight", interval=1,
+                                       backupCount=30, encoding="utf-8")
+    handler.suffix = "%Y-%m-%d.log"
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    log_queue = queue.SimpleQueue()
+    root_logger.addHandler(QueueHandler(log_queue))
+    _log_listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)  # esvazia a fila antes de sair
+    sys.excepthook = excecao_nao_tratada
+
+
+def excecao_nao_tratada(exc_type, exc_value, exc_traceback):
+    if issubclass(exc_type, KeyboardInterrupt):
+        sys.__excepthook__(exc_type, exc_value, exc_traceback)
+        return
+    logger.critical("Exceção não tratada", exc_info=(exc_type, exc_value, exc_traceback))
+
+
+def report_callback_exception(self, exc, val, tb_):
+    erro = "".join(traceback.format_exception(exc, val, tb_))
+    logger.error(f"Erro no Tkinter:\n{erro}")
+
+
+class StartupTimer:
+    """
+    Tempo de cada fase da abertura até a primeira janela desenhada (import, log, gui, tema, licença,
+    interface, janela). Vai para o log e para startup.jsonl (uma linha por abertura; ver startup-report).
+    """
+
+    def __init__(self, started: float):
+        self.started = self.last = started
+        self.phases = []  # (fase, segundos)
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        total = self.last - self.started
+        logger.info("Inicialização: " + ", ".join(f"{name} {sec * 1000:.0f}ms" for name, sec in self.phases)
+                    + f" — total {total * 1000:.0f}ms")
+        record = {"date": datetime.datetime.now().isoformat(timespec="seconds"), "total_ms": round(total * 1000, 1),
+                  "phases": {name: round(sec * 1000, 1) for name, sec in self.phases}}
+        try:
+            with open(STARTUP_REPORT, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar {STARTUP_REPORT}: {e}")
+
+
+def startup_main(argv) -> int:
+    """python editor_trial.py startup-report [-n N]: mediana e p90 de cada fase nas últimas N aberturas."""
+    parser = argparse.ArgumentParser(prog="editor_trial.py startup-report",
+                                     description="Resumo dos tempos de abertura gravados em startup.jsonl.")
+    parser.add_argument("-n", "--last", type=int, default=20, help="quantas aberturas considerar")
+    args = parser.parse_args(argv)
+    try:
+        with open(STARTUP_REPORT, encoding="utf-8") as f:
+            runs = [json.loads(line) for line in f if line.strip()][-args.last:]
+    except (OSError, ValueError) as e:
+        print(f"Sem relatório de inicialização: {e}", file=sys.stderr)
+        return 2
+    if not runs:
+        print("Nenhuma abertura registrada ainda.")
+        return 0
+    series = {"total": [r["total_ms"] for r in runs]}
+    for run in runs:
+        for name, ms in run["phases"].items():
+            series.setdefault(name, []).append(ms)
+    print(f"{len(runs)} abertura(s), de {runs[0]['date']} a {runs[-1]['date']}")
+    for name, values in series.items():
+        last = values[-1]
+        values.sort()
+        print(f"  {name:<10} mediana {values[len(values) // 2]:7.0f}ms   p90 {values[int(len(values) * 0.9)]:7.0f}ms   "
+              f"última {last:7.0f}ms")
+    return 0
+
+
+def load_gui():
+    """Importa Tk, ttkbootstrap e ImageTk (uma vez), antes de criar a primeira janela."""
+    global tk, filedialog, simpledialog, messagebox, tb, ImageTk
+    if tk is not None:
+        return
+    import tkinter as tk
+    from tkinter import filedialog, simpledialog, messagebox
+    import ttkbootstrap as tb
+    from PIL import ImageTk
+    tk.Tk.report_callback_exception = report_callback_exception
+
+# pasta de dados do app (licença, cache de renderização)
+APP_DATA_DIR = os.path.join(os.getenv("APPDATA") or os.path.expanduser("~"), "PDFEditorApp")
+STARTUP = StartupTimer(_STARTUP_T0)
+# ====================================================
+
+
+# ================== MEDIÇÃO DE DESEMPENHO ==================
+PERF_SLOW_MS = 150  # etapa na thread principal acima disso vai para o log (travamentos relatados)
+
+
+class LatencyStats:
+    """Contagem, erros e latência (ms) de um endpoint; percentis sobre as últimas SAMPLES requisições."""
+    SAMPLES = 2048
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+        self.recent = deque(maxlen=self.SAMPLES)
+
+    def add(self, ms: float, ok: bool):
+        self.count += 1
+        self.errors += not ok
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.last_ms = ms
+        self.recent.append(ms)
+
+    def summary(self) -> dict:
+        recent = sorted(self.recent)
+
+        def pct(p):
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))], 2) if recent else 0.0
+
+        return {"count": self.count, "errors": self.errors,
+                "mean_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+                "last_ms": round(self.last_ms, 2), "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99), "max_ms": round(self.max_ms, 2)}
+
+
+class PerfRecorder:
+    """
+    Duração e bytes das etapas quentes: open, pixmap, ppm/photo (conversão para o Tk), words,
+    capture/restore (estado das páginas), undo/redo, snapshot e save.
+    Estatísticas por etapa (LatencyStats, para o painel F12) e os últimos eventos no formato
+    Chrome trace (chrome://tracing ou ui.perfetto.dev), para achar a etapa de um travamento.
+    Uso: t0 = time.perf_counter(); ...; PERF.add("etapa", t0, nbytes)
+    """
+    TRACE_EVENTS = 50_000
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stats = {}      # etapa -> LatencyStats
+        self.nbytes = {}     # etapa -> bytes somados
+        self.trace = deque(maxlen=self.TRACE_EVENTS)  # (etapa, início, fim, thread, bytes)
+        self.threads = {}    # id da thread -> nome
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, t0: float, nbytes: int = 0, blocking: bool = True):
+        """Registra a etapa iniciada em t0 (perf_counter). blocking=False: correu em segundo plano (não é travamento)."""
+        end = time.perf_counter()
+        thread = threading.current_thread()
+        ms = (end - t0) * 1000
+        with self._lock:
+            self.stats.setdefault(stage, LatencyStats()).add(ms, True)
+            self.nbytes[stage] = self.nbytes.get(stage, 0) + nbytes
+            self.trace.append((stage, t0, end, thread.ident, nbytes))
+            self.threads.setdefault(thread.ident, thread.name)
+        if blocking and ms > PERF_SLOW_MS and thread is threading.main_thread():
+            logger.info(f"Etapa lenta: {stage} {ms:.0f} ms ({nbytes} bytes)")
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {stage: dict(stats.summary(), mb=self.nbytes[stage] / 1e6)
+                    for stage, stats in self.stats.items()}
+
+    def export_trace(self, path: str) -> int:
+        """Grava os eventos guardados (JSON do Chrome trace). Devolve quantos eventos."""
+        with self._lock:
+            events = list(self.trace)
+            threads = dict(self.threads)
+        pid = os.getpid()
+        out = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+               for tid, name in threads.items()]
+        out.extend({"name": stage, "cat": "pdf_editor", "ph": "X", "pid": pid, "tid": tid,
+                    "ts": round((t0 - self.started) * 1e6, 1), "dur": round((end - t0) * 1e6, 1),
+                    "args": {"bytes": nbytes}}
+                   for stage, t0, end, tid, nbytes in events)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": out, "displayTimeUnit": "ms"}, f)
+        os.replace(tmp, path)
+        return len(events)
+
+
+PERF = PerfRecorder()
+# ====================================================
+
+
+# ================== CACHE DE RENDERIZAÇÃO ==================
+class RenderCache:
+    """
+    Cache LRU de bitmaps de página já convertidos para o Tk.
+    - chave: (página, zoom, revisão do documento, revisão da página)
+    - limitado por um orçamento em bytes (pixels descomprimidos)
+    - ao passar do orçamento, descarta os itens usados há mais tempo
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._items = OrderedDict()  # chave -> (valor, nbytes)
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, value, nbytes: int):
+        if nbytes > self.max_bytes:
+            # maior que o orçamento inteiro: não vale a pena guardar
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.used_bytes -= old[1]
+        self._items[key] = (value, nbytes)
+        self.used_bytes += nbytes
+        while self.used_bytes > self.max_bytes:
+            _, (_, freed) = self._items.popitem(last=False)
+            self.used_bytes -= freed
+
+    def invalidate_page(self, page: int):
+        """Remove todos os bitmaps de uma página (qualquer zoom/revisão)."""
+        for key in [k for k in self._items if k[0] == page]:
+            self.used_bytes -= self._items.pop(key)[1]
+
+    def clear(self):
+        self._items.clear()
+        self.used_bytes = 0
+
+
+def file_fingerprint(path: str, samples: int = 16, window: int = 64 * 1024) -> str:
+    """
+    Identidade barata do arquivo: tamanho + data de modificação (ns) + 'samples' janelas
+    espalhadas, incluindo início e fim. Uma edição do mesmo tamanho que não toque as amostras
+    ainda muda a data; e abrir um arquivo de vários GB continua custando ~1 MB de leitura
+    (a primeira página sai do cache em disco sem ler o arquivo inteiro).
+    """
+    st = os.stat(path)
+    h = hashlib.sha1(f"{st.st_size}|{st.st_mtime_ns}".encode())
+    with open(path, "rb") as f:
+        for i in range(samples):
+            f.seek(max(0, (st.st_size - window) * i // (samples - 1)))
+            h.update(f.read(window))
+    return h.hexdigest()[:20]
+
+
+class DiskRenderCache:
+    """
+    Bitmaps de página/miniatura (PPM) em disco, reaproveitados entre sessões.
+    - nome do arquivo: hash do conteúdo do PDF + página + zoom (só páginas iguais ao arquivo)
+    - o Tk lê o PPM direto do arquivo (PhotoImage(file=...)): os pixels não passam pelo Python
+    - limitado em bytes; ao passar do limite apaga os usados há mais tempo (mtime = último uso)
+    - gravação, 'touch' e remoção acontecem numa thread própria para não travar a interface;
+      a listagem inicial da pasta também (até ela terminar, tudo é falta de cache)
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # nome -> tamanho, do usado há mais tempo para o mais recente
+        self.used_bytes = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._writer, name="disk-render-cache", daemon=True)
+        self._thread.start()
+
+    def get(self, name: str):
+        """Caminho do arquivo se ele está no cache (marca como usado), senão None."""
+        with self._lock:
+            if name not in self._files:
+                return None
+            self._files.move_to_end(name)
+        self._queue.put(("touch", name, None))
+        return os.path.join(self.directory, name)
+
+    def has(self, name: str) -> bool:
+        with self._lock:
+            return name in self._files
+
+    def put(self, name: str, data: bytes):
+        if len(data) <= self.max_bytes and not self.has(name):
+            self._queue.put(("write", name, data))
+
+    def close(self, timeout: float = 2.0):
+        """Termina as gravações pendentes (até 'timeout' segundos)."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _scan(self):
+        try:
+            entries = [(e.stat().st_mtime, e.name, e.stat().st_size) for e in os.scandir(self.directory)
+                       if e.is_file() and e.name.endswith(".ppm")]
+        except OSError as e:
+            logger.warning(f"Cache em disco: falha ao listar {self.directory}: {e}")
+            return
+        with self._lock:
+            for _, name, size in sorted(entries):
+                self._files[name] = size
+            self.used_bytes = sum(self._files.values())
+
+    def _writer(self):
+        self._scan()
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            op, name, data = job
+            path = os.path.join(self.directory, name)
+            try:
+                if op == "touch":
+                    os.utime(path)
+                    continue
+                tmp = path + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+                with self._lock:
+                    self.used_bytes += len(data) - self._files.pop(name, 0)
+                    self._files[name] = len(data)
+                    evict = []
+                    while self.used_bytes > self.max_bytes and len(self._files) > 1:
+                        old, size = self._files.popitem(last=False)
+                        self.used_bytes -= size
+                        evict.append(old)
+                for old in evict:
+                    os.remove(os.path.join(self.directory, old))
+            except OSError as e:
+                logger.warning(f"Cache em disco: falha em {op} {name}: {e}")
+
+
+# ================== CONVERSÃO PIXMAP -> TK ==================
+# "ppm": MuPDF gera PPM e o próprio Tk decodifica (sem passar pelo PIL)
+# "pil": caminho antigo (samples -> Image.frombytes -> ImageTk.PhotoImage), para comparação
+PIXMAP_PIPELINE = os.getenv("PDF_EDITOR_PIPELINE", "ppm")
+
+
+def pixmap_to_frame(pix, pipeline: str = PIXMAP_PIPELINE):
+    """Empacota o pixmap no formato que o Tk vai consumir: (formato, largura, altura, dados)."""
+    if pipeline == "ppm" and pix.alpha == 0:
+        t0 = time.perf_counter()
+        data = pix.tobytes("ppm")
+        PERF.add("ppm", t0, len(data))
+        return "ppm", pix.width, pix.height, data
+    return ("RGB" if pix.alpha == 0 else "RGBA"), pix.width, pix.height, pix.samples
+
+
+def frame_to_photo(frame):
+    """Converte o frame em imagem do Tk (precisa rodar na thread do Tk)."""
+    fmt, width, height, data = frame
+    t0 = time.perf_counter()
+    if fmt == "ppm":
+        photo = tk.PhotoImage(data=data, format="PPM")
+    else:
+        photo = ImageTk.PhotoImage(Image.frombytes(fmt, (width, height), data))
+    PERF.add("photo", t0, len(data))
+    return photo
+
+
+def frame_nbytes(frame) -> int:
+    """Bytes de pixels que a imagem ocupa depois de convertida (para o orçamento do cache)."""
+    fmt, width, height, _ = frame
+    return width * height * (4 if fmt == "RGBA" else 3)
+
+
+def displaylist_words(dl):
+    """Equivalente a page.get_text("words"), mas extraído do DisplayList já interpretado."""
+    t0 = time.perf_counter()
+    tp = dl.get_textpage(flags=fitz.TEXTFLAGS_WORDS)
+    if not isinstance(tp, fitz.TextPage):
+        # PyMuPDF recente devolve o objeto cru do MuPDF
+        tp = fitz.TextPage(tp)
+    words = tp.extractWORDS()
+    PERF.add("words", t0)
+    return words
+
+
+# ================== ÍNDICE ESPACIAL DE PALAVRAS ==================
+class WordIndex:
+    """Grade uniforme sobre as caixas das palavras de uma página.
+
+    Cada célula guarda os índices das palavras que a tocam, então consultas por ponto
+    (clique/hover) e por retângulo (seleção) só olham as palavras das células envolvidas.
+    """
+    CELL = 24.0  # lado da célula em pontos PDF (~ altura de uma linha de texto comum)
+
+    def __init__(self, words):
+        self.words = words
+        self.grid = {}  # (gx, gy) -> [índices em words]
+        c = self.CELL
+        for i, w in enumerate(words):
+            for gx in range(int(w[0] // c), int(w[2] // c) + 1):
+                for gy in range(int(w[1] // c), int(w[3] // c) + 1):
+                    self.grid.setdefault((gx, gy), []).append(i)
+
+    def at(self, x: float, y: float):
+        """Palavra sob o ponto (coords PDF) ou None."""
+        c = self.CELL
+        for i in self.grid.get((int(x // c), int(y // c)), ()):
+            x0, y0, x1, y1 = self.words[i][:4]
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                return self.words[i]
+        return None
+
+    def in_rect(self, x0: float, y0: float, x1: float, y1: float):
+        """Palavras que tocam o retângulo (coords PDF), na ordem de leitura da página."""
+        c = self.CELL
+        hits = set()
+        for gx in range(int(x0 // c), int(x1 // c) + 1):
+            for gy in range(int(y0 // c), int(y1 // c) + 1):
+                for i in self.grid.get((gx, gy), ()):
+                    w = self.words[i]
+                    if w[0] <= x1 and w[2] >= x0 and w[1] <= y1 and w[3] >= y0:
+                        hits.add(i)
+        return [self.words[i] for i in sorted(hits)]
+
+
+# ================== OBJETOS SOBREPOSTOS ==================
+class OverlayObject:
+    """Texto sobreposto (coords PDF, topo do texto); ainda não gravado no PDF."""
+    __slots__ = ("oid", "page", "x", "y", "text", "size")
+
+    def __init__(self, oid: int, page: int, x: float, y: float, text: str, size: int):
+        self.oid = oid
+        self.page = page
+        self.x = x
+        self.y = y
+        self.text = text
+        self.size = size
+
+    def state(self):
+        return (self.oid, self.page, self.x, self.y, self.text, self.size)
+
+
+class OverlayStore:
+    """
+    Objetos sobrepostos separados por página, com mapas id do objeto <-> id do item no canvas.
+    Achar o objeto clicado, percorrer uma página e tirar um snapshot não dependem de varrer uma lista.
+    """
+
+    def __init__(self):
+        self._objects = {}     # oid -> OverlayObject (na ordem de criação)
+        self._by_page = {}     # página -> {oid: OverlayObject}
+        self._cid_to_oid = {}  # id no canvas -> oid
+        self._oid_to_cid = {}  # oid -> id no canvas
+        self._next_oid = 1
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __iter__(self):
+        return iter(self._objects.values())
+
+    def add(self, page: int, x: float, y: float, text: str, size: int) -> OverlayObject:
+        obj = OverlayObject(self._next_oid, page, x, y, text, size)
+        self._next_oid += 1
+        self._objects[obj.oid] = obj
+        self._by_page.setdefault(page, {})[obj.oid] = obj
+        return obj
+
+    def get(self, oid: int):
+        return self._objects.get(oid)
+
+    def remove(self, oid: int):
+        obj = self._objects.pop(oid)
+        bucket = self._by_page[obj.page]
+        del bucket[oid]
+        if not bucket:
+            del self._by_page[obj.page]
+        cid = self._oid_to_cid.pop(oid, None)
+        if cid is not None:
+            del self._cid_to_oid[cid]
+        return obj
+
+    def on_page(self, page: int):
+        return self._by_page.get(page, {}).values()
+
+    def pages(self):
+        return self._by_page.keys()
+
+    # ---------- itens do canvas ----------
+    def bind(self, oid: int, cid: int):
+        self._oid_to_cid[oid] = cid
+        self._cid_to_oid[cid] = oid
+
+    def canvas_id(self, oid: int):
+        return self._oid_to_cid.get(oid)
+
+    def by_canvas_id(self, cid: int):
+        oid = self._cid_to_oid.get(cid)
+        return None if oid is None else self._objects[oid]
+
+    def unbind_all(self):
+        self._cid_to_oid.clear()
+        self._oid_to_cid.clear()
+
+    # ---------- histórico ----------
+    def put(self, state) -> OverlayObject:
+        """Recria (ou sobrescreve) um objeto a partir de OverlayObject.state(), mantendo o id."""
+        oid, page, x, y, text, size = state
+        old = self._objects.get(oid)
+        if old is not None and old.page != page:
+            del self._by_page[old.page][oid]
+            if not self._by_page[old.page]:
+                del self._by_page[old.page]
+        obj = OverlayObject(oid, page, x, y, text, size)
+        self._objects[oid] = obj
+        self._by_page.setdefault(page, {})[oid] = obj
+        self._next_oid = max(self._next_oid, oid + 1)
+        return obj
+
+    def clear(self):
+        self._objects.clear()
+        self._by_page.clear()
+        self.unbind_all()
+
+
+# ================== HISTÓRICO (DESFAZER/REFAZER) ==================
+def resources_holder(doc, xref: int) -> int:
+    """Objeto que define o /Resources efetivo da página: ela mesma ou o nó /Pages mais próximo que o tem."""
+    holder = xref
+    for _ in range(64):  # proteção contra /Parent em ciclo
+        if doc.xref_get_key(holder, "Resources")[0] != "null":
+            return holder
+        kind, parent = doc.xref_get_key(holder, "Parent")
+        if kind != "xref":
+            break
+        holder = int(parent.split()[0])
+    return xref
+
+
+def capture_page_state(doc, pno: int):
+    """
+    Estado mínimo de uma página para desfazer/refazer: o objeto da página, Resources e Font
+    (quando são objetos indiretos) e os streams de conteúdo. Imagens e fontes embutidas não
+    mudam numa edição, então não entram — o delta não cresce com o tamanho do documento.
+    Resources herdado de um nó /Pages: a fonte nova entra no dicionário do nó, então ele
+    (ou o Resources/Font indireto dele) também faz parte do estado.
+    """
+    t0 = time.perf_counter()
+    page = doc[pno]
+    xrefs = [page.xref]
+    holder = resources_holder(doc, page.xref)
+    if holder != page.xref:
+        xrefs.append(holder)
+    for key in ("Resources", "Resources/Font"):
+        kind, value = doc.xref_get_key(holder, key)
+        if kind == "xref":
+            xrefs.append(int(value.split()[0]))
+    objects = tuple((xref, doc.xref_object(xref, compressed=True)) for xref in xrefs)
+    streams = tuple((xref, doc.xref_stream(xref)) for xref in page.get_contents())
+    PERF.add("capture", t0, sum(len(data) for _, data in streams))
+    return objects, streams
+
+
+def restore_page_state(doc, state):
+    t0 = time.perf_counter()
+    objects, streams = state
+    for xref, source in objects:
+        doc.update_object(xref, source)
+    for xref, data in streams:
+        doc.update_stream(xref, data)
+    PERF.add("restore", t0, sum(len(data) for _, data in streams))
+
+
+def ops_nbytes(value) -> int:
+    """Tamanho aproximado (bytes) de uma operação do histórico."""
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return 8 + sum(ops_nbytes(v) for v in value)
+    return 8
+
+
+class HistoryEntry:
+    __slots__ = ("label", "ops", "nbytes", "path")
+
+    def __init__(self, label: str, ops):
+        self.label = label
+        self.ops = ops      # None enquanto estiver em disco
+        self.nbytes = ops_nbytes(ops)
+        self.path = None
+
+
+class EditHistory:
+    """
+    Pilhas de desfazer/refazer com comandos (deltas de página e operações inversas de objetos),
+    não cópias do documento. Acima de 'max_bytes' em memória, as entradas mais antigas vão
+    comprimidas para disco (ou são descartadas, se 'spill' estiver desligado).
+
+    Operações (só tipos básicos, serializáveis com marshal):
+      ("page", página, estado_antes, estado_depois)
+      ("obj_add", estado) / ("obj_del", estado)
+      ("obj_set", estado_antes, estado_depois)
+    """
+
+    def __init__(self, max_bytes: int, spill: bool = True):
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self.undo_stack = []
+        self.redo_stack = []
+        self._mem_bytes = 0
+        self._spill_dir = None
+
+    def push(self, label: str, ops):
+        for entry in self.redo_stack:
+            self._drop(entry)
+        self.redo_stack.clear()
+        self._add(self.undo_stack, HistoryEntry(label, list(ops)))
+
+    def undo(self):
+        """Tira a última entrada (já carregada do disco, se preciso) e a deixa disponível para refazer."""
+        return self._move(self.undo_stack, self.redo_stack)
+
+    def redo(self):
+        return self._move(self.redo_stack, self.undo_stack)
+
+    def clear(self):
+        for entry in self.undo_stack + self.redo_stack:
+            self._drop(entry)
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+    def close(self):
+        self.clear()
+        if self._spill_dir:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+
+    def _move(self, source, target):
+        if not source:
+            return None
+        entry = source.pop()
+        self._load(entry)
+        target.append(entry)
+        self._enforce_limit()
+        return entry
+
+    def _add(self, stack, entry):
+        stack.append(entry)
+        self._mem_bytes += entry.nbytes
+        self._enforce_limit()
+
+    def _enforce_limit(self):
+        # mais antigas primeiro: fundo da pilha de desfazer, depois o fundo da de refazer
+        for stack in (self.undo_stack, self.redo_stack):
+            for entry in list(stack[:-1]):
+                if self._mem_bytes <= self.max_bytes:
+                    return
+                if entry.ops is None:
+                    continue
+                if self.spill:
+                    self._spill(entry)
+                else:
+                    stack.remove(entry)
+                    self._drop(entry)
+
+    def _spill(self, entry):
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="pdfeditor_undo_")
+        fd, entry.path = tempfile.mkstemp(suffix=".undo", dir=self._spill_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(zlib.compress(marshal.dumps(entry.ops), 1))
+        entry.ops = None
+        self._mem_bytes -= entry.nbytes
+        logger.debug(f"Histórico: '{entry.label}' ({entry.nbytes} bytes) movido para disco")
+
+    def _load(self, entry):
+        if entry.ops is not None:
+            return
+        with open(entry.path, "rb") as f:
+            entry.ops = marshal.loads(zlib.decompress(f.read()))
+        os.remove(entry.path)
+        entry.path = None
+        self._mem_bytes += entry.nbytes
+
+    def _drop(self, entry):
+        if entry.ops is not None:
+            self._mem_bytes -= entry.nbytes
+        elif entry.path:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def bake_overlay(page, objs, baseline_factor: float):
+    """Grava os objetos sobrepostos de uma página no PDF (um único Shape, um só trecho de conteúdo)."""
+    shape = page.new_shape()
+    for obj in objs:
+        shape.insert_text((obj.x, obj.y + obj.size * baseline_factor), obj.text,
+                          fontsize=obj.size, fontname="helv", color=(0, 0, 0))
+    shape.commit()
+
+
+# ================== DIÁRIO DE EDIÇÕES (RECUPERAÇÃO) ==================
+class EditJournal:
+    """
+    Diário append-only das edições da sessão: um registro JSON por linha, só com a intenção
+    da edição (página, retângulo, texto), nunca com os bytes das páginas.
+    append() só enfileira; uma thread grava em lotes e faz um fsync por lote.
+    Num fechamento normal o arquivo é apagado; se sobrar, a sessão terminou numa queda.
+    Enquanto a sessão está viva o arquivo fica travado (o sistema solta a trava se o processo
+    cair): outra instância aberta ao mesmo tempo não o trata como sobra.
+    """
+    BATCH_WINDOW = 0.25  # segundos aguardando mais registros antes de gravar o lote
+
+    def __init__(self, path: str, header: dict):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        if not self._lock(self._file):
+            self._file.close()
+            raise OSError(f"diário em uso por outro processo: {path}")
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._writer, name="edit-journal", daemon=True)
+        self._thread.start()
+        self.append(dict(header, op="open"))
+
+    def append(self, record: dict):
+        record = dict(record, t=round(time.time(), 3))
+        self._queue.put(json.dumps(record, ensure_ascii=False))
+
+    def close(self, delete: bool = False):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._unlock(self._file)
+        self._file.close()
+        if delete:
+            self.remove(self.path)
+
+    @staticmethod
+    def remove(path: str):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Não foi possível apagar o diário {path}: {e}")
+
+    @staticmethod
+    def _lock(f) -> bool:
+        """Trava exclusiva sem esperar (1º byte no Windows, arquivo inteiro no resto). False se outro a tem."""
+        try:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _unlock(f):
+        try:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        except OSError:
+            pass
+
+    def _writer(self):
+        stop = False
+        while not stop:
+            lines = [self._queue.get()]
+            if lines[0] is not None:
+                time.sleep(self.BATCH_WINDOW)
+            while True:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in lines
+            lines = [line for line in lines if line is not None]
+            if not lines:
+                continue
+            try:
+                self._file.write("\n".join(lines) + "\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                logger.error(f"Falha ao gravar o diário de edições: {e}")
+
+    @staticmethod
+    def leftovers():
+        """Diários deixados por sessões que não fecharam normalmente (mais recente primeiro).
+        Os travados pertencem a uma instância ainda aberta e ficam de fora."""
+        if not os.path.isdir(JOURNAL_DIR):
+            return []
+        paths = []
+        for name in sorted((n for n in os.listdir(JOURNAL_DIR) if n.endswith(".jsonl")), reverse=True):
+            path = os.path.join(JOURNAL_DIR, name)
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    if EditJournal._lock(f):
+                        EditJournal._unlock(f)
+                        paths.append(path)
+            except OSError:
+                continue
+        return paths
+
+    @staticmethod
+    def load(path: str):
+        """Registros do diário; uma última linha cortada pela queda é ignorada."""
+        records = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+        return records
+
+    @staticmethod
+    def pending_edits(records):
+        """(caminho, hash esperado do arquivo, edições a reaplicar) ou None se não há o que recuperar.
+
+        Um salvamento incremental concluído sobre o próprio arquivo já contém tudo o que veio
+        antes dele: a recuperação parte dali, conferindo o hash do arquivo salvo.
+        """
+        if not records or records[0].get("op") != "open":
+            return None
+        fingerprint = records[0].get("fingerprint")
+        start = 1
+        save_starts = {}
+        for i, rec in enumerate(records):
+            if rec["op"] == "save_start":
+                save_starts[rec["id"]] = i
+            elif rec["op"] == "saved" and rec["id"] in save_starts:
+                fingerprint = rec["fingerprint"]
+                start = save_starts[rec["id"]] + 1
+        edits = [rec for rec in records[start:] if rec["op"] not in ("open", "save_start", "saved")]
+        if not edits:
+            return None
+        return records[0]["path"], fingerprint, edits
+
+
+# ================== SUBSTITUIÇÃO DE TEXTO ==================
+BASELINE_FACTOR = 0.8  # posição da linha de base em relação ao topo do texto (fração do tamanho da fonte)
+
+
+def replace_rects(page, replacements):
+    """Cobre cada retângulo de branco e escreve o texto novo no lugar (fonte proporcional à altura).
+
+    Tudo passa por um único Shape: a página ganha um só trecho de conteúdo, não um por ocorrência.
+    """
+    shape = page.new_shape()
+    for rect, _ in replacements:
+        shape.draw_rect(rect)
+    shape.finish(color=(1, 1, 1), fill=(1, 1, 1))
+    for rect, new_text in replacements:
+        fontsize = max(4, rect.height * 0.8)
+        shape.insert_text((rect.x0, rect.y0 + rect.height * 0.8), new_text,
+                          fontsize=fontsize, fontname="helv", color=(0, 0, 0))
+    shape.commit()
+
+
+def move_word(page, rect, text: str, px: float, py: float, baseline_factor: float = BASELINE_FACTOR):
+    """Apaga o retângulo da palavra e escreve 'text' em (px, py), com fonte proporcional à altura original."""
+    page.draw_rect(rect, color=(1, 1, 1), fill=(1, 1, 1))
+    fontsize = max(4, rect.height * 0.8)
+    page.insert_text((px, py + fontsize * baseline_factor), text, fontsize=int(fontsize), fontname="helv",
+                     color=(0, 0, 0))
+    return int(fontsize)
+
+
+def compile_replacement(pattern: str, replacement: str, use_regex: bool = False, match_case: bool = True):
+    """(regex, repl) para find_replacements; levanta re.error se o padrão for inválido."""
+    regex = re.compile(pattern if use_regex else re.escape(pattern), 0 if match_case else re.IGNORECASE)
+    if use_regex:
+        return regex, lambda m: m.expand(replacement)
+    return regex, lambda m: replacement
+
+
+def find_replacements(words, regex, repl):
+    """Ocorrências de 'regex' numa página -> [(retângulo, texto novo)].
+
+    As palavras de cada linha são unidas com espaço, então uma ocorrência pode cobrir várias palavras;
+    o retângulo é a união delas e o texto novo preserva o que sobra dessas palavras fora da ocorrência.
+    'repl' recebe o Match e devolve o texto que entra no lugar.
+    """
+    lines = OrderedDict()
+    for w in words:
+        lines.setdefault(w[5:7], []).append(w)
+    out = []
+    for line in lines.values():
+        starts = []
+        text = ""
+        for w in line:
+            if text:
+                text += " "
+            starts.append(len(text))
+            text += w[4]
+        spans = []  # [primeira palavra, última palavra, [ocorrências]]
+        for m in regex.finditer(text):
+            if m.end() == m.start():
+                continue
+            i = bisect_right(starts, m.start()) - 1
+            j = bisect_right(starts, m.end() - 1) - 1
+            if spans and i <= spans[-1][1]:
+                spans[-1][1] = max(j, spans[-1][1])
+                spans[-1][2].append(m)
+            else:
+                spans.append([i, j, [m]])
+        for i, j, matches in spans:
+            pos = starts[i]
+            new_text = ""
+            for m in matches:
+                new_text += text[pos:m.start()] + repl(m)
+                pos = m.end()
+            new_text += text[pos:starts[j] + len(line[j][4])]
+            rect = fitz.Rect(line[i][:4])
+            for w in line[i + 1:j + 1]:
+                rect |= fitz.Rect(w[:4])
+            out.append((rect, new_text))
+    return out
+
+
+# ================== PRÉ-RENDERIZAÇÃO EM SEGUNDO PLANO ==================
+# Estado do processo worker: cada processo abre o seu próprio documento
+_worker_doc = None
+_worker_dlists = OrderedDict()  # página -> DisplayList (poucas, para trocas de zoom)
+
+
+def _worker_open(path):
+    global _worker_doc
+    _worker_doc = fitz.open(path)
+    _worker_dlists.clear()
+
+
+def _worker_render(pno, zoom, pipeline):
+    """Executa no processo worker: rasteriza a página e já devolve o frame pronto para o Tk."""
+    dl = _worker_dlists.pop(pno, None) or _worker_doc[pno].get_displaylist()
+    _worker_dlists[pno] = dl
+    while len(_worker_dlists) > 8:
+        _worker_dlists.popitem(last=False)
+    pix = dl.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    return pno, zoom, pixmap_to_frame(pix, pipeline)
+
+
+def thumb_zoom(rect, max_w: float, max_h: float) -> float:
+    """Zoom que faz a página caber na caixa da miniatura."""
+    return min(max_w / rect.width, max_h / rect.height)
+
+
+def _worker_thumb(pno, max_w, max_h, pipeline):
+    """Executa no processo worker: miniatura em baixa resolução (sem DisplayList, é renderizada uma vez só)."""
+    page = _worker_doc[pno]
+    zoom = thumb_zoom(page.rect, max_w, max_h)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    return "thumb", pno, pixmap_to_frame(pix, pipeline)
+
+
+class PageRenderWorker:
+    """
+    Processo auxiliar que renderiza páginas vizinhas fora da thread do Tk.
+    O worker abre o arquivo por conta própria, então só deve receber páginas
+    que ainda estão iguais ao arquivo em disco (sem edições).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ProcessPoolExecutor(max_workers=1,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_worker_open, initargs=(path,))
+        self.pending = {}  # (página, zoom) ou ("thumb", página) -> Future
+
+    def request(self, pno: int, zoom: float):
+        key = (pno, round(zoom, 4))
+        if key not in self.pending:
+            self.pending[key] = self._executor.submit(_worker_render, pno, zoom, PIXMAP_PIPELINE)
+
+    def request_thumb(self, pno: int, max_w: float, max_h: float):
+        key = ("thumb", pno)
+        if key not in self.pending:
+            self.pending[key] = self._executor.submit(_worker_thumb, pno, max_w, max_h, PIXMAP_PIPELINE)
+
+    def keep_only(self, keys, thumbs: bool = False):
+        """Cancela pedidos (de páginas ou de miniaturas) que ainda não começaram e não estão em 'keys'."""
+        for key, fut in list(self.pending.items()):
+            if (key[0] == "thumb") == thumbs and key not in keys and fut.cancel():
+                del self.pending[key]
+
+    def take(self, pno: int, zoom: float):
+        """Se a página já está sendo renderizada, espera por ela; senão cancela e devolve None."""
+        fut = self.pending.pop((pno, round(zoom, 4)), None)
+        if fut is None or fut.cancel():
+            return None
+        try:
+            return fut.result()
+        except Exception as e:
+            logger.warning(f"Pré-renderização falhou (pág. {pno+1}): {e}")
+            return None
+
+    def collect(self):
+        """Devolve os resultados já prontos, sem bloquear."""
+        results = []
+        for key, fut in list(self.pending.items()):
+            if not fut.done():
+                continue
+            del self.pending[key]
+            if fut.cancelled():
+                continue
+            try:
+                results.append(fut.result())
+            except Exception as e:
+                logger.warning(f"Pré-renderização falhou {key}: {e}")
+        return results
+
+    def shutdown(self):
+        self.pending.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ================== ÍNDICE DE BUSCA (DOCUMENTO INTEIRO) ==================
+def normalize_text(text: str) -> str:
+    """Texto comparável na busca: espaços/quebras colapsados e sem diferença de maiúsculas."""
+    return " ".join(text.split()).casefold()
+
+
+def words_text(words) -> str:
+    return normalize_text(" ".join(w[4] for w in words))
+
+
+def _worker_index(pnos):
+    """Executa no processo worker: texto normalizado de um lote de páginas."""
+    return [(pno, words_text(_worker_doc[pno].get_text("words"))) for pno in pnos]
+
+
+class SearchIndex:
+    """
+    Texto de todas as páginas, extraído em paralelo por processos que abrem o arquivo por conta própria.
+    Pode ser consultado enquanto ainda está sendo montado (só enxerga as páginas já indexadas).
+    Páginas editadas ficam em 'stale' e são refeitas no processo principal quando a busca precisa delas.
+    """
+    CHUNK = 8  # páginas por tarefa enviada aos workers
+
+    def __init__(self, path: str, page_count: int):
+        self.texts = [None] * page_count
+        self.stale = set()
+        self._started = time.perf_counter()
+        workers = max(1, min(4, (os.cpu_count() or 2) - 1))
+        self._executor = ProcessPoolExecutor(max_workers=workers,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_worker_open, initargs=(path,))
+        self.pending = {}  # Future -> páginas do lote
+        for i in range(0, page_count, self.CHUNK):
+            pnos = range(i, min(i + self.CHUNK, page_count))
+            self.pending[self._executor.submit(_worker_index, pnos)] = pnos
+
+    @property
+    def complete(self) -> bool:
+        return not self.pending
+
+    @property
+    def indexed(self) -> int:
+        return sum(t is not None for t in self.texts)
+
+    def collect(self):
+        """Incorpora os lotes já prontos, sem bloquear; encerra os workers ao terminar."""
+        for fut in [f for f in self.pending if f.done()]:
+            pnos = self.pending.pop(fut)
+            try:
+                for pno, text in fut.result():
+                    # página editada nesse meio tempo: o texto do disco já não vale
+                    if self.texts[pno] is None and pno not in self.stale:
+                        self.texts[pno] = text
+            except Exception as e:
+                # o lote é refeito no processo principal quando a busca precisar dele
+                logger.warning(f"Indexação de busca falhou (págs. {pnos.start+1}-{pnos.stop}): {e}")
+                self.stale.update(pnos)
+        if not self.pending:
+            self._executor.shutdown(wait=False)
+            logger.info(f"Índice de busca pronto: {len(self.texts)} páginas em "
+                        f"{time.perf_counter() - self._started:.2f}s")
+
+    def invalidate(self, pno: int):
+        self.texts[pno] = None
+        self.stale.add(pno)
+
+    def update(self, pno: int, text: str):
+        self.texts[pno] = text
+        self.stale.discard(pno)
+
+    def find(self, query: str, start: int):
+        """Primeira página (a partir de 'start', dando a volta) cujo texto contém 'query'."""
+        n = len(self.texts)
+        for i in range(n):
+            pno = (start + i) % n
+            text = self.texts[pno]
+            if text is not None and query in text:
+                return pno
+        return None
+
+    def shutdown(self):
+        self.pending.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+# ====================================================
+
+
+# ================== ABERTURA EM SEGUNDO PLANO ==================
+def is_network_path(path: str) -> bool:
+    """Caminho UNC (\\\\servidor\\pasta) ou unidade de rede mapeada (Windows)."""
+    path = os.path.abspath(path)
+    if path.startswith(("\\\\", "//")):
+        return True
+    if sys.platform == "win32":
+        import ctypes
+        drive = os.path.splitdrive(path)[0]
+        if drive:
+            return ctypes.windll.kernel32.GetDriveTypeW(drive + "\\") == 4  # DRIVE_REMOTE
+    return False
+
+
+def pdf_tail_ok(path: str) -> bool:
+    """Fim do arquivo com startxref e %%EOF; sem eles o MuPDF reconstrói a xref lendo o arquivo inteiro."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.seek(max(0, size - 2048))
+        tail = f.read()
+    return b"startxref" in tail and b"%%EOF" in tail
+
+
+def _repair_pdf(source, target):
+    """Executa num processo separado: abre (reconstruindo a xref) e grava uma cópia consistente."""
+    doc = fitz.open(source)
+    doc.save(target)
+    doc.close()
+
+
+class OpenJob:
+    """
+    Preparação da abertura fora da thread do Tk, acompanhada com poll() (como SaveJob):
+      1) (arquivo em rede) cópia local em blocos, com progresso e cancelamento
+      2) hash do arquivo e conferência do fim do arquivo
+      3) (arquivo danificado) reparo num processo separado, que grava uma cópia consistente
+    O fitz.open() em si fica para a thread do Tk: com a xref íntegra ele só lê o fim do arquivo.
+    No fim, .work_path é o arquivo que o editor e os workers devem abrir.
+    """
+    COPY_CHUNK = 8 * 1024 * 1024  # bytes por leitura na cópia local
+
+    def __init__(self, path: str):
+        self.path = path
+        self.work_path = path
+        self.temp_dir = None     # cópia local/reparada; apagada quando o documento é fechado
+        self.fingerprint = None
+        self.damaged = False
+        self.copied = False
+        self.status = "Abrindo..."
+        self.progress = None     # fração 0..1, quando conhecida
+        self.error = None
+        self.started = time.perf_counter()
+        self._cancel = threading.Event()
+        self._repair = None
+        self._repair_target = None
+        self._thread = threading.Thread(target=self._prepare, name="open-pdf", daemon=True)
+        self._thread.start()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+        if self._repair is not None and self._repair.is_alive():
+            self._repair.terminate()
+
+    def discard(self):
+        """Apaga a pasta temporária (abertura cancelada/falhou ou documento fechado)."""
+        if self.temp_dir:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
+
+    def _temp_path(self, prefix: str) -> str:
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.mkdtemp(prefix="pdfeditor_open_")
+        return os.path.join(self.temp_dir, prefix + os.path.basename(self.path))
+
+    def _prepare(self):
+        try:
+            # do arquivo escolhido (não da cópia local, que tem outra data): o mesmo a cada abertura
+            self.status = "Conferindo arquivo..."
+            self.fingerprint = file_fingerprint(self.path)
+            if is_network_path(self.path):
+                self._copy_local()
+            if self.cancelled:
+                return
+            self.damaged = not pdf_tail_ok(self.work_path)
+        except Exception as e:
+            self.error = e
+
+    def _copy_local(self):
+        """Lê o arquivo da rede uma vez, sequencialmente; o MuPDF passa a fazer acessos aleatórios no disco local."""
+        total = os.path.getsize(self.path)
+        target = self._temp_path("")
+        done = 0
+        with open(self.path, "rb") as src, open(target, "wb") as dst:
+            while not self.cancelled:
+                chunk = src.read(self.COPY_CHUNK)
+                if not chunk:
+                    break
+                dst.write(chunk)
+                done += len(chunk)
+                self.progress = done / max(total, 1)
+                self.status = f"Copiando da rede: {done / 1e6:.0f} de {total / 1e6:.0f} MB"
+        self.work_path = target
+        self.copied = True
+        self.progress = None
+
+    def poll(self) -> bool:
+        """True quando terminou (com sucesso, erro ou cancelada)."""
+        if self._thread.is_alive():
+            return False
+        if self.error is not None or self.cancelled or not self.damaged:
+            return True
+        if self._repair is None:
+            self.status = "Reparando arquivo danificado..."
+            self._repair_target = self._temp_path("reparado_")
+            self._repair = multiprocessing.get_context("spawn").Process(
+                target=_repair_pdf, args=(self.work_path, self._repair_target), daemon=True)
+            self._repair.start()
+            return False
+        if self._repair.is_alive():
+            return False
+        if self._repair.exitcode != 0:
+            self.error = RuntimeError(f"não foi possível reparar o arquivo (código {self._repair.exitcode})")
+        else:
+            self.work_path = self._repair_target
+        return True
+# ====================================================
+
+
+# ================== SALVAMENTO EM SEGUNDO PLANO ==================
+# Perfis de salvamento: opções do doc.save() + redução opcional de imagens acima de 'image_dpi'
+SAVE_PROFILES = {
+    "fast": {"label": "Rápido", "save": {}, "image_dpi": None},
+    "balanced": {"label": "Equilibrado", "save": {"garbage": 3, "deflate": True, "use_objstms": 1},
+                 "image_dpi": 200, "jpeg_quality": 85},
+    "smallest": {"label": "Menor tamanho", "save": {"garbage": 4, "deflate": True, "deflate_images": True,
+                                                  "deflate_fonts": True, "clean": True, "use_objstms": 1},
+                 "image_dpi": 150, "jpeg_quality": 70},
+}
+
+
+def _scan_images(pnos, doc=None):
+    """Executa no worker: menor DPI efetivo com que cada imagem aparece nas páginas do lote."""
+    doc = doc or _worker_doc
+    found = {}
+    for pno in pnos:
+        for info in doc[pno].get_image_info(xrefs=True):
+            bbox = fitz.Rect(info["bbox"])
+            if not info["xref"] or bbox.is_empty:
+                continue
+            dpi = min(info["width"] * 72 / bbox.width, info["height"] * 72 / bbox.height)
+            found[info["xref"]] = min(found.get(info["xref"], dpi), dpi)
+    return found
+
+
+def _recompress_image(xref, scale, quality, doc=None):
+    """
+    Executa no worker: reduz a imagem por 'scale' e recomprime em JPEG.
+    Devolve (xref, dados, largura, altura, espaço de cor) ou None se não compensa / não é seguro
+    (máscaras, transparência, imagens de 1 bit).
+    """
+    doc = doc or _worker_doc
+    for key in ("SMask", "Mask", "ImageMask"):
+        if doc.xref_get_key(xref, key)[0] != "null":
+            return None
+    if doc.xref_get_key(xref, "BitsPerComponent")[1] == "1":
+        return None
+    pix = fitz.Pixmap(doc, xref)
+    if pix.alpha:
+        return None
+    if pix.colorspace is None or pix.colorspace.n not in (1, 3):
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    mode = "L" if pix.n == 1 else "RGB"
+    img = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+    width, height = max(1, int(pix.width * scale)), max(1, int(pix.height * scale))
+    if (width, height) != img.size:
+        img = img.resize((width, height), Image.LANCZOS)
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=quality, optimize=True)
+    data = out.getvalue()
+    if len(data) >= len(doc.xref_stream_raw(xref)) * 0.9:
+        return None
+    return xref, data, width, height, "DeviceGray" if mode == "L" else "DeviceRGB"
+
+
+def _set_image(doc, xref, data, width, height, colorspace):
+    """Troca a imagem 'xref' pelo JPEG recomprimido (update_stream sem compressão apaga /Filter).
+
+    Os pixels vindos do fitz.Pixmap já estão decodificados (/Decode aplicado, CMYK/ICC convertidos
+    para Gray/RGB): /Decode e /Intent antigos inverteriam ou distorceriam as cores, então saem.
+    """
+    doc.update_stream(xref, data, compress=0)
+    for key, value in (("Width", str(width)), ("Height", str(height)), ("ColorSpace", f"/{colorspace}"),
+                       ("BitsPerComponent", "8"), ("Filter", "/DCTDecode"), ("DecodeParms", "null"),
+                       ("Decode", "null"), ("Intent", "null")):
+        doc.xref_set_key(xref, key, value)
+
+
+def downsample_images(doc, settings) -> int:
+    """Etapa de imagens do perfil feita no próprio processo (lote, EditorSession.save). Devolve quantas mudaram."""
+    target_dpi = settings["image_dpi"]
+    if not target_dpi:
+        return 0
+    count = 0
+    for xref, dpi in _scan_images(range(len(doc)), doc).items():
+        image = _recompress_image(xref, target_dpi / dpi, settings["jpeg_quality"], doc) \
+            if dpi > target_dpi * 1.1 else None
+        if image:
+            _set_image(doc, *image)
+            count += 1
+    return count
+
+
+def _save_snapshot(source, target, xref_len, objects, streams, incremental, options=None, images=()):
+    """
+    Executa no processo de salvamento: abre o arquivo de origem, aplica os objetos/streams
+    alterados (snapshot tirado na thread do Tk) e as imagens recomprimidas, e grava.
+    Devolve (bytes gravados, segundos, hash do arquivo gravado).
+    """
+    t0 = time.perf_counter()
+    size_before = os.path.getsize(target) if incremental else 0
+    doc = fitz.open(source)
+    while doc.xref_length() < xref_len:
+        doc.get_new_xref()
+    for xref, source_text in objects:
+        doc.update_object(xref, source_text)
+    for xref, data in streams:
+        doc.update_stream(xref, data)
+    for image in images:
+        _set_image(doc, *image)
+    if incremental:
+        # só acrescenta ao fim do arquivo os objetos alterados
+        doc.save(target, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+    else:
+        doc.save(target, **(options or {}))
+    doc.close()
+    return os.path.getsize(target) - size_before, time.perf_counter() - t0, file_fingerprint(target)
+
+
+class SaveJob:
+    """
+    Salvamento em etapas, acompanhado pela thread do Tk com poll():
+      1) (perfis com 'image_dpi') varre as páginas em paralelo atrás de imagens acima do DPI do perfil
+      2) (idem) reduz e recomprime essas imagens em paralelo (cada worker abre o arquivo de origem)
+      3) aplica snapshot + imagens e grava no processo de salvamento ('writer')
+    """
+    SCAN_CHUNK = 16  # páginas por tarefa de varredura
+
+    def __init__(self, writer, source: str, target: str, page_count: int, snapshot, profile: str,
+                 incremental: bool):
+        self.writer = writer
+        self.source = source
+        self.target = target
+        self.snapshot = snapshot
+        self.profile = SAVE_PROFILES[profile]
+        self.incremental = incremental
+        self.started = time.perf_counter()
+        self.size_before = os.path.getsize(source)
+        self.stage = None
+        self.done_count = 0
+        self.result = None  # (bytes gravados, segundos de gravação, hash do arquivo gravado)
+        self.error = None
+        self.images = []
+        self._pool = None
+        self._futures = []
+        if self.profile["image_dpi"] and not incremental:
+            workers = max(1, min(4, (os.cpu_count() or 2) - 1))
+            self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_worker_open, initargs=(source,))
+            self._futures = [self._pool.submit(_scan_images, range(i, min(i + self.SCAN_CHUNK, page_count)))
+                             for i in range(0, page_count, self.SCAN_CHUNK)]
+            self.stage = "scan"
+        else:
+            self._write()
+
+    @property
+    def status(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        if self.stage == "scan":
+            return f"Analisando imagens {self.done_count}/{len(self._futures)}... {elapsed:.1f}s"
+        if self.stage == "images":
+            return f"Recomprimindo imagens {self.done_count}/{len(self._futures)}... {elapsed:.1f}s"
+        return f"Gravando... {elapsed:.1f}s"
+
+    def poll(self) -> bool:
+        """Avança as etapas sem bloquear; True quando terminou (ver 'result'/'error')."""
+        if self.error is not None:
+            return True
+        self.done_count = sum(f.done() for f in self._futures)
+        if self.done_count < len(self._futures):
+            return False
+        if self.stage == "images":
+            # imagem que não deu para recomprimir fica como está
+            self.images = []
+            for f in self._futures:
+                try:
+                    if f.result():
+                        self.images.append(f.result())
+                except Exception as e:
+                    logger.warning(f"Imagem mantida sem recompressão: {e}")
+            self._pool.shutdown(wait=False)
+            self._pool = None
+            self._write()
+            return False
+        try:
+            results = [f.result() for f in self._futures]
+        except Exception as e:
+            self._finish(error=e)
+            return True
+        if self.stage == "scan":
+            dpi = {}
+            for found in results:
+                for xref, value in found.items():
+                    dpi[xref] = min(dpi.get(xref, value), value)
+            target_dpi = self.profile["image_dpi"]
+            self._futures = [self._pool.submit(_recompress_image, xref, target_dpi / value, self.profile["jpeg_quality"])
+                             for xref, value in dpi.items() if value > target_dpi * 1.1]
+            self.stage = "images"
+            return False
+        self._finish(result=results[0])
+        return True
+
+    def cancel(self) -> bool:
+        """Interrompe antes da gravação. False se a gravação já começou (não é seguro interromper)."""
+        if self.stage == "write":
+            return False
+        self._finish(error=RuntimeError("salvamento cancelado"))
+        return True
+
+    def _write(self):
+        xref_len, objects, streams = self.snapshot
+        self._futures = [self.writer.submit(_save_snapshot, self.source, self.target, xref_len, objects, streams,
+                                            self.incremental, self.profile["save"], self.images)]
+        self.stage = "write"
+
+    def _finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        PERF.add("save", self.started, result[0] if result else 0, blocking=False)
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+# ====================================================
+
+
+# ================== SESSÃO DE EDIÇÃO (SEM INTERFACE) ==================
+class EditorSession:
+    """
+    Núcleo do editor sem Tk: documento aberto, objetos sobrepostos e histórico, com métodos
+    simples para renderizar, achar palavras, substituir, mover, inserir, desfazer e salvar.
+    A janela (PDFEditorApp) é uma camada por cima; scripts e servidor usam a sessão direto.
+    Coordenadas sempre em pontos PDF; páginas começam em 0.
+
+    Ganchos opcionais, chamados depois de cada mudança:
+      on_page_changed(pno)      conteúdo da página mudou (caches de bitmap, seleção...)
+      on_object_changed(obj)    objeto sobreposto criado ou alterado
+      on_object_removed(oid)    objeto sobreposto vai ser removido
+      on_edit(record)           registro da edição, no formato do diário e do roteiro de lote
+    """
+    DISPLAY_LIST_PAGES = 64  # páginas com DisplayList (conteúdo já interpretado) em memória
+
+    def __init__(self, undo_bytes: int = 64 * 1024 * 1024, undo_spill: bool = True):
+        self.doc = None
+        self.path = None          # arquivo escolhido pelo usuário
+        self.work_path = None     # arquivo realmente aberto (cópia local/reparada, ou o próprio path)
+        self.fingerprint = None
+        self.base_xref_len = 0    # tamanho da tabela xref do arquivo (o que passar disso foi criado aqui)
+        self.objects = OverlayStore()
+        self.history = EditHistory(undo_bytes, undo_spill)
+        self.dirty_pages = set()  # páginas que já não batem com o arquivo em disco
+        self.page_revisions = {}  # página -> revisão (incrementa a cada edição na página)
+        self.display_lists = OrderedDict()
+        self.word_indexes = OrderedDict()  # página -> (revisão, WordIndex)
+        self.on_page_changed = None
+        self.on_object_changed = None
+        self.on_object_removed = None
+        self.on_edit = None
+
+    # ---------------- Documento ----------------
+    def open(self, path: str, work_path: str = None, fingerprint: str = None):
+        t0 = time.perf_counter()
+        doc = fitz.open(work_path or path)
+        PERF.add("open", t0, os.path.getsize(work_path or path))
+        self.close()
+        self.doc = doc
+        self.path = path
+        self.work_path = work_path or path
+        self.fingerprint = fingerprint or file_fingerprint(path)
+        self.base_xref_len = doc.xref_length()
+        self.objects.clear()
+        self.history.clear()
+        self.dirty_pages.clear()
+        self.page_revisions.clear()
+        self.display_lists.clear()
+        self.word_indexes.clear()
+
+    def close(self):
+        if self.doc is not None:
+            self.doc.close()
+            self.doc = None
+
+    def shutdown(self):
+        self.close()
+        self.history.close()
+
+    @property
+    def page_count(self) -> int:
+        return len(self.doc) if self.doc is not None else 0
+
+    # ---------------- Renderização / palavras ----------------
+    def display_list(self, pno: int):
+        """DisplayList da página: o conteúdo é interpretado uma vez e reaproveitado em qualquer zoom."""
+        dl = self.display_lists.get(pno)
+        if dl is None:
+            dl = self.display_lists[pno] = self.doc[pno].get_displaylist()
+            while len(self.display_lists) > self.DISPLAY_LIST_PAGES:
+                self.display_lists.popitem(last=False)
+        else:
+            self.display_lists.move_to_end(pno)
+        return dl
+
+    def render(self, pno: int, zoom: float = 1.0, clip=None):
+        """Pixmap RGB da página (ou só de 'clip', em pontos PDF) no zoom pedido."""
+        dl = self.display_list(pno)
+        t0 = time.perf_counter()
+        pix = dl.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False, clip=clip)
+        PERF.add("pixmap", t0, pix.width * pix.height * pix.n)
+        return pix
+
+    def words(self, pno: int) -> WordIndex:
+        """Índice das palavras da página; extraído do DisplayList uma vez por revisão."""
+        revision = self.page_revisions.get(pno, 0)
+        cached = self.word_indexes.get(pno)
+        if cached is None or cached[0] != revision:
+            cached = self.word_indexes[pno] = (revision, WordIndex(displaylist_words(self.display_list(pno))))
+            while len(self.word_indexes) > self.DISPLAY_LIST_PAGES:
+                self.word_indexes.popitem(last=False)
+        else:
+            self.word_indexes.move_to_end(pno)
+        return cached[1]
+
+    def word_at(self, pno: int, x: float, y: float):
+        return self.words(pno).at(x, y)
+
+    def words_in_rect(self, pno: int, x0: float, y0: float, x1: float, y1: float):
+        return self.words(pno).in_rect(x0, y0, x1, y1)
+
+    # ---------------- Edições no PDF ----------------
+    def replace(self, pno: int, rect, text: str):
+        """Cobre o retângulo e escreve 'text' no lugar."""
+        rect = fitz.Rect(rect)
+        with self._page_edit("Substituir", [pno]):
+            replace_rects(self.doc[pno], [(rect, text)])
+        self._emit({"op": "replace", "page": pno, "rect": list(rect), "text": text})
+
+    def move_word(self, pno: int, rect, text: str, x: float, y: float) -> int:
+        """Apaga a palavra em 'rect' e escreve 'text' em (x, y). Devolve o tamanho de fonte usado."""
+        rect = fitz.Rect(rect)
+        with self._page_edit("Mover palavra", [pno]):
+            fontsize = move_word(self.doc[pno], rect, text, x, y)
+        self._emit({"op": "move_word", "page": pno, "rect": list(rect), "text": text, "x": x, "y": y})
+        return fontsize
+
+    def replace_all(self, pattern: str, replacement: str, use_regex: bool = False, match_case: bool = True,
+                    texts=None):
+        """
+        Substitui todas as ocorrências como uma única ação. Devolve (ocorrências, páginas).
+        'texts' (textos normalizados por página, do SearchIndex) deixa pular páginas sem o texto literal.
+        Levanta re.error se o padrão ou a substituição forem inválidos.
+        """
+        regex, repl = compile_replacement(pattern, replacement, use_regex, match_case)
+        needle = None if use_regex else normalize_text(pattern)
+        plan = {}
+        for pno in range(len(self.doc)):
+            if needle and texts is not None and texts[pno] is not None and needle not in texts[pno]:
+                continue
+            found = find_replacements(self.words(pno).words, regex, repl)
+            if found:
+                plan[pno] = found
+        if not plan:
+            return 0, 0
+        with self._page_edit(f"Substituir '{pattern}'", plan):
+            for pno, found in plan.items():
+                replace_rects(self.doc[pno], found)
+        self._emit({"op": "replace_all", "pattern": pattern, "replacement": replacement,
+                    "regex": use_regex, "case": match_case})
+        return sum(len(found) for found in plan.values()), len(plan)
+
+    # ---------------- Objetos sobrepostos ----------------
+    def insert_text(self, pno: int, x: float, y: float, text: str, size: int = 12) -> OverlayObject:
+        """Texto novo em (x, y) (topo do texto); só entra no PDF ao salvar (bake)."""
+        obj = self.objects.add(pno, x, y, text, size)
+        self._record("Novo texto", [("obj_add", obj.state())])
+        self._object_changed(obj)
+        return obj
+
+    def update_object(self, oid: int, label: str = "Editar texto", **fields):
+        """Altera page/texto/x/y/size de um objeto; só entra no histórico se algo mudou.
+        Mudar 'page' leva o objeto para a lista da outra página (um único passo de desfazer)."""
+        obj = self.objects.get(oid)
+        before = obj.state()
+        names = OverlayObject.__slots__
+        unknown = set(fields) - set(names[1:])
+        if unknown:
+            raise AttributeError(f"campo desconhecido: {', '.join(sorted(unknown))}")
+        after = tuple(fields.get(name, value) for name, value in zip(names, before))
+        if not 0 <= after[1] < self.page_count:
+            raise IndexError(f"página fora do documento: {after[1]}")
+        if after != before:
+            obj = self.objects.put(after)
+            self._record(label, [("obj_set", before, after)])
+        self._object_changed(obj)
+        return obj
+
+    def bake(self) -> bool:
+        """Grava os objetos sobrepostos no PDF (desfazer devolve páginas e objetos). False se não havia nenhum."""
+        if not self.objects:
+            return False
+        removed = [("obj_del", obj.state()) for obj in self.objects]
+        with self._page_edit("Salvar", list(self.objects.pages()), removed):
+            for pno in list(self.objects.pages()):
+                bake_overlay(self.doc[pno], self.objects.on_page(pno), BASELINE_FACTOR)
+        for _, state in removed:
+            self._remove_object(state[0])
+        self._emit({"op": "bake"})
+        return True
+
+    # ---------------- Histórico ----------------
+    def undo(self):
+        """Desfaz a última ação; devolve a entrada do histórico ou None se não havia."""
+        t0 = time.perf_counter()
+        entry = self.history.undo() if self.doc is not None else None
+        if entry is not None:
+            self._apply(reversed(entry.ops), undo=True)
+            self._emit({"op": "undo"})
+            PERF.add("undo", t0, entry.nbytes)
+        return entry
+
+    def redo(self):
+        t0 = time.perf_counter()
+        entry = self.history.redo() if self.doc is not None else None
+        if entry is not None:
+            self._apply(entry.ops, undo=False)
+            self._emit({"op": "redo"})
+            PERF.add("redo", t0, entry.nbytes)
+        return entry
 
-import fitz  # PyMuPDF
-import tkinter as tk
-from tkinter import filedialog, simpledialog, messagebox
-import ttkbootstrap as tb
-from PIL import Image, ImageTk
+    def apply_record(self, rec: dict):
+        """Refaz uma edição registrada por on_edit (reaplicação do diário)."""
+        op = rec["op"]
+        if op == "history":
+            # JSON devolve listas; o histórico e o OverlayStore usam tuplas
+            ops = [tuple(tuple(v) if isinstance(v, list) else v for v in o) for o in rec["ops"]]
+            self._apply(ops, undo=False)
+            self._record(rec["label"], ops)
+        elif op == "replace":
+            self.replace(rec["page"], rec["rect"], rec["text"])
+        elif op == "move_word":
+            self.move_word(rec["page"], rec["rect"], rec["text"], rec["x"], rec["y"])
+        elif op == "replace_all":
+            self.replace_all(rec["pattern"], rec["replacement"], rec["regex"], rec["case"])
+        elif op == "bake":
+            self.bake()
+        elif op in ("undo", "redo"):
+            # depois de um salvamento o histórico recomeça vazio: desfazer uma edição anterior a ele
+            # não tem o que desfazer, e seguir adiante montaria um documento que nunca existiu
+            if (self.undo() if op == "undo" else self.redo()) is None:
+                raise ValueError(f"'{op}' sem ação correspondente (edição anterior ao último salvamento)")
+        else:
+            raise ValueError(f"registro desconhecido: {op}")
 
-# extras para o sistema de licença
-import json
-import uuid
-import hashlib
-import datetime
+    # ---------------- Salvar ----------------
+    def snapshot(self):
+        """Objetos e streams que diferem do arquivo de origem: páginas editadas + objetos criados nesta sessão."""
+        t0 = time.perf_counter()
+        # dicionários por xref: páginas irmãs compartilham o nó /Pages (Resources herdado)
+        objects, streams = {}, {}
+        for pno in sorted(self.dirty_pages):
+            page_objects, page_streams = capture_page_state(self.doc, pno)
+            objects.update(page_objects)
+            streams.update(page_streams)
+        for xref in range(self.base_xref_len, self.doc.xref_length()):
+            objects[xref] = self.doc.xref_object(xref, compressed=True)
+            if self.doc.xref_is_stream(xref):
+                streams[xref] = self.doc.xref_stream(xref)
+        PERF.add("snapshot", t0, sum(len(data) for data in streams.values()))
+        return self.doc.xref_length(), list(objects.items()), list(streams.items())
 
-# ================== LOGGER DIÁRIO ==================
-BASE_DIR = os.path.dirname(sys.executable if getattr(sys, "frozen", False) else __file__)
-LOG_DIR = os.path.join(BASE_DIR, "logs")
-os.makedirs(LOG_DIR, exist_ok=True)
+    def save(self, target: str = None, profile: str = "fast"):
+        """Salva nesta thread (scripts/servidor; a janela usa SaveJob). Sobre o próprio arquivo só incremental."""
+        self.bake()
+        t0 = time.perf_counter()
+        target = target or self.path
+        settings = SAVE_PROFILES[profile]
+        if os.path.abspath(target) == os.path.abspath(self.work_path):
+            if settings["image_dpi"] or not self.doc.can_save_incrementally():
+                raise ValueError("sobre o arquivo aberto só é possível salvar de forma incremental")
+            self.doc.save(target, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        else:
+            # a recompressão de imagens altera o documento aberto: trabalha numa cópia
+            doc = fitz.open("pdf", self.doc.tobytes()) if settings["image_dpi"] else self.doc
+            downsample_images(doc, settings)
+            doc.save(target, **settings["save"])
+            if doc is not self.doc:
+                doc.close()
+        PERF.add("save", t0, os.path.getsize(target))
+        return target
 
-LOG_FILE = os.path.join(LOG_DIR, "app.log")
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-handler = TimedRotatingFileHandler(LOG_FILE, when="midnight", interval=1,
-                                   backupCount=30, encoding="utf-8")
-handler.suffix = "%Y-%m-%d.log"
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+    # ---------------- Interno ----------------
+    @contextmanager
+    def _page_edit(self, label: str, pages, extra_ops=()):
+        """Captura as páginas antes, registra antes/depois no histórico; se a edição falhar, devolve-as."""
+        before = {pno: capture_page_state(self.doc, pno) for pno in pages}
+        try:
+            yield
+        except Exception:
+            for pno, state in before.items():
+                restore_page_state(self.doc, state)
+                self._page_changed(pno)
+            raise
+        ops = [("page", pno, state, capture_page_state(self.doc, pno)) for pno, state in before.items()]
+        ops.extend(extra_ops)
+        self.history.push(label, ops)
+        for pno in before:
+            self._page_changed(pno)
+        logger.debug(f"Histórico: '{label}' ({len(ops)} operação(ões))")
 
-def excecao_nao_tratada(exc_type, exc_value, exc_traceback):
-    if issubclass(exc_type, KeyboardInterrupt):
-        sys.__excepthook__(exc_type, exc_value, exc_traceback)
-        return
-    logger.critical("Exceção não tratada", exc_info=(exc_type, exc_value, exc_traceback))
+    def _record(self, label: str, ops):
+        """Ação só sobre objetos sobrepostos: entra no histórico e, como é pequena, no diário por inteiro."""
+        self.history.push(label, ops)
+        self._emit({"op": "history", "label": label, "ops": ops})
 
-sys.excepthook = excecao_nao_tratada
+    def _apply(self, ops, undo: bool):
+        """Aplica as operações de uma entrada do histórico (na ordem inversa e invertidas, ao desfazer)."""
+        for op in ops:
+            kind = op[0]
+            if kind == "page":
+                _, pno, before, after = op
+                restore_page_state(self.doc, before if undo else after)
+                self._page_changed(pno)
+            elif kind in ("obj_add", "obj_del"):
+                if (kind == "obj_add") != undo:
+                    self._object_changed(self.objects.put(op[1]))
+                else:
+                    self._remove_object(op[1][0])
+            elif kind == "obj_set":
+                self._object_changed(self.objects.put(op[1] if undo else op[2]))
 
-def report_callback_exception(self, exc, val, tb_):
-    erro = "".join(traceback.format_exception(exc, val, tb_))
-    logger.error(f"Erro no Tkinter:\n{erro}")
+    def _page_changed(self, pno: int):
+        self.page_revisions[pno] = self.page_revisions.get(pno, 0) + 1
+        self.display_lists.pop(pno, None)
+        self.word_indexes.pop(pno, None)
+        self.dirty_pages.add(pno)
+        if self.on_page_changed:
+            self.on_page_changed(pno)
+
+    def _object_changed(self, obj):
+        if self.on_object_changed:
+            self.on_object_changed(obj)
+
+    def _remove_object(self, oid: int):
+        if self.on_object_removed:
+            self.on_object_removed(oid)
+        self.objects.remove(oid)
+
+    def _emit(self, record: dict):
+        if self.on_edit:
+            self.on_edit(record)
+# ====================================================
+
+
+# ================== EDIÇÃO EM LOTE (LINHA DE COMANDO) ==================
+# Roteiro de edições: mesmo formato dos registros do diário ('page' começa em 0)
+EDIT_FIELDS = {
+    "replace": ("page", "rect", "text"),
+    "replace_all": ("pattern", "replacement"),
+    "move_word": ("page", "rect", "text", "x", "y"),
+    "text": ("page", "x", "y", "text"),
+}
+
+
+def load_edit_script(path: str):
+    """Lê o roteiro ({"profile": ..., "edits": [...]} ou só a lista) e confere os campos de cada edição."""
+    with open(path, encoding="utf-8") as f:
+        script = json.load(f)
+    if isinstance(script, list):
+        script = {"edits": script}
+    for i, edit in enumerate(script.get("edits", [])):
+        fields = EDIT_FIELDS.get(edit.get("op"))
+        if fields is None:
+            raise ValueError(f"edição {i + 1}: operação desconhecida '{edit.get('op')}'")
+        missing = [name for name in fields if name not in edit]
+        if missing:
+            raise ValueError(f"edição {i + 1} ({edit['op']}): faltando {', '.join(missing)}")
+        if edit["op"] == "replace_all":
+            compile_replacement(edit["pattern"], edit["replacement"], edit.get("regex", False), edit.get("case", True))
+    return script
+
+
+def apply_edits(doc, edits, baseline_factor: float = BASELINE_FACTOR) -> int:
+    """Aplica o roteiro ao documento; textos novos entram por último, como no salvamento do editor.
+    Devolve o número de alterações."""
+    overlay = {}
+    changes = 0
+    for edit in edits:
+        op = edit["op"]
+        if op == "replace":
+            replace_rects(doc[edit["page"]], [(fitz.Rect(edit["rect"]), edit["text"])])
+            changes += 1
+        elif op == "replace_all":
+            regex, repl = compile_replacement(edit["pattern"], edit["replacement"],
+                                              edit.get("regex", False), edit.get("case", True))
+            for page in doc:
+                found = find_replacements(page.get_text("words"), regex, repl)
+                if found:
+                    replace_rects(page, found)
+                    changes += len(found)
+        elif op == "move_word":
+            move_word(doc[edit["page"]], fitz.Rect(edit["rect"]), edit["text"], edit["x"], edit["y"], baseline_factor)
+            changes += 1
+        elif op == "text":
+            objs = overlay.setdefault(edit["page"], [])
+            objs.append(OverlayObject(len(objs), edit["page"], edit["x"], edit["y"], edit["text"], edit.get("size", 12)))
+            changes += 1
+    for pno, objs in overlay.items():
+        bake_overlay(doc[pno], objs, baseline_factor)
+    return changes
+
+
+def _batch_file(source, target, edits, profile):
+    """Executa no processo do lote: abre, aplica o roteiro, recomprime imagens (perfil) e grava."""
+    t0 = time.perf_counter()
+    settings = SAVE_PROFILES[profile]
+    doc = fitz.open(source)
+    try:
+        changes = apply_edits(doc, edits)
+        images = downsample_images(doc, settings)
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        doc.save(target, **settings["save"])
+        return {"pages": len(doc), "changes": changes, "images": images,
+                "size_before": os.path.getsize(source), "size_after": os.path.getsize(target),
+                "seconds": time.perf_counter() - t0}
+    finally:
+        doc.close()
+
+
+def batch_inputs(paths, out_dir: str):
+    """[(origem, destino)]: arquivos soltos vão para a raiz de 'out_dir', pastas mantêm a estrutura."""
+    jobs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith(".pdf"):
+                        source = os.path.join(folder, name)
+                        jobs.append((source, os.path.join(out_dir, os.path.relpath(source, path))))
+        else:
+            jobs.append((path, os.path.join(out_dir, os.path.basename(path))))
+    return jobs
+
+
+def batch_main(argv) -> int:
+    """python editor_trial.py batch roteiro.json ENTRADAS... -o SAÍDA: sem licença nem janela."""
+    parser = argparse.ArgumentParser(prog="editor_trial.py batch",
+                                     description="Aplica um roteiro de edições (JSON) a vários PDFs.")
+    parser.add_argument("script", help="roteiro de edições (JSON)")
+    parser.add_argument("inputs", nargs="+", help="arquivos PDF e/ou pastas")
+    parser.add_argument("-o", "--output", required=True, help="pasta de saída")
+    parser.add_argument("--profile", choices=sorted(SAVE_PROFILES), help="perfil de salvamento (padrão: o do roteiro, ou fast; "
+                        "balanced/smallest recomprimem imagens em JPEG, com perda)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--report", help="grava o resultado de cada arquivo neste JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        script = load_edit_script(args.script)
+    except (OSError, ValueError, re.error) as e:
+        print(f"Roteiro inválido: {e}", file=sys.stderr)
+        return 2
+    profile = args.profile or script.get("profile", "fast")
+    if profile not in SAVE_PROFILES:
+        print(f"Perfil desconhecido: {profile}", file=sys.stderr)
+        return 2
+    jobs = batch_inputs(args.inputs, args.output)
+    if not jobs:
+        print("Nenhum PDF encontrado.", file=sys.stderr)
+        return 2
+    for source, target in jobs:
+        if os.path.abspath(source) == os.path.abspath(target):
+            print(f"Saída sobrescreveria a entrada: {source}", file=sys.stderr)
+            return 2
+
+    started = time.perf_counter()
+    results = []
+    workers = max(1, min(args.workers, len(jobs)))
+    logger.info(f"Lote: {len(jobs)} arquivo(s), {len(script.get('edits', []))} edição(ões), "
+                f"perfil {profile}, {workers} processo(s)")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(_batch_file, source, target, script.get("edits", []), profile): (source, target)
+                   for source, target in jobs}
+        for fut in as_completed(futures):
+            source, target = futures[fut]
+            try:
+                result = dict(fut.result(), file=source, output=target, ok=True)
+                print(f"OK    {source}: {result['changes']} alteração(ões), {result['images']} imagem(ns), "
+                      f"{result['size_before'] / 1e6:.1f} -> {result['size_after'] / 1e6:.1f} MB em {result['seconds']:.2f}s")
+            except Exception as e:
+                result = {"file": source, "output": target, "ok": False, "error": str(e)}
+                print(f"ERRO  {source}: {e}")
+                logger.error(f"Lote: erro em {source}: {e}")
+            results.append(result)
+
+    elapsed = time.perf_counter() - started
+    done = [r for r in results if r["ok"]]
+    pages = sum(r["pages"] for r in done)
+    read_mb = sum(r["size_before"] for r in done) / 1e6
+    summary = (f"{len(done)}/{len(results)} arquivo(s) em {elapsed:.1f}s: {len(done) / elapsed:.1f} arq/s, "
+               f"{pages / elapsed:.0f} pág/s, {read_mb / elapsed:.1f} MB/s")
+    print(summary)
+    logger.info(f"Lote concluído: {summary}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"profile": profile, "seconds": elapsed, "files": results}, f, ensure_ascii=False, indent=2)
+    return 0 if len(done) == len(results) else 1
+# ====================================================
+
+
+# ================== MODELOS (MALA DIRETA) ==================
+# Modelo: os textos sobrepostos (página/x/y/tamanho) de um PDF, com campos {coluna} da planilha
+TEMPLATE_DIR = os.path.join(APP_DATA_DIR, "templates")
+MERGE_REOPEN_ROWS = 200  # linhas por worker antes de reabrir o PDF (da memória) e descartar objetos órfãos
+
+
+def save_template(path: str, name: str, source: str, fingerprint, objects):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    template = {"name": name, "source": source, "fingerprint": fingerprint,
+                "objects": [{"page": o.page, "x": o.x, "y": o.y, "size": o.size, "text": o.text} for o in objects]}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(template, f, ensure_ascii=False, indent=2)
+
+
+def load_template(path: str):
+    with open(path, encoding="utf-8") as f:
+        template = json.load(f)
+    template_fields(template)  # confere os campos antes de começar
+    return template
+
+
+def template_fields(template, extra: str = "") -> set:
+    """Colunas da planilha usadas pelos textos do modelo (e pelo padrão de nome 'extra')."""
+    fields = set()
+    for text in [o["text"] for o in template["objects"]] + [extra]:
+        for _, field, _, _ in string.Formatter().parse(text):
+            if field:
+                fields.add(re.split(r"[.\[]", field)[0])
+    fields.discard("_row")
+    return fields
+
+
+def safe_filename(name: str) -> str:
+    return re.sub(r'[\\/:*?"<>|\r\n]+', "_", name).strip() or "_"
+
+
+_merge_data = None    # bytes do PDF de origem (lido uma vez por worker)
+_merge_states = {}    # página -> estado original (capture_page_state), restaurado após cada linha
+_merge_uses = 0
+
+
+def _merge_open(source, pages):
+    """Inicializador do worker da mala direta: lê o PDF de origem uma vez e guarda as páginas do modelo."""
+    global _merge_data
+    with open(source, "rb") as f:
+        _merge_data = f.read()
+    _merge_reopen(pages)
+
+
+def _merge_reopen(pages):
+    global _worker_doc, _merge_states, _merge_uses
+    if _worker_doc is not None:
+        _worker_doc.close()
+    _worker_doc = fitz.open("pdf", _merge_data)
+    _merge_states = {pno: capture_page_state(_worker_doc, pno) for pno in pages}
+    _merge_uses = 0
+
+
+def _merge_rows(objects, rows, out_dir, name_pattern, save_options):
+    """
+    Executa no worker: para cada (nº da linha, linha) grava os textos, salva o PDF da linha
+    direto no disco e devolve as páginas ao estado original. Devolve (gravados, [(linha, erro)]).
+    """
+    global _merge_uses
+    doc = _worker_doc
+    errors = []
+    for rownum, row in rows:
+        if _merge_uses >= MERGE_REOPEN_ROWS:
+            # cada linha deixa para trás o stream de conteúdo que criou; reabrir zera a tabela xref
+            _merge_reopen(list(_merge_states))
+            doc = _worker_doc
+        values = dict(row, _row=rownum)
+        try:
+            by_page = {}
+            for i, o in enumerate(objects):
+                by_page.setdefault(o["page"], []).append(
+                    OverlayObject(i, o["page"], o["x"], o["y"], o["text"].format_map(values), o["size"]))
+            for pno, objs in by_page.items():
+                bake_overlay(doc[pno], objs, BASELINE_FACTOR)
+            doc.save(os.path.join(out_dir, safe_filename(name_pattern.format_map(values))), **save_options)
+        except Exception as e:
+            errors.append((rownum, str(e)))
+        finally:
+            for state in _merge_states.values():
+                restore_page_state(doc, state)
+            _merge_uses += 1
+    return len(rows) - len(errors), errors
+
+
+class MergeJob:
+    """
+    Mala direta: lê a planilha em fatias conforme os workers liberam vagas (poucas fatias em voo),
+    então a memória não cresce com o número de linhas. Acompanhada com poll(), como SaveJob.
+    """
+    CHUNK_ROWS = 25     # linhas por tarefa
+    MAX_ERRORS = 100    # erros guardados para o relatório (os demais só entram na contagem)
+
+    def __init__(self, template, csv_path: str, out_dir: str, name_pattern: str, profile: str = "fast",
+                 workers: int = None, source: str = None):
+        self.out_dir = out_dir
+        self.started = time.perf_counter()
+        self.done = 0
+        self.failed = 0
+        self.errors = []
+        self.finished = False
+        self._file = open(csv_path, newline="", encoding="utf-8-sig")
+        try:
+            sample = self._file.read(4096)
+            self._file.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+            except csv.Error:
+                dialect = csv.excel
+            self._reader = csv.DictReader(self._file, dialect=dialect)
+            missing = template_fields(template, name_pattern) - set(self._reader.fieldnames or [])
+            if missing:
+                raise ValueError(f"coluna(s) ausente(s) na planilha: {', '.join(sorted(missing))}")
+        except Exception:
+            self._file.close()
+            raise
+        self._rows = enumerate(self._reader, start=1)
+        os.makedirs(out_dir, exist_ok=True)
+        # garbage=1 tira do arquivo os objetos órfãos das linhas anteriores; garbage >= 2 renumeraria
+        # os objetos do documento aberto e invalidaria os estados de página guardados no worker
+        save_options = dict(SAVE_PROFILES[profile]["save"], garbage=1)
+        self._task = (template["objects"], out_dir, name_pattern, save_options)
+        pages = sorted({o["page"] for o in template["objects"]})
+        workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self._max_inflight = workers * 2
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                         initializer=_merge_open, initargs=(source or template["source"], pages))
+        self._futures = {}  # Future -> nº de linhas da fatia
+        self._eof = False
+        self._fill()
+
+    @property
+    def rows_per_sec(self) -> float:
+        return (self.done + self.failed) / max(time.perf_counter() - self.started, 1e-6)
+
+    @property
+    def status(self) -> str:
+        return f"Preenchendo: {self.done} PDF(s), {self.failed} erro(s), {self.rows_per_sec:.0f} linhas/s"
+
+    def _fill(self):
+        while not self._eof and len(self._futures) < self._max_inflight:
+            rows = list(islice(self._rows, self.CHUNK_ROWS))
+            if not rows:
+                self._eof = True
+                self._file.close()
+                break
+            objects, out_dir, name_pattern, save_options = self._task
+            self._futures[self._pool.submit(_merge_rows, objects, rows, out_dir, name_pattern, save_options)] = len(rows)
+
+    def poll(self) -> bool:
+        """Recolhe as fatias prontas e envia as próximas; True quando todas as linhas foram processadas."""
+        for fut in [f for f in self._futures if f.done()]:
+            count = self._futures.pop(fut)
+            try:
+                written, errors = fut.result()
+            except Exception as e:
+                # worker não conseguiu nem abrir o PDF: todas as linhas da fatia falham
+                written, errors = 0, [(0, str(e))]
+                self.failed += count - 1
+            self.done += written
+            self.failed += len(errors)
+            for rownum, message in errors:
+                logger.warning(f"Mala direta: linha {rownum}: {message}")
+            self.errors.extend(errors[:self.MAX_ERRORS - len(self.errors)])
+        self._fill()
+        if self._eof and not self._futures and not self.finished:
+            self.finished = True
+            self._pool.shutdown(wait=False)
+        return self.finished
+
+    def cancel(self):
+        self._eof = True
+        if not self._file.closed:
+            self._file.close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self.finished = True
+
+
+def merge_main(argv) -> int:
+    """python editor_trial.py merge modelo.json dados.csv -o SAÍDA: um PDF por linha, sem janela."""
+    parser = argparse.ArgumentParser(prog="editor_trial.py merge",
+                                     description="Preenche um modelo com cada linha de uma planilha CSV.")
+    parser.add_argument("template", help="modelo salvo pelo editor (JSON)")
+    parser.add_argument("data", help="planilha CSV (primeira linha = nomes das colunas)")
+    parser.add_argument("-o", "--output", required=True, help="pasta de saída")
+    parser.add_argument("--name", default="{_row:05d}.pdf", help="nome de cada arquivo, com campos {coluna}")
+    parser.add_argument("--source", help="PDF de origem (padrão: o gravado no modelo)")
+    parser.add_argument("--profile", choices=sorted(SAVE_PROFILES), default="fast")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args(argv)
+
+    try:
+        template = load_template(args.template)
+        job = MergeJob(template, args.data, args.output, args.name, args.profile, args.workers, args.source)
+    except (OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+    last = 0
+    while not job.poll():
+        time.sleep(0.05)
+        if time.perf_counter() - last > 2:
+            last = time.perf_counter()
+            print(job.status)
+    summary = (f"{job.done} PDF(s) gravado(s), {job.failed} erro(s) em {time.perf_counter() - job.started:.1f}s "
+               f"({job.rows_per_sec:.0f} linhas/s)")
+    for rownum, message in job.errors:
+        print(f"ERRO  linha {rownum}: {message}")
+    print(summary)
+    logger.info(f"Mala direta concluída ({args.template}): {summary}")
+    return 0 if job.failed == 0 else 1
+# ====================================================
+
+
+# ================== SERVIDOR HTTP (RENDERIZAÇÃO / EDIÇÃO) ==================
+# Cada processo do servidor guarda as suas próprias sessões (EditorSession) num LRU. Páginas de
+# documentos sem edição são distribuídas entre os processos por página; depois da primeira edição
+# o documento passa a ser atendido só pelo processo dono, onde a sessão editada fica presa até fechar.
+SERVER_MAX_ZOOM = 8.0
+SERVER_MAX_PIXELS = 40_000_000  # por imagem (página inteira ou recorte)
+SERVER_MAX_BODY = 1024 * 1024   # corpo JSON dos POST
+SERVER_TIMEOUT = 120            # segundos esperando o processo responder
+SERVER_EDIT_IDLE = 30 * 60      # documento editado parado há mais que isso pode ser descartado para dar lugar a outro
+
+_server_sessions = OrderedDict()  # id do documento -> EditorSession (só no processo do servidor)
+_server_max_docs = 8
+
+
+def _server_init(max_docs):
+    global _server_max_docs
+    _server_max_docs = max_docs
+
+
+def _server_session(doc_id, path, fingerprint):
+    """Sessão do documento neste processo: abre uma vez e reaproveita nas próximas requisições."""
+    session = _server_sessions.get(doc_id)
+    if session is not None:
+        _server_sessions.move_to_end(doc_id)
+        return session
+    session = EditorSession(16 * 1024 * 1024, undo_spill=False)
+    session.open(path, fingerprint=fingerprint)
+    _server_sessions[doc_id] = session
+    # fecha as usadas há mais tempo; sessões editadas não saem (as edições só existem aqui)
+    clean = [key for key, s in _server_sessions.items() if not s.page_revisions][:-1]
+    for key in clean[:max(0, len(_server_sessions) - _server_max_docs)]:
+        _server_sessions.pop(key).shutdown()
+    return session
+
+
+def _server_call(doc_id, path, fingerprint, action, args):
+    """Executa no processo do servidor: uma operação sobre o documento."""
+    if action == "close":
+        session = _server_sessions.pop(doc_id, None)
+        if session is not None:
+            session.shutdown()
+        return None
+    session = _server_session(doc_id, path, fingerprint)
+    if action == "info":
+        return {"pages": session.page_count}
+    if action == "render":
+        pno, zoom, clip = args
+        area = session.doc[pno].rect
+        if clip is not None:
+            area = fitz.Rect(clip) & area
+            if area.is_empty:
+                raise ValueError("recorte fora da página")
+        if area.width * area.height * zoom * zoom > SERVER_MAX_PIXELS:
+            raise ValueError("imagem grande demais: diminua o zoom ou use um recorte")
+        return session.render(pno, zoom, area if clip is not None else None).tobytes("png")
+    if action == "words":
+        return json.dumps([[round(v, 2) for v in w[:4]] + [w[4]] for w in session.words(args).words],
+                          ensure_ascii=False).encode("utf-8")
+    if action == "replace":
+        if "pattern" in args:
+            found, pages = session.replace_all(args["pattern"], args["replacement"],
+                                               args.get("regex", False), args.get("case", True))
+            return {"replaced": found, "pages": pages}
+        session.replace(args["page"], args["rect"], args["text"])
+        return {"replaced": 1, "pages": 1}
+    if action == "save":
+        return {"path": session.save(args.get("path"), args.get("profile", "fast"))}
+    raise ValueError(f"operação desconhecida: {action}")
+
+
+class ServerBusy(Exception):
+    """Limite de documentos editados atingido (HTTP 503): o cliente salva/fecha um deles ou tenta mais tarde."""
+
+
+def _json_rect(value) -> fitz.Rect:
+    """Retângulo vindo do JSON: exatamente quatro números [x0, y0, x1, y1]."""
+    if not isinstance(value, (list, tuple)) or len(value) != 4 \
+            or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+        raise ValueError("'rect' deve ser [x0, y0, x1, y1]")
+    rect = fitz.Rect(value)
+    if rect.is_empty:
+        raise ValueError("retângulo vazio")
+    return rect
+
+
+class DocumentService:
+    """
+    Backend do servidor HTTP: registro dos documentos abertos, um processo por worker
+    (cada um com o seu LRU de sessões), cache das respostas e métricas por endpoint.
+    Várias requisições iguais ao mesmo tempo (muitos clientes na mesma página) viram um único
+    pedido ao processo; as demais esperam o mesmo Future e depois vêm do cache.
+    Documentos editados não saem do LRU dos processos (as edições só existem lá): no máximo
+    'max_edited' ao mesmo tempo; para abrir espaço só se descarta um parado há SERVER_EDIT_IDLE.
+    """
+
+    def __init__(self, workers: int, docs_per_worker: int = 8, cache_bytes: int = 256 * 1024 * 1024,
+                 output_dir: str = None, allow_overwrite: bool = False, max_edited: int = 16):
+        self.docs_per_worker = docs_per_worker
+        self.max_edited = max_edited
+        self.output_dir = os.path.realpath(output_dir) if output_dir else None  # único lugar onde /save grava
+        self.allow_overwrite = allow_overwrite  # /save sem "path" regrava o arquivo original
+        self._executors = [self._start() for _ in range(max(1, workers))]
+        self.docs = {}          # id -> {"path", "fingerprint", "pages", "revision", "edited", "used"}
+        self.cache = RenderCache(cache_bytes)  # (id, revisão, tipo, página, ...) -> bytes da resposta
+        self.metrics = {}       # endpoint -> LatencyStats
+        self.hits = self.misses = self.coalesced = 0
+        self.started = time.perf_counter()
+        self._inflight = {}     # chave do cache -> (executor, Future) ainda em andamento
+        self._lock = threading.RLock()  # _submit pode chamar _restart com o lock já tomado (_cached)
+
+    def _start(self):
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_server_init, initargs=(self.docs_per_worker,))
+
+    # ---------------- Encaminhamento ----------------
+    def document(self, doc_id: str) -> dict:
+        with self._lock:
+            doc = self.docs.get(doc_id)
+            if doc is not None:
+                doc["used"] = time.monotonic()
+        if doc is None:
+            raise FileNotFoundError(f"documento desconhecido: {doc_id}")
+        return doc
+
+    def worker_for(self, doc_id: str, pno: int = None) -> int:
+        """Documento editado: sempre o dono. Sem edição: cada página num processo (espalha os documentos quentes)."""
+        doc = self.docs.get(doc_id)
+        key = doc_id if pno is None or doc is None or doc["edited"] else f"{doc_id}:{pno}"
+        return zlib.crc32(key.encode()) % len(self._executors)
+
+    def call(self, index: int, doc_id: str, doc: dict, action: str, args=None):
+        return self._result(index, *self._submit(index, doc_id, doc, action, args))
+
+    def _submit(self, index: int, doc_id: str, doc: dict, action: str, args):
+        """Devolve (executor, Future): quem vê o processo cair sabe qual executor recriar."""
+        executor = self._executors[index]
+        try:
+            return executor, executor.submit(_server_call, doc_id, doc["path"], doc["fingerprint"], action, args)
+        except BrokenProcessPool:
+            self._restart(index, executor)
+            raise RuntimeError("processo do servidor reiniciado; tente de novo")
+
+    def _result(self, index: int, executor, fut):
+        try:
+            return fut.result(timeout=SERVER_TIMEOUT)
+        except BrokenProcessPool:
+            self._restart(index, executor)
+            raise RuntimeError("processo do servidor caiu; tente de novo")
+
+    def _restart(self, index: int, executor):
+        """Recria o processo que caiu; documentos editados que moravam nele são perdidos."""
+        with self._lock:
+            if self._executors[index] is not executor:
+                return  # outra requisição que viu a mesma queda já recriou
+            self._executors[index] = self._start()
+            lost = [key for key, doc in self.docs.items() if doc["edited"] and self.worker_for(key) == index]
+            for key in lost:
+                del self.docs[key]
+        executor.shutdown(wait=False)
+        logger.error(f"Servidor: processo {index} caiu; {len(lost)} documento(s) editado(s) descartado(s)")
+
+    def _cached(self, key, index: int, doc_id: str, doc: dict, action: str, args) -> bytes:
+        """Resposta do cache; se não houver, um só pedido ao processo para todas as requisições iguais."""
+        with self._lock:
+            data = self.cache.get(key)
+            if data is not None:
+                self.hits += 1
+                return data
+            pending = self._inflight.get(key)
+            owner = pending is None
+            if owner:
+                self.misses += 1
+                pending = self._inflight[key] = self._submit(index, doc_id, doc, action, args)
+            else:
+                self.coalesced += 1
+        executor, fut = pending
+        try:
+            data = self._result(index, executor, fut)
+        finally:
+            if owner:
+                with self._lock:
+                    if fut.done() and fut.exception() is None:
+                        self.cache.put(key, fut.result(), len(fut.result()))
+                    self._inflight.pop(key, None)
+        return data
+
+    # ---------------- Operações ----------------
+    def open(self, path: str) -> dict:
+        path = os.path.abspath(path)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"arquivo não encontrado: {path}")
+        fingerprint = file_fingerprint(path)
+        doc_id = hashlib.sha1(f"{path}|{fingerprint}".encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            doc = self.docs.get(doc_id)
+        if doc is None:
+            doc = {"path": path, "fingerprint": fingerprint, "revision": 0, "edited": False,
+                   "used": time.monotonic()}
+            doc["pages"] = self.call(self.worker_for(doc_id), doc_id, doc, "info")["pages"]
+            with self._lock:
+                doc = self.docs.setdefault(doc_id, doc)
+            logger.info(f"Servidor: aberto {path} ({doc['pages']} pág.) como {doc_id}")
+        return self.describe(doc_id, doc)
+
+    def describe(self, doc_id: str, doc: dict) -> dict:
+        return {"doc": doc_id, "path": doc["path"], "pages": doc["pages"],
+                "revision": doc["revision"], "edited": doc["edited"]}
+
+    def check_page(self, doc: dict, pno: int):
+        if not 0 <= pno < doc["pages"]:
+            raise IndexError(f"página fora do documento: {pno}")
+
+    def render(self, doc_id: str, pno: int, zoom: float, clip=None):
+        """PNG da página (ou do recorte 'clip', em pontos PDF). Devolve (png, revisão)."""
+        doc = self.document(doc_id)
+        self.check_page(doc, pno)
+        if not 0 < zoom <= SERVER_MAX_ZOOM:
+            raise ValueError(f"zoom deve estar entre 0 e {SERVER_MAX_ZOOM}")
+        revision = doc["revision"]
+        key = (doc_id, revision, "png", pno, round(zoom, 4), clip)
+        return self._cached(key, self.worker_for(doc_id, pno), doc_id, doc, "render", (pno, zoom, clip)), revision
+
+    def words(self, doc_id: str, pno: int):
+        """JSON [[x0, y0, x1, y1, texto], ...] das palavras da página. Devolve (json, revisão)."""
+        doc = self.document(doc_id)
+        self.check_page(doc, pno)
+        revision = doc["revision"]
+        key = (doc_id, revision, "words", pno)
+        return self._cached(key, self.worker_for(doc_id, pno), doc_id, doc, "words", pno), revision
+
+    def replace(self, doc_id: str, edit: dict) -> dict:
+        """Uma palavra ({page, rect, text}) ou todas as ocorrências ({pattern, replacement, regex, case})."""
+        doc = self.document(doc_id)
+        if "pattern" in edit:
+            compile_replacement(edit["pattern"], edit["replacement"], edit.get("regex", False), edit.get("case", True))
+        else:
+            if not isinstance(edit["page"], int) or isinstance(edit["page"], bool):
+                raise ValueError("'page' deve ser um número inteiro")
+            self.check_page(doc, edit["page"])
+            edit = dict(edit, rect=list(_json_rect(edit["rect"])))
+            if not isinstance(edit["text"], str):
+                raise TypeError("'text' deve ser texto")
+        self.reserve_edit(doc_id, doc)
+        try:
+            result = self.call(self.worker_for(doc_id), doc_id, doc, "replace", edit)
+        finally:
+            with self._lock:
+                doc["revision"] += 1
+        return dict(result, revision=doc["revision"])
+
+    def reserve_edit(self, doc_id: str, doc: dict):
+        """
+        Marca o documento como editado, respeitando max_edited. Cheio: descarta o editado parado há
+        mais tempo (se passou de SERVER_EDIT_IDLE); senão ServerBusy, em vez de crescer sem limite.
+        """
+        with self._lock:
+            if doc["edited"]:
+                return
+            edited = [(d["used"], key) for key, d in self.docs.items() if d["edited"]]
+            idle = None
+            if len(edited) >= self.max_edited:
+                used, idle = min(edited)
+                if time.monotonic() - used < SERVER_EDIT_IDLE:
+                    raise ServerBusy(f"{len(edited)} documentos com edições não salvas: "
+                                     "salve ou feche um deles, ou tente mais tarde")
+                self.docs.pop(idle)
+            # daqui em diante tudo do documento vai para o dono, na ordem (o Future da edição vem antes)
+            doc["edited"] = True
+        if idle is not None:
+            logger.warning(f"Servidor: documento {idle} descartado com edições não salvas (parado há muito tempo)")
+            for index in range(len(self._executors)):
+                self.call(index, idle, {"path": None, "fingerprint": None}, "close")
 
-tk.Tk.report_callback_exception = report_callback_exception
+    def save(self, doc_id: str, target: str = None, profile: str = "fast") -> dict:
+        doc = self.document(doc_id)
+        if profile not in SAVE_PROFILES:
+            raise ValueError(f"perfil desconhecido: {profile}")
+        args = {"path": self.save_target(target), "profile": profile}
+        return self.call(self.worker_for(doc_id), doc_id, doc, "save", args)
+
+    def save_target(self, target: str = None):
+        """
+        Caminho final de um /save. Qualquer processo da máquina fala com o servidor, então ele só grava
+        dentro de --output-dir (caminhos relativos a ela) e só regrava o original com --allow-overwrite.
+        """
+        if not target:
+            if not self.allow_overwrite:
+                raise PermissionError("informe 'path': regravar o original exige --allow-overwrite")
+            return None
+        if self.output_dir is None:
+            raise PermissionError("salvar em outro arquivo exige iniciar o servidor com --output-dir")
+        if not isinstance(target, str) or not target.lower().endswith(".pdf"):
+            raise ValueError("'path' deve ser um arquivo .pdf")
+        path = os.path.realpath(os.path.join(self.output_dir, target))
+        if os.path.commonpath([self.output_dir, path]) != self.output_dir:
+            raise PermissionError(f"destino fora de {self.output_dir}")
+        return path
+
+    def close(self, doc_id: str):
+        doc = self.document(doc_id)
+        with self._lock:
+            self.docs.pop(doc_id, None)
+        for index in range(len(self._executors)):
+            self.call(index, doc_id, doc, "close")
+
+    def record(self, endpoint: str, ms: float, ok: bool):
+        with self._lock:
+            self.metrics.setdefault(endpoint, LatencyStats()).add(ms, ok)
+
+    def snapshot_metrics(self) -> dict:
+        with self._lock:
+            return {"uptime_s": round(time.perf_counter() - self.started, 1),
+                    "workers": len(self._executors), "documents": len(self.docs),
+                    "cache": {"bytes": self.cache.used_bytes, "hits": self.hits, "misses": self.misses,
+                              "coalesced": self.coalesced},
+                    "endpoints": {name: stats.summary() for name, stats in sorted(self.metrics.items())}}
+
+    def shutdown(self):
+        for executor in self._executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Rotas HTTP -> DocumentService (self.server.service). Respostas JSON, exceto as imagens PNG."""
+    protocol_version = "HTTP/1.1"
+    ROUTES = [
+        ("POST", re.compile(r"/open"), "open"),
+        ("GET", re.compile(r"/metrics"), "metrics"),
+        ("GET", re.compile(r"/docs/(\w+)"), "info"),
+        ("GET", re.compile(r"/docs/(\w+)/pages/(\d+)\.png"), "render"),
+        ("GET", re.compile(r"/docs/(\w+)/pages/(\d+)/words"), "words"),
+        ("POST", re.compile(r"/docs/(\w+)/replace"), "replace"),
+        ("POST", re.compile(r"/docs/(\w+)/save"), "save"),
+        ("POST", re.compile(r"/docs/(\w+)/close"), "close"),
+    ]
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def log_message(self, format, *args):
+        logger.debug(f"Servidor: {self.address_string()} {format % args}")
+
+    def dispatch(self, method: str):
+        t0 = time.perf_counter()
+        url = urlsplit(self.path)
+        endpoint, match = "desconhecido", None
+        for route_method, pattern, name in self.ROUTES:
+            match = pattern.fullmatch(url.path)
+            if match and route_method == method:
+                endpoint = name
+                break
+        status = 500
+        try:
+            if endpoint == "desconhecido":
+                status = 404
+                self.send_json(404, {"error": f"rota desconhecida: {method} {url.path}"})
+                return
+            status = getattr(self, f"route_{endpoint}")(*match.groups(), query=parse_qs(url.query))
+        except FileNotFoundError as e:
+            status = 404
+            self.send_json(404, {"error": str(e)})
+        except PermissionError as e:
+            status = 403
+            self.send_json(403, {"error": str(e)})
+        except ServerBusy as e:
+            status = 503
+            self.send_json(503, {"error": str(e)})
+        except KeyError as e:
+            status = 400
+            self.send_json(400, {"error": f"campo faltando: {e}"})
+        except (ValueError, IndexError, TypeError, re.error) as e:
+            status = 400
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            logger.error(f"Servidor: erro em {method} {url.path}: {e}", exc_info=True)
+            self.send_json(500, {"error": str(e)})
+        finally:
+            if endpoint != "desconhecido":
+                self.server.service.record(endpoint, (time.perf_counter() - t0) * 1000, status < 400)
+
+    # ---------------- Respostas ----------------
+    def send_body(self, status: int, body: bytes, content_type: str, etag: str = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")  # revalida: 304 enquanto o documento não mudar
+        self.end_headers()
+        self.wfile.write(body)
+        return status
+
+    def send_json(self, status: int, value) -> int:
+        return self.send_body(status, json.dumps(value, ensure_ascii=False).encode("utf-8"),
+                              "application/json; charset=utf-8")
+
+    def send_cached(self, body: bytes, content_type: str, etag: str) -> int:
+        """Resposta que o cliente pode guardar: If-None-Match igual à revisão atual devolve 304 sem corpo."""
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return 304
+        return self.send_body(200, body, content_type, etag)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > SERVER_MAX_BODY:
+            raise ValueError("corpo da requisição grande demais")
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("o corpo deve ser um objeto JSON")
+        return body
+
+    # ---------------- Rotas ----------------
+    def route_open(self, query):
+        return self.send_json(200, self.server.service.open(self.read_json()["path"]))
+
+    def route_metrics(self, query):
+        return self.send_json(200, self.server.service.snapshot_metrics())
+
+    def route_info(self, doc_id, query):
+        service = self.server.service
+        return self.send_json(200, service.describe(doc_id, service.document(doc_id)))
+
+    def route_render(self, doc_id, pno, query):
+        zoom = float(query.get("zoom", ["1"])[0])
+        clip = query.get("clip", [None])[0]
+        if clip is not None:
+            clip = tuple(float(v) for v in clip.split(","))
+            if len(clip) != 4:
+                raise ValueError("clip deve ser x0,y0,x1,y1")
+        png, revision = self.server.service.render(doc_id, int(pno), zoom, clip)
+        etag = f'"{doc_id}-{revision}-{pno}-{zoom:g}-{clip}"'
+        return self.send_cached(png, "image/png", etag)
+
+    def route_words(self, doc_id, pno, query):
+        data, revision = self.server.service.words(doc_id, int(pno))
+        return self.send_cached(data, "application/json; charset=utf-8", f'"{doc_id}-{revision}-{pno}-w"')
+
+    def route_replace(self, doc_id, query):
+        return self.send_json(200, self.server.service.replace(doc_id, self.read_json()))
+
+    def route_save(self, doc_id, query):
+        body = self.read_json()
+        return self.send_json(200, self.server.service.save(doc_id, body.get("path"), body.get("profile", "fast")))
+
+    def route_close(self, doc_id, query):
+        self.server.service.close(doc_id)
+        return self.send_json(200, {"closed": doc_id})
+
+
+def serve_main(argv) -> int:
+    """python editor_trial.py serve [--port N]: servidor HTTP local de renderização/edição, sem janela."""
+    parser = argparse.ArgumentParser(prog="editor_trial.py serve",
+                                     description="Serviço HTTP local: abrir, renderizar, palavras, substituir e salvar.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--docs", type=int, default=8, help="documentos abertos por processo (LRU)")
+    parser.add_argument("--cache-mb", type=int, default=256, help="cache de respostas (PNG/palavras)")
+    parser.add_argument("--output-dir", help="pasta onde POST /save pode gravar (sem ela, /save só com --allow-overwrite)")
+    parser.add_argument("--allow-overwrite", action="store_true",
+                        help="POST /save sem 'path' regrava o arquivo original")
+    parser.add_argument("--max-edited", type=int, default=16,
+                        help="documentos com edições não salvas ao mesmo tempo (além disso: 503)")
+    args = parser.parse_args(argv)
+    if args.output_dir and not os.path.isdir(args.output_dir):
+        print(f"Erro: pasta de saída não encontrada: {args.output_dir}", file=sys.stderr)
+        return 2
+
+    service = DocumentService(args.workers, args.docs, args.cache_mb * 1024 * 1024,
+                              args.output_dir, args.allow_overwrite, args.max_edited)
+    try:
+        server = ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+    except OSError as e:
+        service.shutdown()
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+    server.daemon_threads = True
+    server.service = service
+    print(f"Servidor em http://{args.host}:{server.server_port}/ ({args.workers} processo(s)); Ctrl+C encerra")
+    logger.info(f"Servidor iniciado em {args.host}:{server.server_port} com {args.workers} processo(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+        logger.info("Servidor encerrado")
+    return 0
+# ====================================================
+
+
+# ================== ESTADO DA LICENÇA ==================
+class LicenseState:
+    """
+    license.json lido uma vez na abertura e mantido em memória.
+    Campos faltando ou inválidos são completados na leitura; o arquivo só é regravado quando algo
+    mudou, e de forma atômica (arquivo temporário + os.replace): uma queda no meio não o corrompe.
+    """
+
+    def __init__(self, path: str, data: dict, dirty: bool = False):
+        self.path = path
+        self.data = data
+        self.dirty = dirty
+
+    @classmethod
+    def load(cls, path: str, trial_days: int, trial_uses: int) -> "LicenseState":
+        now = datetime.datetime.now()
+        defaults = {
+            "trial_expire": (now + datetime.timedelta(days=trial_days)).isoformat(),
+            "install_date": now.isoformat(),
+            "uses": 0,
+            "max_uses": trial_uses,
+            "activated": False,
+            "key": ""
+        }
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("conteúdo inesperado")
+            dirty = False
+        except FileNotFoundError:
+            data, dirty = {}, True
+        except (OSError, ValueError) as e:
+            logger.error(f"Erro lendo license.json: {e}")
+            data, dirty = {}, True
+        # garantir campos mínimos caso arquivo editado manualmente
+        for name, value in defaults.items():
+            if name not in data:
+                data[name] = value
+                dirty = True
+        try:
+            datetime.datetime.fromisoformat(data["trial_expire"])
+        except (TypeError, ValueError):
+            data["trial_expire"] = defaults["trial_expire"]
+            dirty = True
+        return cls(path, data, dirty)
+
+    @property
+    def activated(self) -> bool:
+        return bool(self.data.get("activated", False))
+
+    @property
+    def days_left(self) -> int:
+        expire = datetime.datetime.fromisoformat(self.data["trial_expire"])
+        return max((expire - datetime.datetime.now()).days, 0)
+
+    @property
+    def uses_left(self) -> int:
+        return max(int(self.data.get("max_uses", 0)) - int(self.data.get("uses", 0)), 0)
+
+    def use_trial(self):
+        self.data["uses"] = int(self.data.get("uses", 0)) + 1
+        self.dirty = True
+
+    def activate(self, key: str):
+        self.data["activated"] = True
+        self.data["key"] = key
+        self.dirty = True
+
+    def save(self) -> bool:
+        """Grava se algo mudou. False se a gravação falhou (o estado em memória continua valendo)."""
+        if not self.dirty:
+            return True
+        tmp = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.error(f"Erro gravando license.json: {e}")
+            return False
+        self.dirty = False
+        return True
 # ====================================================
 
 
@@ -66,22 +2829,20 @@ class LicenseMenu:
     TRIAL_USES = 30
     SALT = "PDFEditorSecret2025"  # diferente do outro app — garante chaves distintas
 
-    def __init__(self, root: tb.Window):
+    def __init__(self, root: "tb.Window"):
         self.root = root
 
         # pasta e arquivo onde armazenamos license/trial
-        self.lic_dir = os.path.join(os.getenv("APPDATA") or os.path.expanduser("~"), "PDFEditorApp")
-        os.makedirs(self.lic_dir, exist_ok=True)
+        self.lic_dir = APP_DATA_DIR
         self.lic_path = os.path.join(self.lic_dir, "license.json")
 
-        # inicializa/garante arquivo
-        self.init_license_file()
-
-        # lê licença atual
-        self.lic = self.read_license()
+        # lido uma vez; só grava se o arquivo não existia ou estava incompleto
+        self.state = LicenseState.load(self.lic_path, self.TRIAL_DAYS, self.TRIAL_USES)
+        self.state.save()
+        STARTUP.mark("licença")
 
         # se já ativado, pular tela de licença e iniciar app
-        if self.lic.get("activated", False):
+        if self.state.activated:
             logger.info("Aplicativo já ativado — iniciando editor.")
             PDFEditorApp(self.root)
             return
@@ -124,7 +2885,9 @@ SOFTWARE.
         hw_frame = tb.Frame(self.frame)
         hw_frame.pack(fill="x", pady=(6,4))
         tb.Label(hw_frame, text="HWID da máquina:", font=("Segoe UI", 10)).pack(side=tk.LEFT, padx=(0,6))
-        self.hwid_var = tk.StringVar(value=self.get_hwid())
+        self.hwid_var = tk.StringVar()
+        # o HWID pode demorar (consulta os adaptadores de rede): preenchido depois do primeiro desenho
+        self.root.after_idle(lambda: self.hwid_var.set(self.get_hwid()))
         # usar tk.Entry para fácil controle do estado readonly
         self.hwid_entry = tk.Entry(hw_frame, textvariable=self.hwid_var, width=40, font=("Segoe UI", 10), fg="black")
         self.hwid_entry.pack(side=tk.LEFT, padx=(0,6))
@@ -173,102 +2936,26 @@ SOFTWARE.
             logger.error(f"Erro ao copiar HWID: {e}")
             messagebox.showerror("Erro", "Não foi possível copiar o HWID.")
 
-    def init_license_file(self):
-        """Garante que license.json exista com campos mínimos."""
-        if not os.path.exists(self.lic_path):
-            expire = (datetime.datetime.now() + datetime.timedelta(days=self.TRIAL_DAYS)).isoformat()
-            data = {
-                "trial_expire": expire,
-                "install_date": datetime.datetime.now().isoformat(),
-                "uses": 0,
-                "max_uses": self.TRIAL_USES,
-                "activated": False,
-                "key": ""
-            }
-            with open(self.lic_path, "w", encoding="utf-8") as f:
-                json.dump(data, f)
-
-    def read_license(self) -> dict:
-        try:
-            with open(self.lic_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            # garantir campos mínimos caso arquivo editado manualmente
-            changed = False
-            if "trial_expire" not in data:
-                data["trial_expire"] = (datetime.datetime.now() + datetime.timedelta(days=self.TRIAL_DAYS)).isoformat()
-                changed = True
-            if "install_date" not in data:
-                data["install_date"] = datetime.datetime.now().isoformat()
-                changed = True
-            if "uses" not in data:
-                data["uses"] = 0
-                changed = True
-            if "max_uses" not in data:
-                data["max_uses"] = self.TRIAL_USES
-                changed = True
-            if "activated" not in data:
-                data["activated"] = False
-                changed = True
-            if "key" not in data:
-                data["key"] = ""
-                changed = True
-            if changed:
-                self.write_license(data)
-            return data
-        except Exception as e:
-            logger.error(f"Erro lendo license.json: {e}")
-            # recria
-            self.init_license_file()
-            return self.read_license()
-
-    def write_license(self, data: dict):
-        try:
-            with open(self.lic_path, "w", encoding="utf-8") as f:
-                json.dump(data, f)
-        except Exception as e:
-            logger.error(f"Erro gravando license.json: {e}")
-
     # ---------- Trial helpers ----------
-    def trial_days_left(self) -> int:
-        data = self.read_license()
-        try:
-            expire = datetime.datetime.fromisoformat(data["trial_expire"])
-        except Exception:
-            expire = datetime.datetime.now() + datetime.timedelta(days=self.TRIAL_DAYS)
-            data["trial_expire"] = expire.isoformat()
-            self.write_license(data)
-        days_left = (expire - datetime.datetime.now()).days
-        return max(days_left, 0)
-
-    def trial_uses_left(self) -> int:
-        data = self.read_license()
-        uses = int(data.get("uses", 0))
-        max_uses = int(data.get("max_uses", self.TRIAL_USES))
-        return max(max_uses - uses, 0)
-
     def update_trial_info_text(self):
-        days = self.trial_days_left()
-        uses_left = self.trial_uses_left()
-        self.trial_info_var.set(f"Trial: {days} dia(s) restante(s)  •  Aberturas restantes: {uses_left}")
+        self.trial_info_var.set(f"Trial: {self.state.days_left} dia(s) restante(s)  •  "
+                                f"Aberturas restantes: {self.state.uses_left}")
 
     # ---------- Ações de UI ----------
     def continue_trial(self):
-        data = self.read_license()
-        if data.get("activated", False):
+        if self.state.activated:
             # caso já ativado, iniciar
             self.start_editor()
             return
 
-        days_left = self.trial_days_left()
-        uses_left = self.trial_uses_left()
-        if days_left <= 0 or uses_left <= 0:
+        if self.state.days_left <= 0 or self.state.uses_left <= 0:
             messagebox.showwarning("Trial Expirado", "O período de trial ou número de execuções expirou. Insira uma chave para continuar.")
             return
 
         # incrementar uso e salvar
-        data["uses"] = int(data.get("uses", 0)) + 1
-        self.write_license(data)
-        logger.info(f"Continuando trial. Uso incrementado: {data['uses']}")
+        self.state.use_trial()
+        self.state.save()
+        logger.info(f"Continuando trial. Uso incrementado: {self.state.data['uses']}")
         self.start_editor()
 
     def start_editor(self):
@@ -313,10 +3000,8 @@ SOFTWARE.
         hwid = self.get_hwid()
         expected = hashlib.sha256((hwid + self.SALT).encode()).hexdigest().upper()
         if key == expected:
-            data = self.read_license()
-            data["activated"] = True
-            data["key"] = key
-            self.write_license(data)
+            self.state.activate(key)
+            self.state.save()
             messagebox.showinfo("Ativado", "Licença ativada com sucesso! Obrigado.")
             logger.info("Aplicativo ativado via chave.")
             # iniciar editor
@@ -327,36 +3012,125 @@ SOFTWARE.
 
 # ================== EDITOR DE PDF (mantive íntegro) ==================
 class PDFEditorApp:
-    def __init__(self, root: tb.Window):
+    RENDER_CACHE_BYTES = 256 * 1024 * 1024  # orçamento do cache de páginas renderizadas
+    PREFETCH_AHEAD = 3    # páginas seguintes pré-renderizadas em segundo plano
+    PREFETCH_BEHIND = 1   # páginas anteriores pré-renderizadas em segundo plano
+    TILED_MIN_PIXELS = 3_000_000  # acima disso (página inteira no zoom atual) renderiza em blocos
+    TILE_SIZE = 512               # lado do bloco (pixels de tela)
+    TILE_MARGIN = 256             # margem renderizada além da área visível
+    PROGRESSIVE_RENDER = True     # mostra prévia barata antes do bitmap nítido
+    PREVIEW_SCALE = 0.25          # resolução relativa da prévia em baixa resolução
+    CONTINUOUS_GAP = 8            # espaço entre páginas no modo contínuo (pontos PDF)
+    CONTINUOUS_BUFFER = 1         # páginas mantidas como imagem além das visíveis (modo contínuo)
+    THUMB_WIDTH = 130             # largura da barra de miniaturas (pixels)
+    THUMB_SLOT = 170              # altura reservada para cada miniatura (pixels)
+    THUMB_CACHE_BYTES = 32 * 1024 * 1024  # orçamento do cache de miniaturas
+    UNDO_MEMORY_BYTES = 64 * 1024 * 1024  # histórico de desfazer em memória; acima disso vai para disco
+    UNDO_SPILL_TO_DISK = True             # False: entradas antigas são descartadas em vez de ir para disco
+    DISK_CACHE_ENABLED = True             # guarda bitmaps em disco (APP_DATA_DIR/render_cache) entre sessões
+    DISK_CACHE_BYTES = 1024 * 1024 * 1024 # limite do cache em disco
+    OPEN_DIALOG_DELAY = 0.4               # segundos até mostrar o progresso da abertura
+
+    def __init__(self, root: "tb.Window"):
         self.root = root
-        self.doc = None
-        self.pdf_path = None
+        # documento, objetos sobrepostos e histórico vivem na sessão; a janela só reage aos ganchos
+        self.session = EditorSession(self.UNDO_MEMORY_BYTES, self.UNDO_SPILL_TO_DISK)
+        self.session.on_page_changed = self.page_changed
+        self.session.on_object_changed = self.overlay_sync_object
+        self.session.on_object_removed = self.overlay_remove
+        self.session.on_edit = self.journal_write
+        self._open_job = None    # OpenJob em andamento
+        self._open_temp = None   # OpenJob do documento aberto (dona da pasta temporária)
+        self._open_dialog = None
+        self._open_on_loaded = None
         self.current_page = 0
         self.scale = None  # factor de zoom (1.0 padrão)
-        self.words = []    # palavras extraídas da página atual (em coordenadas de PDF)
         self.photo_image = None
 
-        # Histórico (undo/redo) guarda (doc_bytes, objects_state)
-        self.undo_stack = []
-        self.redo_stack = []
+        # Cache de bitmaps renderizados (LRU limitado por bytes)
+        self.render_cache = RenderCache(self.RENDER_CACHE_BYTES)
+        self.doc_revision = 0     # incrementa quando o documento inteiro é trocado (abrir outro arquivo)
+        self.disk_cache = None       # bitmaps em disco, compartilhados entre sessões (páginas sem edição)
+        if self.DISK_CACHE_ENABLED:
+            try:
+                self.disk_cache = DiskRenderCache(os.path.join(APP_DATA_DIR, "render_cache"), self.DISK_CACHE_BYTES)
+            except OSError as e:
+                logger.warning(f"Cache em disco desativado: {e}")
+
+        # Pré-renderização das páginas vizinhas (processo com handle próprio do arquivo)
+        self.prefetcher = None
+        self._prefetch_poll_id = None
+
+        # Renderização em blocos (zoom alto): só a área visível + margem
+        self.tiled = False
+        self.tile_items = {}  # (tx, ty) -> id da imagem no canvas
+        self._view_update_id = None
+
+        # Renderização progressiva (prévia -> bitmap nítido)
+        self.page_item = None       # id da imagem da página no canvas
+        self._shown_view = None     # (página, zoom) exibidos por último
+        self._pending_refine = None # chave de cache aguardando a segunda passada
+        self._refine_id = None
+        self._preview_photo = None  # imagem do Tk reutilizada pelas prévias
 
-        # Objetos sobrepostos (não gravados no PDF até salvar)
-        # cada objeto: {"page": int, "x": float (pdf coords), "y": float (pdf coords top), "text": str, "size": int, "canvas_id": int}
-        self.objects = []
+        # Camada retida de objetos: itens do canvas vivem enquanto o objeto existir
+        self._overlay_pages = set()  # páginas cujos itens estão visíveis
+        self._overlay_layout = {}    # página -> (zoom, contínuo) em que os itens dela foram posicionados
+
+        # Modo contínuo: páginas empilhadas; só as visíveis (+ margem) viram imagem do Tk
+        self.continuous = False
+        self.page_tops = None        # topo de cada página na pilha (pontos PDF)
+        self.page_sizes = None       # (largura, altura) de cada página (pontos PDF)
+        self.layout_size = (0, 0)    # tamanho total da pilha (pontos PDF)
+        self.cont_items = {}         # página -> (chave de cache, id no canvas, é_imagem)
+        self._cont_zoom = None
+
+        # Miniaturas: geradas sob demanda (só as visíveis na barra), cache próprio e limitado
+        self.thumb_cache = RenderCache(self.THUMB_CACHE_BYTES)
+        self.thumb_items = {}         # página -> (chave de cache, [ids no canvas], é_imagem)
+        self._thumb_update_id = None
+        self._thumb_followed = None   # última página atual para a qual a barra rolou
+
+        # Salvamento num processo separado (a interface continua livre enquanto grava)
+        self._save_executor = None
+        self._save_job = None         # SaveJob em andamento
+        self._save_poll_id = None
+        self._merge_job = None        # MergeJob (mala direta) em andamento
+
+        # Diário de edições (recuperação após queda) e reaplicação dele na abertura
+        self.journal = None
+        self._save_journal_id = None # id do salvamento incremental em andamento, no diário
+        self._save_failed = False    # último salvamento falhou ou foi cancelado: o diário fica ao fechar
+        self._close_after_save = False
 
         # estado da entry ativa (criar/editar/mover)
         self.active_entry = None
         self.entry_window = None
         self.entry_mode = None   # 'new', 'edit', 'move_pdf'
-        self.edit_obj_index = None
-        self.moving_pdf_word = None  # {"rect": fitz.Rect, "word": str}
+        self.edit_obj_id = None
+        self.moving_pdf_word = None  # {"page": int, "rect": fitz.Rect, "word": str}
 
-        # fonte e alinhamento
+        # fonte
         self.font_size = 12
-        self.baseline_factor = 0.8
+
+        # palavras do PDF: destaque ao passar o mouse e seleção por retângulo (Shift + arrastar)
+        self._hover_word = None       # (página, palavra) destacada
+        self._select_start = None     # (página, x, y em coords PDF) do início do retângulo
+        self.selected_words = None    # (página, [palavras]) da última seleção
+
+        # Busca: índice de texto do documento inteiro, montado em segundo plano
+        self.search_index = None
+        self.search_query = None      # consulta normalizada da última busca
+        self.search_hit = None        # (página, [retângulos PDF], índice do retângulo atual)
+        self._search_poll_id = None
+
+        # Painel de desempenho (F12) sobre o canvas; Ctrl+F12 exporta o trace
+        self.perf_overlay = False
+        self._perf_overlay_id = None
 
         # arraste de objetos
-        self.dragging_obj_index = None
+        self.dragging_obj_id = None
+        self._drag_start_state = None  # estado do objeto antes do arraste (para o histórico)
         self.drag_offset_x = 0
         self.drag_offset_y = 0
 
@@ -366,10 +3140,17 @@ class PDFEditorApp:
 
         tb.Button(top_frame, text="📂 Abrir PDF", bootstyle="info", command=self.open_pdf).pack(side=tk.LEFT, padx=4)
         tb.Button(top_frame, text="💾 Salvar PDF", bootstyle="success", command=self.save_pdf).pack(side=tk.LEFT, padx=4)
+        # perfil de salvamento (tamanho do arquivo x tempo)
+        self.save_profile = tk.StringVar(value=SAVE_PROFILES["fast"]["label"])
+        tb.Combobox(top_frame, textvariable=self.save_profile, state="readonly", width=13,
+                    values=[p["label"] for p in SAVE_PROFILES.values()]).pack(side=tk.LEFT, padx=4)
+        tb.Button(top_frame, text="📋 Modelo", bootstyle="secondary", command=self.save_as_template).pack(side=tk.LEFT, padx=4)
+        tb.Button(top_frame, text="📨 Preencher", bootstyle="secondary", command=self.run_merge).pack(side=tk.LEFT, padx=4)
         tb.Button(top_frame, text="⏮ Anterior", bootstyle="secondary", command=self.prev_page).pack(side=tk.LEFT, padx=4)
         tb.Button(top_frame, text="⏭ Próxima", bootstyle="secondary", command=self.next_page).pack(side=tk.LEFT, padx=4)
         tb.Button(top_frame, text="🔍 Zoom +", bootstyle="secondary", command=self.zoom_in).pack(side=tk.LEFT, padx=4)
         tb.Button(top_frame, text="🔍 Zoom -", bootstyle="secondary", command=self.zoom_out).pack(side=tk.LEFT, padx=4)
+        tb.Button(top_frame, text="📜 Contínuo", bootstyle="secondary", command=self.toggle_continuous).pack(side=tk.LEFT, padx=4)
         tb.Button(top_frame, text="↩️ Desfazer", bootstyle="warning", command=self.undo_edit).pack(side=tk.LEFT, padx=4)
         tb.Button(top_frame, text="🔄 Refazer", bootstyle="info", command=self.redo_edit).pack(side=tk.LEFT, padx=4)
 
@@ -377,11 +3158,42 @@ class PDFEditorApp:
         tb.Button(top_frame, text="➕ Letra", bootstyle="info", command=self.increase_font_button).pack(side=tk.RIGHT, padx=4)
         tb.Button(top_frame, text="➖ Letra", bootstyle="info", command=self.decrease_font_button).pack(side=tk.RIGHT, padx=4)
 
+        self.save_status = tb.Label(top_frame, text="", bootstyle="secondary")
+        self.save_status.pack(side=tk.LEFT, padx=8)
+
         self.page_label = tb.Label(top_frame, text="Página: -/-", bootstyle="inverse-dark")
         self.page_label.pack(side=tk.RIGHT, padx=10)
 
+        # Busca no documento inteiro
+        tb.Button(top_frame, text="🔁 Substituir", bootstyle="secondary", command=self.open_replace_dialog).pack(side=tk.RIGHT, padx=4)
+        tb.Button(top_frame, text="🔎 Buscar", bootstyle="secondary", command=self.find_next).pack(side=tk.RIGHT, padx=4)
+        self.search_var = tk.StringVar()
+        self.search_entry = tb.Entry(top_frame, textvariable=self.search_var, width=18)
+        self.search_entry.pack(side=tk.RIGHT, padx=4)
+        self.search_entry.bind("<Return>", lambda e: self.find_next())
+        self.search_status = tb.Label(top_frame, text="", bootstyle="secondary")
+        self.search_status.pack(side=tk.RIGHT, padx=4)
+
+        body = tb.Frame(root)
+        body.pack(fill=tk.BOTH, expand=True)
+
+        # ---------------- Barra de miniaturas ----------------
+        thumb_frame = tb.Frame(body)
+        thumb_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(8, 0), pady=6)
+        thumb_scroll = tk.Scrollbar(thumb_frame, orient=tk.VERTICAL)
+        thumb_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.thumb_canvas = tk.Canvas(thumb_frame, bg="#222222", width=self.THUMB_WIDTH,
+                                      highlightthickness=0, yscrollcommand=thumb_scroll.set)
+        self.thumb_canvas.pack(side=tk.LEFT, fill=tk.Y)
+        thumb_scroll.config(command=self.on_thumb_scroll)
+        self.thumb_canvas.bind("<Button-1>", self.on_thumb_click)
+        self.thumb_canvas.bind("<Configure>", lambda e: self.schedule_thumb_update())
+        self.thumb_canvas.bind("<MouseWheel>", self.on_thumb_wheel)
+        self.thumb_canvas.bind("<Button-4>", self.on_thumb_wheel)
+        self.thumb_canvas.bind("<Button-5>", self.on_thumb_wheel)
+
         # ---------------- Canvas + Scrollbars ----------------
-        canvas_frame = tb.Frame(root)
+        canvas_frame = tb.Frame(body)
         canvas_frame.pack(fill=tk.BOTH, expand=True, padx=8, pady=6)
 
         v_scroll = tk.Scrollbar(canvas_frame, orient=tk.VERTICAL)
@@ -394,62 +3206,341 @@ class PDFEditorApp:
                                 xscrollcommand=h_scroll.set)
         self.canvas.pack(fill=tk.BOTH, expand=True)
 
-        v_scroll.config(command=self.canvas.yview)
-        h_scroll.config(command=self.canvas.xview)
+        v_scroll.config(command=self.on_yscroll)
+        h_scroll.config(command=self.on_xscroll)
+        self.canvas.bind("<Configure>", lambda e: self.schedule_view_update())
+        self.canvas.bind("<MouseWheel>", self.on_mousewheel)
+        self.canvas.bind("<Button-4>", self.on_mousewheel)
+        self.canvas.bind("<Button-5>", self.on_mousewheel)
 
         # Eventos principais
         self.canvas.bind("<Button-1>", self.on_click_canvas)
         # eventos para mover objetos (canvas text)
         self.canvas.bind("<B1-Motion>", self.on_canvas_motion)
         self.canvas.bind("<ButtonRelease-1>", self.on_canvas_release)
+        self.canvas.bind("<Motion>", self.on_canvas_hover)
+        self.canvas.bind("<Shift-Button-1>", self.start_word_selection)
+        self.canvas.bind("<Leave>", lambda e: self.clear_word_hover())
+        # um único binding por classe (tag 'obj') vale para todos os objetos sobrepostos
+        self.canvas.tag_bind("obj", "<Button-1>", self.on_object_click)
+        self.canvas.tag_bind("obj", "<B1-Motion>", self.on_object_drag)
+        self.canvas.tag_bind("obj", "<ButtonRelease-1>", self.on_object_release)
+        self.canvas.tag_bind("obj", "<Double-1>", self.on_object_double_click)
 
         # atalhos
         self.root.bind("<Control-z>", lambda e: self.undo_edit())
         self.root.bind("<Control-y>", lambda e: self.redo_edit())
+        self.root.bind("<Control-c>", self.copy_selected_words)
+        self.root.bind("<Control-f>", lambda e: self.search_entry.focus_set())
+        self.root.bind("<F3>", lambda e: self.find_next())
+        self.root.bind("<Control-h>", lambda e: self.open_replace_dialog())
+        self.root.bind("<F12>", lambda e: self.toggle_perf_overlay())
+        self.root.bind("<Control-F12>", lambda e: self.export_perf_trace())
         self.root.bind("<Tab>", self.increase_font_size)
         self.root.bind("<Shift-Tab>", self.decrease_font_size)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        logger.info("Editor iniciado")
+        self.root.after(200, self.offer_recovery)
+
+    def on_close(self):
+        job = self._save_job
+        if job is not None:
+            # a gravação ainda não terminou (ou nem começou): fechar agora perderia o salvamento
+            if job.stage != "write":
+                answer = messagebox.askyesnocancel(
+                    "Salvamento em andamento",
+                    f"{job.status}\n\nSim: esperar o salvamento terminar e fechar.\n"
+                    "Não: cancelar o salvamento e fechar (as edições ficam no diário).")
+                if answer is None:
+                    return
+                if not answer and job.cancel():
+                    self._save_job = None
+                    if self._save_poll_id is not None:
+                        self.root.after_cancel(self._save_poll_id)
+                    self._save_failed = True
+                    logger.info(f"Salvamento em {job.target} cancelado ao fechar")
+            if self._save_job is not None:
+                self._close_after_save = True
+                self.save_status.config(text=f"💾 {job.status} — fecha ao terminar")
+                return
+        if self.disk_cache:
+            self.disk_cache.close()
+        if self._save_executor:
+            # não interrompe um salvamento no meio da gravação
+            self._save_executor.shutdown(wait=True)
+        if self._merge_job:
+            self._merge_job.cancel()
+        if self.journal:
+            # fechamento normal: nada a recuperar na próxima abertura, a menos que um salvamento não tenha terminado
+            self.journal.close(delete=not self._save_failed)
+        if self._open_job:
+            self._open_job.cancel()
+            self._open_job.discard()
+        if self._perf_overlay_id is not None:
+            self.root.after_cancel(self._perf_overlay_id)
+        self.close_document()
+        self.session.shutdown()
+        self.root.destroy()
+
+    # ---------------- Estado do documento (EditorSession) ----------------
+    @property
+    def doc(self):
+        return self.session.doc
+
+    @property
+    def objects(self):
+        return self.session.objects
+
+    @property
+    def dirty_pages(self):
+        return self.session.dirty_pages
+
+    @property
+    def pdf_path(self):
+        return self.session.path
+
+    @property
+    def work_path(self):
+        return self.session.work_path
+
+    @property
+    def doc_fingerprint(self):
+        return self.session.fingerprint
+
+    def page_changed(self, pno: int):
+        """Gancho da sessão: a página mudou; descarta só os bitmaps e destaques dela."""
+        self.render_cache.invalidate_page(pno)
+        self.thumb_cache.invalidate_page(pno)
+        if self.selected_words and self.selected_words[0] == pno:
+            self.clear_word_selection()
+        self.clear_word_hover()
+        if self.search_index:
+            self.search_index.invalidate(pno)
+        if self.search_hit and self.search_hit[0] == pno:
+            self.clear_search_hit()
+
+    def document_changed(self):
+        """Documento inteiro foi trocado (abrir outro arquivo): invalida todo o cache."""
+        self.doc_revision += 1
+        self.render_cache.clear()
+        self.thumb_cache.clear()
+        self.page_tops = None
+        self.clear_word_selection()
+        self.clear_word_hover()
+        self.clear_search_hit()
+
+    def display_list(self, pno: int):
+        return self.session.display_list(pno)
+
+    def cache_key(self, pno: int, zoom: float):
+        return (pno, round(zoom, 4), self.doc_revision, self.session.page_revisions.get(pno, 0))
+
+    # ---------------- Cache em disco ----------------
+    def disk_name(self, pno: int, variant: str):
+        """Nome no cache em disco, ou None se o cache está desligado ou a página foi editada."""
+        if self.disk_cache is None or self.doc_fingerprint is None or pno in self.dirty_pages:
+            return None
+        return f"{self.doc_fingerprint}_{pno}_{variant}.ppm"
+
+    def disk_has(self, pno: int, variant: str) -> bool:
+        name = self.disk_name(pno, variant)
+        return name is not None and self.disk_cache.has(name)
+
+    def load_from_disk(self, cache, key, pno: int, variant: str):
+        """Carrega o bitmap do disco para o cache em memória 'cache'. Devolve a entrada ou None."""
+        name = self.disk_name(pno, variant)
+        path = self.disk_cache.get(name) if name else None
+        if path is None:
+            return None
+        try:
+            photo = tk.PhotoImage(file=path, format="PPM")
+        except tk.TclError:
+            return None  # removido/corrompido nesse meio tempo: renderiza de novo
+        cached = (photo, photo.width(), photo.height())
+        cache.put(key, cached, photo.width() * photo.height() * 3)
+        return cached
+
+    def save_to_disk(self, pno: int, variant: str, frame):
+        name = self.disk_name(pno, variant)
+        if name and frame[0] == "ppm":
+            self.disk_cache.put(name, frame[3])
+
+    def page_cached(self, pno: int, zoom: float):
+        """Bitmap da página no cache em memória ou, se não estiver lá, no cache em disco."""
+        key = self.cache_key(pno, zoom)
+        return self.render_cache.get(key) or self.load_from_disk(self.render_cache, key, pno, f"{zoom:.4f}")
+
+    # ---------------- Pré-renderização ----------------
+    def schedule_prefetch(self):
+        """Pede ao worker as próximas/anteriores páginas no zoom atual (as que não estão no cache)."""
+        if not self.prefetcher:
+            return
+        zoom = self.scale or 1.0
+        if self.tiled:
+            # no modo em blocos as vizinhas também seriam enormes: não adianta pré-renderizar
+            self.prefetcher.keep_only(set())
+            return
+        wanted = []
+        for delta in list(range(1, self.PREFETCH_AHEAD + 1)) + [-d for d in range(1, self.PREFETCH_BEHIND + 1)]:
+            pno = self.current_page + delta
+            if 0 <= pno < len(self.doc) and pno not in self.dirty_pages \
+                    and self.render_cache.get(self.cache_key(pno, zoom)) is None \
+                    and not self.disk_has(pno, f"{zoom:.4f}"):
+                wanted.append(pno)
+        keys = {(pno, round(zoom, 4)) for pno in wanted}
+        if self._pending_refine:
+            keys.add(self._pending_refine[:2])
+        self.prefetcher.keep_only(keys)
+        for pno in wanted:
+            self.prefetcher.request(pno, zoom)
+        if self.prefetcher.pending and self._prefetch_poll_id is None:
+            self._prefetch_poll_id = self.root.after(40, self.poll_prefetch)
+
+    def poll_prefetch(self):
+        """Recolhe (na thread do Tk) os bitmaps prontos do worker e coloca no cache."""
+        self._prefetch_poll_id = None
+        if not self.prefetcher:
+            return
+        for result in self.prefetcher.collect():
+            if result[0] == "thumb":
+                self.store_thumb(result[1], result[2])
+            else:
+                self.store_rendered(result)
+        if self.continuous:
+            # troca os marcadores pelas páginas que acabaram de chegar
+            self.schedule_view_update()
+        key = self._pending_refine
+        if key is not None:
+            if self.render_cache.get(key) is not None:
+                self.refine_page()
+            elif key[:2] not in self.prefetcher.pending and self._refine_id is None:
+                # worker falhou ou foi cancelado: faz a 2ª passada aqui mesmo
+                self._refine_id = self.root.after(10, self.refine_page)
+        if self.prefetcher.pending:
+            self._prefetch_poll_id = self.root.after(40, self.poll_prefetch)
+
+    def store_rendered(self, result):
+        """Converte o frame vindo do worker em imagem do Tk e guarda no cache. Devolve a entrada ou None."""
+        pno, zoom, frame = result
+        if pno in self.dirty_pages:
+            # página editada enquanto o worker renderizava: resultado obsoleto
+            return None
+        key = self.cache_key(pno, zoom)
+        cached = self.render_cache.get(key)
+        if cached is None:
+            cached = (frame_to_photo(frame), frame[1], frame[2])
+            self.render_cache.put(key, cached, frame_nbytes(frame))
+            self.save_to_disk(pno, f"{zoom:.4f}", frame)
+        return cached
+
+    def undo_edit(self):
+        try:
+            entry = self.session.undo()
+        except Exception as e:
+            logger.error(f"Erro ao desfazer: {e}")
+            messagebox.showerror("Erro", f"Falha ao desfazer:\n{e}")
+            return
+        if entry is None:
+            messagebox.showinfo("Desfazer", "Nenhuma ação para desfazer.")
+            return
+        self.render_page()
+        logger.info(f"Desfazer realizado: {entry.label}")
+
+    def redo_edit(self):
+        try:
+            entry = self.session.redo()
+        except Exception as e:
+            logger.error(f"Erro ao refazer: {e}")
+            messagebox.showerror("Erro", f"Falha ao refazer:\n{e}")
+            return
+        if entry is None:
+            messagebox.showinfo("Refazer", "Nenhuma ação para refazer.")
+            return
+        self.render_page()
+        logger.info(f"Refazer realizado: {entry.label}")
 
-        logger.info("Editor iniciado")
+    # ---------------- Diário de edições / recuperação ----------------
+    def journal_write(self, record: dict):
+        if self.journal:
+            self.journal.append(record)
 
-    # ---------------- Estado / histórico ----------------
-    def save_state(self):
-        """Salva estado do documento + objetos para undo"""
-        if self.doc:
-            self.undo_stack.append((self.doc.tobytes(), deepcopy(self.objects)))
-            self.redo_stack.clear()
-            logger.debug("Estado salvo para undo")
+    def start_journal(self, path: str):
+        """Novo diário para o arquivo aberto; o da sessão anterior (outro arquivo) não é mais necessário."""
+        if self.journal:
+            self.journal.close(delete=True)
+            self.journal = None
+        name = f"{datetime.datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}.jsonl"
+        try:
+            self.journal = EditJournal(os.path.join(JOURNAL_DIR, name),
+                                       {"path": os.path.abspath(path), "fingerprint": self.doc_fingerprint})
+        except OSError as e:
+            logger.warning(f"Diário de edições desativado: {e}")
 
-    def undo_edit(self):
-        if not self.undo_stack:
-            messagebox.showinfo("Desfazer", "Nenhuma ação para desfazer.")
+    def offer_recovery(self):
+        """Na abertura: se sobrou o diário de uma sessão que caiu, oferece reaplicar as edições."""
+        for journal_path in EditJournal.leftovers():
+            try:
+                pending = EditJournal.pending_edits(EditJournal.load(journal_path))
+            except (OSError, KeyError, ValueError, TypeError, AttributeError) as e:
+                # registro malformado: fica de lado (.bad) para análise, sem travar a abertura
+                logger.warning(f"Diário ilegível {journal_path}: {e!r}")
+                self.set_journal_aside(journal_path)
+                continue
+            if pending is None:
+                EditJournal.remove(journal_path)
+                continue
+            path, fingerprint, edits = pending
+            if messagebox.askyesno("Recuperar edições",
+                                   f"O editor foi fechado sem salvar {len(edits)} edição(ões) em:\n{path}\n\n"
+                                   "Deseja reaplicá-las?"):
+                # o diário só é apagado depois que todas as edições voltaram (apply_journal); se a abertura
+                # falhar ou for cancelada ele continua lá e é oferecido de novo na próxima abertura
+                self.replay_journal(journal_path, path, fingerprint, edits)
+            else:
+                EditJournal.remove(journal_path)
+            # um diário por vez: os mais antigos ficam para a próxima abertura
             return
+
+    @staticmethod
+    def set_journal_aside(journal_path: str):
+        """Diário que não pode ser reaplicado: renomeado para .bad (guardado para análise, não oferecido de novo)."""
         try:
-            last_doc_bytes, last_objs = self.undo_stack.pop()
-            # salva atual para redo
-            self.redo_stack.append((self.doc.tobytes() if self.doc else None, deepcopy(self.objects)))
-            # restaura
-            self.doc = fitz.open("pdf", last_doc_bytes) if last_doc_bytes else None
-            self.objects = deepcopy(last_objs)
-            self.render_page()
-            logger.info("Desfazer realizado")
-        except Exception as e:
-            logger.error(f"Erro ao desfazer: {e}")
-            messagebox.showerror("Erro", f"Falha ao desfazer:\n{e}")
+            os.replace(journal_path, journal_path + ".bad")
+        except OSError:
+            EditJournal.remove(journal_path)
 
-    def redo_edit(self):
-        if not self.redo_stack:
-            messagebox.showinfo("Refazer", "Nenhuma ação para refazer.")
+    def replay_journal(self, journal_path: str, path: str, fingerprint: str, edits):
+        """Abre o arquivo original e reaplica as edições do diário, com uma única renderização no fim."""
+        if not os.path.exists(path):
+            messagebox.showerror("Erro", f"Arquivo não encontrado:\n{path}")
+            self.set_journal_aside(journal_path)
             return
+        self.load_document(path, on_loaded=lambda: self.apply_journal(journal_path, path, fingerprint, edits))
+
+    def apply_journal(self, journal_path: str, path: str, fingerprint: str, edits):
+        if self.doc_fingerprint != fingerprint:
+            # as posições gravadas no diário só valem para o mesmo conteúdo
+            messagebox.showerror("Erro", "O arquivo mudou desde a última sessão; as edições não podem ser reaplicadas.\n"
+                                 f"O diário foi guardado em:\n{journal_path}.bad")
+            self.set_journal_aside(journal_path)
+            return
+        started = time.perf_counter()
+        applied = 0
         try:
-            next_doc_bytes, next_objs = self.redo_stack.pop()
-            self.undo_stack.append((self.doc.tobytes() if self.doc else None, deepcopy(self.objects)))
-            self.doc = fitz.open("pdf", next_doc_bytes) if next_doc_bytes else None
-            self.objects = deepcopy(next_objs)
-            self.render_page()
-            logger.info("Refazer realizado")
+            for rec in edits:
+                self.session.apply_record(rec)
+                applied += 1
         except Exception as e:
-            logger.error(f"Erro ao refazer: {e}")
-            messagebox.showerror("Erro", f"Falha ao refazer:\n{e}")
+            logger.error(f"Recuperação interrompida no registro {applied + 1} ({rec.get('op')}): {e}")
+            messagebox.showerror("Erro", f"Só {applied} de {len(edits)} edição(ões) puderam ser reaplicadas:\n{e}\n\n"
+                                 f"O diário foi guardado em:\n{journal_path}.bad")
+            self.set_journal_aside(journal_path)
+        else:
+            EditJournal.remove(journal_path)
+        self.render_page()
+        logger.info(f"Recuperação: {applied} edição(ões) reaplicada(s) em {path} "
+                    f"em {(time.perf_counter() - started) * 1000:.0f} ms")
 
     # ---------------- Fonte / botões ----------------
     def increase_font_button(self):
@@ -475,78 +3566,316 @@ class PDFEditorApp:
 
     # ---------------- Abrir / Salvar ----------------
     def open_pdf(self):
+        if self._open_job is not None:
+            return
+        if self._save_job is not None:
+            # o salvamento lê o arquivo de trabalho do documento atual
+            messagebox.showinfo("Abrir", "Aguarde o salvamento terminar.")
+            return
         path = filedialog.askopenfilename(filetypes=[("Arquivos PDF", "*.pdf")])
-        if not path:
+        if path:
+            self.load_document(path)
+
+    def load_document(self, path: str, on_loaded=None):
+        """Abre em etapas: preparação em segundo plano (OpenJob), primeira página, depois o resto.
+        'on_loaded' é chamado quando o documento estiver aberto."""
+        if self._open_job is not None:
+            self._open_job.cancel()
+            self._open_job.discard()
+        self._open_job = OpenJob(path)
+        self._open_on_loaded = on_loaded
+        self.poll_open()
+
+    def poll_open(self):
+        """Acompanha a preparação; o diálogo de progresso só aparece se ela demorar."""
+        job = self._open_job
+        if not job.poll():
+            if self._open_dialog is None and time.perf_counter() - job.started > self.OPEN_DIALOG_DELAY:
+                self.show_open_dialog(job)
+            if self._open_dialog is not None:
+                label, bar = self._open_dialog[1:]
+                label.config(text=job.status)
+                if job.progress is None:
+                    bar.config(mode="indeterminate")
+                    bar.step(4)
+                else:
+                    bar.config(mode="determinate", value=job.progress * 100)
+            self.root.after(50, self.poll_open)
             return
+        self._open_job = None
+        if self._open_dialog is not None:
+            self._open_dialog[0].destroy()
+            self._open_dialog = None
+        if job.cancelled:
+            job.discard()
+            logger.info(f"Abertura cancelada: {job.path}")
+            return
+        if job.error is not None:
+            job.discard()
+            logger.error(f"Erro ao abrir PDF: {job.error}")
+            messagebox.showerror("Erro", f"Não foi possível abrir o PDF:\n{job.error}")
+            return
+        self.finish_open(job)
+
+    def show_open_dialog(self, job):
+        dlg = tk.Toplevel(self.root)
+        dlg.title("Abrindo PDF")
+        dlg.geometry("360x120")
+        dlg.transient(self.root)
+        tk.Label(dlg, text=os.path.basename(job.path), font=("Segoe UI", 10, "bold")).pack(pady=(8, 2))
+        label = tk.Label(dlg, text=job.status)
+        label.pack()
+        bar = tb.Progressbar(dlg, length=320, maximum=100)
+        bar.pack(pady=6)
+        tk.Button(dlg, text="Cancelar", width=10, command=job.cancel).pack()
+        dlg.protocol("WM_DELETE_WINDOW", job.cancel)
+        self._open_dialog = (dlg, label, bar)
+
+    def finish_open(self, job):
+        """Abre o arquivo preparado e mostra a página 1; workers, índice de busca e diário vêm depois."""
+        self.close_document()
         try:
-            self.doc = fitz.open(path)
-            self.pdf_path = path
-            self.current_page = 0
-            self.scale = None
-            self.words = []
-            self.objects.clear()
-            self.undo_stack.clear()
-            self.redo_stack.clear()
-            self.render_page()
-            logger.info(f"PDF aberto: {path}")
+            self.session.open(job.path, job.work_path, job.fingerprint)
         except Exception as e:
+            job.discard()
             logger.error(f"Erro ao abrir PDF: {e}")
             messagebox.showerror("Erro", f"Não foi possível abrir o PDF:\n{e}")
+            return
+        self._open_temp = job
+        self.search_query = None
+        self.current_page = 0
+        self.scale = None
+        self.document_changed()
+        self.overlay_reset()
+        self.thumb_canvas.delete("all")
+        self.thumb_items.clear()
+        self._thumb_followed = None
+        self.thumb_canvas.yview_moveto(0)
+        self.go_to_page(0)
+        self.root.update_idletasks()
+        first_page = time.perf_counter() - job.started
+        logger.info(f"PDF aberto: {job.path} ({len(self.doc)} páginas, {os.path.getsize(job.work_path) / 1e6:.1f} MB"
+                    f"{', copiado da rede' if job.copied else ''}{', reparado' if job.damaged else ''}); "
+                    f"primeira página em {first_page * 1000:.0f} ms")
+
+        # o que não é necessário para a primeira página: processos de renderização e busca, diário
+        self.prefetcher = PageRenderWorker(self.work_path)
+        self.search_index = SearchIndex(self.work_path, len(self.doc))
+        self.poll_search_index()
+        self.schedule_prefetch()
+        self.schedule_thumb_update()
+        self.start_journal(job.path)
+        logger.debug(f"Abertura concluída em {(time.perf_counter() - job.started) * 1000:.0f} ms")
+        if self._open_on_loaded:
+            self._open_on_loaded()
+
+    def close_document(self):
+        """Encerra os workers do documento atual e apaga a cópia temporária dele, se houver."""
+        if self.prefetcher:
+            self.prefetcher.shutdown()
+            self.prefetcher = None
+        if self.search_index:
+            self.search_index.shutdown()
+            self.search_index = None
+        self.session.close()
+        if self._open_temp:
+            self._open_temp.discard()
+            self._open_temp = None
 
     def save_pdf(self):
-        """Aplica os objetos no documento (gravando sobre as páginas) e salva em disco."""
+        """Aplica os objetos no documento e grava em disco num processo separado.
+
+        Salvando sobre o próprio arquivo aberto, a gravação é incremental (só os objetos
+        alterados são acrescentados ao fim do arquivo).
+        """
         if not self.doc:
             return
-        if not self.objects:
-            # Se não há objetos, apenas salvar doc atual
-            save_path = filedialog.asksaveasfilename(defaultextension=".pdf",
-                                                     filetypes=[("PDF", "*.pdf")])
-            if not save_path:
-                return
-            try:
-                self.doc.save(save_path)
-                messagebox.showinfo("Sucesso", f"PDF salvo em:\n{save_path}")
-            except Exception as e:
-                messagebox.showerror("Erro", f"Falha ao salvar:\n{e}")
-            return
-
-        # salvar estado antes de aplicar
-        self.save_state()
-        try:
-            # aplicamos todos os objetos no documento
-            for obj in self.objects:
-                page = self.doc[obj["page"]]
-                px = obj["x"]
-                py_top = obj["y"]
-                insert_y = py_top + obj["size"] * self.baseline_factor
-                page.insert_text((px, insert_y),
-                                 obj["text"],
-                                 fontsize=obj["size"],
-                                 fontname="helv",
-                                 color=(0, 0, 0))
-            save_path = filedialog.asksaveasfilename(defaultextension=".pdf",
-                                                     filetypes=[("PDF", "*.pdf")])
-            if not save_path:
-                return
-            self.doc.save(save_path)
-            # após aplicar e salvar, limpamos objetos (agora já estão embutidos no PDF)
-            self.objects.clear()
-            self.render_page()
-            messagebox.showinfo("Sucesso", f"PDF salvo em:\n{save_path}")
-            logger.info(f"PDF salvo com objetos em: {save_path}")
+        if self._save_job is not None:
+            messagebox.showinfo("Salvar", "Aguarde: um salvamento já está em andamento.")
+            return
+        save_path = filedialog.asksaveasfilename(defaultextension=".pdf",
+                                                 filetypes=[("PDF", "*.pdf")],
+                                                 initialdir=os.path.dirname(self.pdf_path or ""),
+                                                 initialfile=os.path.basename(self.pdf_path or ""))
+        if not save_path:
+            return
+        profile = next(key for key, p in SAVE_PROFILES.items() if p["label"] == self.save_profile.get())
+        same_file = bool(self.pdf_path) and \
+            os.path.normcase(os.path.abspath(save_path)) == os.path.normcase(os.path.abspath(self.pdf_path))
+        from_copy = self.work_path != self.pdf_path
+        incremental = same_file and not from_copy and profile == "fast" and self.doc.can_save_incrementally()
+        if same_file and not incremental and not from_copy:
+            # reescrever o arquivo que está aberto (aqui e nos workers) não é seguro
+            messagebox.showerror("Erro", "Sobre o arquivo aberto só é possível salvar de forma incremental "
+                                         "(perfil Rápido, se o PDF permitir).\nSalve com outro nome.")
+            return
+
+        baked = bool(self.session.objects)
+        if not self.bake_objects():
+            return
+
+        try:
+            # snapshot só do que difere do arquivo de origem; o processo de salvamento faz o resto
+            t0 = time.perf_counter()
+            xref_len, objects, streams = self.session.snapshot()
+            logger.debug(f"Snapshot para salvar: {len(objects)} objetos, {len(streams)} streams "
+                         f"em {(time.perf_counter() - t0) * 1000:.1f} ms")
+            if self._save_executor is None:
+                self._save_executor = ProcessPoolExecutor(max_workers=1,
+                                                          mp_context=multiprocessing.get_context("spawn"))
+            self._save_job = SaveJob(self._save_executor, self.work_path, save_path, len(self.doc),
+                                     (xref_len, objects, streams), profile, incremental)
+        except Exception as e:
+            # nada foi gravado: os objetos voltam a ser editáveis, como antes de clicar em salvar
+            logger.error(f"Erro ao iniciar o salvamento: {e}", exc_info=True)
+            if isinstance(e, BrokenProcessPool):
+                self._save_executor.shutdown(wait=False)
+                self._save_executor = None  # o próximo salvamento cria outro processo
+            if baked:
+                self.session.undo()
+                self.render_page()
+            messagebox.showerror("Erro", f"Falha ao salvar:\n{e}")
+            return
+        if incremental:
+            # concluído, o arquivo passa a conter tudo o que o diário tem até aqui
+            self._save_journal_id = uuid.uuid4().hex
+            self.journal_write({"op": "save_start", "id": self._save_journal_id})
+        self.poll_save()
+
+    def bake_objects(self) -> bool:
+        """Grava os objetos sobrepostos no documento (desfazer devolve páginas e objetos)."""
+        try:
+            if self.session.bake():
+                self.render_page()
         except Exception as e:
-            logger.error(f"Erro ao salvar PDF com objetos: {e}")
+            logger.error(f"Erro ao aplicar objetos no PDF: {e}")
             messagebox.showerror("Erro", f"Falha ao salvar:\n{e}")
+            return False
+        return True
+
+    def poll_save(self):
+        """Acompanha o salvamento em andamento (etapa e tempo) e avisa quando terminar."""
+        self._save_poll_id = None
+        job = self._save_job
+        if not job.poll():
+            self.save_status.config(text=f"💾 {job.status}")
+            self._save_poll_id = self.root.after(100, self.poll_save)
+            return
+        self._save_job = None
+        journal_id, self._save_journal_id = self._save_journal_id, None
+        mode = "incremental" if job.incremental else job.profile["label"]
+        if job.error is not None:
+            self._save_failed = True
+            self._close_after_save = False
+            self.save_status.config(text="")
+            logger.error(f"Erro ao salvar PDF ({mode}) em {job.target}: {job.error}")
+            messagebox.showerror("Erro", f"Falha ao salvar:\n{job.error}")
+            return
+        self._save_failed = False
+        written, seconds, saved_fingerprint = job.result
+        total = time.perf_counter() - job.started
+        if journal_id:
+            self.journal_write({"op": "saved", "id": journal_id, "fingerprint": saved_fingerprint})
+        size_after = os.path.getsize(job.target)
+        summary = (f"{job.size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB "
+                   f"({(size_after - job.size_before) * 100 / max(job.size_before, 1):+.0f}%) em {total:.1f}s")
+        logger.info(f"PDF salvo ({mode}) em {job.target}: {summary}; {written / 1024:.0f} KB gravados, "
+                    f"gravação {seconds:.2f}s, {len(job.images)} imagem(ns) recomprimida(s)")
+        self.save_status.config(text=f"Salvo ({mode}): {summary}")
+        if self._close_after_save:
+            self.on_close()
+            return
+        messagebox.showinfo("Sucesso", f"PDF salvo em:\n{job.target}\n\nTamanho: {summary}")
+
+    # ---------------- Modelos (mala direta) ----------------
+    def save_as_template(self):
+        """Salva os textos sobrepostos atuais como modelo; {coluna} vira o valor da planilha."""
+        if not self.doc:
+            return
+        if not self.objects:
+            messagebox.showinfo("Modelo", "Adicione os textos do modelo primeiro.\n"
+                                          "Use {coluna} onde deve entrar o valor da planilha, ex.: Nome: {nome}")
+            return
+        name = simpledialog.askstring("Modelo", "Nome do modelo:")
+        if not name:
+            return
+        path = os.path.join(TEMPLATE_DIR, safe_filename(name) + ".json")
+        try:
+            save_template(path, name, self.pdf_path, self.doc_fingerprint, self.objects)
+            fields = template_fields(load_template(path))
+        except (OSError, ValueError) as e:
+            logger.error(f"Erro ao salvar modelo: {e}")
+            messagebox.showerror("Erro", f"Falha ao salvar o modelo:\n{e}")
+            return
+        logger.info(f"Modelo '{name}' salvo em {path}: {len(self.objects)} texto(s), campos {sorted(fields)}")
+        note = "\n\nEdições feitas direto no PDF não entram no modelo: ele usa o arquivo salvo." if self.dirty_pages else ""
+        messagebox.showinfo("Modelo", f"Modelo salvo com {len(self.objects)} texto(s).\n"
+                                      f"Campos: {', '.join(sorted(fields)) or '(nenhum)'}{note}")
+
+    def run_merge(self):
+        """Modelo + planilha CSV -> um PDF por linha, em segundo plano."""
+        if self._merge_job is not None:
+            if messagebox.askyesno("Preencher", "Cancelar o preenchimento em andamento?"):
+                self._merge_job.cancel()
+            return
+        template_path = filedialog.askopenfilename(title="Modelo", initialdir=TEMPLATE_DIR,
+                                                   filetypes=[("Modelo", "*.json")])
+        if not template_path:
+            return
+        csv_path = filedialog.askopenfilename(title="Planilha", filetypes=[("CSV", "*.csv")])
+        if not csv_path:
+            return
+        out_dir = filedialog.askdirectory(title="Pasta de saída")
+        if not out_dir:
+            return
+        name_pattern = simpledialog.askstring("Preencher", "Nome de cada arquivo ({coluna} ou {_row} = nº da linha):",
+                                              initialvalue="{_row:05d}.pdf")
+        if not name_pattern:
+            return
+        profile = next(key for key, p in SAVE_PROFILES.items() if p["label"] == self.save_profile.get())
+        try:
+            template = load_template(template_path)
+            if template.get("fingerprint") and os.path.exists(template["source"]) \
+                    and file_fingerprint(template["source"]) != template["fingerprint"]:
+                if not messagebox.askyesno("Preencher", "O PDF de origem mudou desde que o modelo foi salvo.\n"
+                                                        "Continuar mesmo assim?"):
+                    return
+            self._merge_job = MergeJob(template, csv_path, out_dir, name_pattern, profile)
+        except (OSError, ValueError) as e:
+            logger.error(f"Erro ao iniciar mala direta: {e}")
+            messagebox.showerror("Erro", f"Não foi possível preencher:\n{e}")
+            return
+        logger.info(f"Mala direta: modelo {template_path}, planilha {csv_path}, saída {out_dir}")
+        self.poll_merge()
+
+    def poll_merge(self):
+        job = self._merge_job
+        if not job.poll():
+            self.save_status.config(text=f"📨 {job.status}")
+            self.root.after(200, self.poll_merge)
+            return
+        self._merge_job = None
+        summary = (f"{job.done} PDF(s) gravado(s), {job.failed} erro(s) em {time.perf_counter() - job.started:.1f}s "
+                   f"({job.rows_per_sec:.0f} linhas/s)")
+        logger.info(f"Mala direta concluída: {summary}")
+        self.save_status.config(text=f"📨 {summary}")
+        details = "\n".join(f"Linha {rownum}: {message}" for rownum, message in job.errors[:5])
+        messagebox.showinfo("Preencher", f"{summary}\n\nPasta: {job.out_dir}" + (f"\n\n{details}" if details else ""))
 
     # ---------------- Navegação / Zoom ----------------
     def prev_page(self):
         if self.doc and self.current_page > 0:
-            self.current_page -= 1
-            self.render_page()
+            self.go_to_page(self.current_page - 1)
 
     def next_page(self):
         if self.doc and self.current_page < len(self.doc) - 1:
-            self.current_page += 1
+            self.go_to_page(self.current_page + 1)
+
+    def go_to_page(self, pno: int):
+        self.current_page = pno
+        if self.continuous:
+            self.render_continuous(scroll_to=pno)
+        else:
             self.render_page()
 
     def zoom_in(self):
@@ -561,49 +3890,577 @@ class PDFEditorApp:
         self.scale = max((self.scale or 1.0) / 1.25, 0.5)
         self.render_page()
 
+    def toggle_continuous(self):
+        """Alterna entre uma página por vez e o documento inteiro empilhado."""
+        if not self.doc:
+            return
+        self.continuous = not self.continuous
+        if self.continuous:
+            self.canvas.delete("tile", "page_bg")
+            self.tile_items.clear()
+            self.tiled = False
+            if self.page_item is not None:
+                self.canvas.delete(self.page_item)
+                self.page_item = None
+            self._pending_refine = None
+        else:
+            self.canvas.delete("cont")
+            self.cont_items.clear()
+            self._cont_zoom = None
+            self._shown_view = None
+        self.go_to_page(self.current_page)
+        if not self.continuous:
+            self.canvas.yview_moveto(0)
+
     # ---------------- Renderização ----------------
     def render_page(self):
         """Renderiza a página atual + desenha os objetos sobrepostos (com escala)."""
         if not self.doc:
             return
+        t0 = time.perf_counter()
+        if self.continuous:
+            self.render_continuous()
+            PERF.add("render_page", t0)
+            return
         page = self.doc[self.current_page]
         zoom = self.scale or 1.0
-        mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat)
-
-        mode = "RGB" if pix.alpha == 0 else "RGBA"
-        img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
-        self.photo_image = ImageTk.PhotoImage(img)
 
-        # limpa canvas e redesenha imagem da página
-        self.canvas.delete("all")
-        self.canvas.create_image(0, 0, anchor="nw", image=self.photo_image)
-        self.canvas.config(scrollregion=(0, 0, pix.width, pix.height))
+        # redesenha só a imagem da página (inteira ou em blocos no zoom alto); objetos ficam no canvas
+        self.canvas.delete("tile", "page_bg")
+        self.tile_items.clear()
+        self._pending_refine = None
+        width = int(page.rect.width * zoom)
+        height = int(page.rect.height * zoom)
+        view = (self.current_page, round(zoom, 4))
+        self.tiled = width * height > self.TILED_MIN_PIXELS
+        if self.tiled:
+            if self.page_item is not None:
+                self.canvas.delete(self.page_item)
+                self.page_item = None
+            self.photo_image = None
+            self.canvas.create_rectangle(0, 0, width, height, fill="white", outline="", tags=("page_bg",))
+            self.canvas.tag_lower("page_bg")
+            self.canvas.config(scrollregion=(0, 0, width, height))
+            self.update_tiles()
+        else:
+            key = self.cache_key(self.current_page, zoom)
+            if self.PROGRESSIVE_RENDER and view != self._shown_view \
+                    and self.page_cached(self.current_page, zoom) is None:
+                # 1ª passada: prévia imediata; o bitmap nítido substitui quando ficar pronto
+                self.photo_image = self.preview_bitmap(page, zoom, width, height)
+                self.request_refine(key)
+            else:
+                self.photo_image, width, height = self.page_bitmap(page, zoom)
+            if self.page_item is None:
+                self.page_item = self.canvas.create_image(0, 0, anchor="nw", image=self.photo_image)
+                self.canvas.tag_lower(self.page_item)
+            else:
+                self.canvas.itemconfig(self.page_item, image=self.photo_image)
+            self.canvas.config(scrollregion=(0, 0, width, height))
+        self._shown_view = view
 
         # atualiza label
         self.page_label.config(text=f"Página: {self.current_page+1}/{len(self.doc)}")
 
-        # guarda palavras atuais (em coords PDF) para detectar cliques em texto existente
-        self.words = page.get_text("words")
+        # palavras da página ficam no índice em cache (só são extraídas no 1º clique/hover)
+        self.draw_word_selection()
+        self.draw_search_hit()
+
+        # mostra/ajusta os objetos da página (sem recriar os que já existem)
+        self.sync_overlay([self.current_page])
+
+        # adianta as páginas vizinhas em segundo plano
+        self.schedule_prefetch()
+        self.schedule_thumb_update()
+        self.canvas.tag_raise("perf")
+        PERF.add("render_page", t0)
+
+    # ---------------- Desempenho (F12) ----------------
+    def toggle_perf_overlay(self):
+        self.perf_overlay = not self.perf_overlay
+        if self._perf_overlay_id is not None:
+            self.root.after_cancel(self._perf_overlay_id)
+            self._perf_overlay_id = None
+        self.update_perf_overlay()
+
+    def update_perf_overlay(self):
+        """Tabela última/média/p95/máx por etapa no canto do canvas; redesenhada a cada 0,5 s enquanto visível."""
+        self._perf_overlay_id = None
+        self.canvas.delete("perf")
+        if not self.perf_overlay:
+            return
+        lines = [f"{'etapa':<12}{'últ':>7}{'méd':>7}{'p95':>7}{'máx':>7}{'n':>7}{'MB':>8}"]
+        for stage, st in sorted(PERF.summary().items()):
+            lines.append(f"{stage:<12}{st['last_ms']:>7.1f}{st['mean_ms']:>7.1f}{st['p95_ms']:>7.1f}"
+                         f"{st['max_ms']:>7.0f}{st['count']:>7}{st['mb']:>8.1f}")
+        lines.append("ms  •  F12 fecha  •  Ctrl+F12 exporta o trace")
+        x = self.canvas.canvasx(0) + 12
+        y = self.canvas.canvasy(0) + 10
+        text = self.canvas.create_text(x, y, anchor="nw", text="\n".join(lines), font=("Consolas", 9),
+                                       fill="#7CFC00", tags=("perf",))
+        x0, y0, x1, y1 = self.canvas.bbox(text)
+        box = self.canvas.create_rectangle(x0 - 6, y0 - 4, x1 + 6, y1 + 4, fill="#000000", outline="#7CFC00",
+                                           tags=("perf",))
+        self.canvas.tag_lower(box, text)
+        self._perf_overlay_id = self.root.after(500, self.update_perf_overlay)
+
+    def export_perf_trace(self):
+        path = filedialog.asksaveasfilename(
+            title="Exportar trace de desempenho", defaultextension=".json",
+            initialfile=f"trace-{datetime.datetime.now():%Y%m%d-%H%M%S}.json",
+            filetypes=[("Chrome trace", "*.json")])
+        if not path:
+            return
+        try:
+            count = PERF.export_trace(path)
+        except OSError as e:
+            logger.error(f"Erro exportando trace: {e}")
+            messagebox.showerror("Erro", f"Não foi possível gravar o trace:\n{e}")
+            return
+        logger.info(f"Trace exportado: {path} ({count} eventos)")
+        messagebox.showinfo("Trace", f"{count} eventos gravados.\nAbra em chrome://tracing ou ui.perfetto.dev.")
+
+    # ---------------- Coordenadas canvas <-> PDF ----------------
+    def page_origin(self, pno: int):
+        """Canto superior esquerdo da página no canvas (no modo contínuo as páginas estão empilhadas)."""
+        if self.continuous:
+            return 0.0, self.page_tops[pno] * (self.scale or 1.0)
+        return 0.0, 0.0
+
+    def pdf_to_canvas(self, pno: int, px: float, py: float):
+        zoom = self.scale or 1.0
+        ox, oy = self.page_origin(pno)
+        return ox + px * zoom, oy + py * zoom
+
+    def canvas_to_page(self, pno: int, cx: float, cy: float):
+        """Coordenadas canvas -> coordenadas PDF relativas à página 'pno'."""
+        zoom = self.scale or 1.0
+        ox, oy = self.page_origin(pno)
+        return (cx - ox) / zoom, (cy - oy) / zoom
+
+    def canvas_to_pdf(self, cx: float, cy: float):
+        """Coordenadas canvas -> (página, x, y em coords PDF) da página sob o ponto."""
+        if not self.continuous:
+            pno = self.current_page
+        else:
+            pno = min(max(bisect_right(self.page_tops, cy / (self.scale or 1.0)) - 1, 0), len(self.page_tops) - 1)
+        px, py = self.canvas_to_page(pno, cx, cy)
+        return pno, px, py
+
+    def page_words(self, pno: int) -> WordIndex:
+        return self.session.words(pno)
+
+    def word_under(self, cx: float, cy: float):
+        """(página, palavra) sob o ponto do canvas, ou (página, None)."""
+        pno, px, py = self.canvas_to_pdf(cx, cy)
+        if self.continuous:
+            w, h = self.page_sizes[pno]
+            if not (0 <= px <= w and 0 <= py <= h):
+                return pno, None
+        return pno, self.page_words(pno).at(px, py)
+
+    def word_canvas_rect(self, pno: int, word):
+        x0, y0 = self.pdf_to_canvas(pno, word[0], word[1])
+        x1, y1 = self.pdf_to_canvas(pno, word[2], word[3])
+        return x0, y0, x1, y1
+
+    # ---------------- Camada de objetos sobrepostos ----------------
+    def sync_overlay(self, pages):
+        """Exibe só os itens das páginas em 'pages' e reposiciona/reescala os que estão em outro layout."""
+        layout = (self.scale or 1.0, self.continuous)
+        pages = set(pages)
+        for pno in self._overlay_pages - pages:
+            self.canvas.itemconfig(f"p{pno}", state="hidden")
+        for pno in pages - self._overlay_pages:
+            self.canvas.itemconfig(f"p{pno}", state="normal")
+        self._overlay_pages = pages
+        for pno in pages:
+            relayout = self._overlay_layout.get(pno) != layout
+            for obj in self.objects.on_page(pno):
+                if self.objects.canvas_id(obj.oid) is None:
+                    self.overlay_add(obj)
+                elif relayout:
+                    self.overlay_update(obj)
+            self._overlay_layout[pno] = layout
+        self.canvas.tag_raise("obj")
+
+    def overlay_add(self, obj):
+        """Cria o item do canvas de um objeto novo."""
+        zoom = self.scale or 1.0
+        cx, cy = self.pdf_to_canvas(obj.page, obj.x, obj.y)
+        cid = self.canvas.create_text(cx, cy, text=obj.text, anchor="nw",
+                                      font=("Helvetica", max(1, int(obj.size * zoom))), fill="black",
+                                      tags=("obj", f"p{obj.page}"),
+                                      state="normal" if obj.page in self._overlay_pages else "hidden")
+        self.objects.bind(obj.oid, cid)
+
+    def overlay_update(self, obj):
+        """Atualiza texto/posição/fonte do item já existente."""
+        zoom = self.scale or 1.0
+        cid = self.objects.canvas_id(obj.oid)
+        self.canvas.coords(cid, *self.pdf_to_canvas(obj.page, obj.x, obj.y))
+        self.canvas.itemconfig(cid, text=obj.text, font=("Helvetica", max(1, int(obj.size * zoom))))
+
+    def overlay_sync_object(self, obj):
+        """Gancho da sessão: objeto criado/alterado; o item do canvas só existe se a página está visível."""
+        if self.objects.canvas_id(obj.oid) is not None:
+            self.canvas.itemconfig(self.objects.canvas_id(obj.oid), tags=("obj", f"p{obj.page}"))
+            self.overlay_update(obj)
+        elif obj.page in self._overlay_pages:
+            self.overlay_add(obj)
+
+    def overlay_remove(self, oid: int):
+        """Gancho da sessão: o objeto vai ser removido; apaga o item do canvas."""
+        cid = self.objects.canvas_id(oid)
+        if cid is not None:
+            self.canvas.delete(cid)
+
+    def overlay_reset(self):
+        """Lista de objetos foi trocada (abrir/salvar): descarta todos os itens."""
+        self.canvas.delete("obj")
+        self.objects.unbind_all()
+        self._overlay_pages = set()
+        self._overlay_layout.clear()
+
+    # ---------------- Modo contínuo (páginas virtualizadas) ----------------
+    def layout_pages(self):
+        """Calcula uma vez por documento o topo/tamanho de cada página na pilha (pontos PDF)."""
+        if self.page_tops is not None:
+            return
+        tops, sizes, y, max_w = [], [], 0.0, 0.0
+        for page in self.doc:
+            r = page.rect
+            tops.append(y)
+            sizes.append((r.width, r.height))
+            y += r.height + self.CONTINUOUS_GAP
+            max_w = max(max_w, r.width)
+        self.page_tops, self.page_sizes = tops, sizes
+        self.layout_size = (max_w, y)
+
+    def render_continuous(self, scroll_to=None):
+        """Prepara a pilha de páginas no zoom atual e materializa só as que aparecem na tela."""
+        self.layout_pages()
+        zoom = self.scale or 1.0
+        total_w, total_h = self.layout_size
+        self.canvas.config(scrollregion=(0, 0, total_w * zoom, total_h * zoom))
+        if self._cont_zoom != zoom:
+            # zoom mudou: itens antigos estão na escala errada; mantém a página atual no topo
+            self.canvas.delete("cont")
+            self.cont_items.clear()
+            self._cont_zoom = zoom
+            if scroll_to is None:
+                scroll_to = self.current_page
+            self.draw_word_selection()
+            self.draw_search_hit()
+        if scroll_to is not None:
+            self.canvas.yview_moveto(self.page_tops[scroll_to] / total_h)
+        self.update_continuous()
+
+    def update_continuous(self):
+        """Renderiza as páginas visíveis (+ margem), descarta as que saíram e atualiza a página atual."""
+        if not self.doc or not self.continuous:
+            return
+        self.layout_pages()
+        zoom = self.scale or 1.0
+        n = len(self.page_tops)
+        top = self.canvas.canvasy(0) / zoom
+        bottom = self.canvas.canvasy(self.canvas.winfo_height()) / zoom
+        first = max(bisect_right(self.page_tops, top) - 1 - self.CONTINUOUS_BUFFER, 0)
+        last = min(bisect_right(self.page_tops, bottom) - 1 + self.CONTINUOUS_BUFFER, n - 1)
+        wanted = range(first, last + 1)
+
+        for pno in list(self.cont_items):
+            if pno not in wanted:
+                self.canvas.delete(self.cont_items.pop(pno)[1])
+
+        requested = set()
+        for pno in wanted:
+            key = self.cache_key(pno, zoom)
+            entry = self.cont_items.get(pno)
+            if entry and entry[0] == key and entry[2]:
+                continue
+            cached = self.page_cached(pno, zoom)
+            if cached is None:
+                if self.prefetcher and pno not in self.dirty_pages:
+                    # página igual ao arquivo: o worker renderiza; até lá fica o marcador
+                    self.prefetcher.request(pno, zoom)
+                    requested.add((pno, round(zoom, 4)))
+                else:
+                    cached = self.page_bitmap(self.doc[pno], zoom)
+            if entry and entry[0] == key and cached is None:
+                continue  # marcador já está no lugar
+            if entry:
+                self.canvas.delete(entry[1])
+            y = self.page_tops[pno] * zoom
+            if cached is not None:
+                item = self.canvas.create_image(0, y, anchor="nw", image=cached[0], tags=("cont",))
+            else:
+                w, h = self.page_sizes[pno]
+                item = self.canvas.create_rectangle(0, y, w * zoom, y + h * zoom, fill="white",
+                                                    outline="", tags=("cont",))
+            self.canvas.tag_lower(item)
+            self.cont_items[pno] = (key, item, cached is not None)
+
+        if self.prefetcher:
+            # adianta também as próximas páginas abaixo da área visível
+            for pno in range(last + 1, min(last + 1 + self.PREFETCH_AHEAD, n)):
+                if pno not in self.dirty_pages and self.render_cache.get(self.cache_key(pno, zoom)) is None \
+                        and not self.disk_has(pno, f"{zoom:.4f}"):
+                    self.prefetcher.request(pno, zoom)
+                    requested.add((pno, round(zoom, 4)))
+            self.prefetcher.keep_only(requested)
+            if self.prefetcher.pending and self._prefetch_poll_id is None:
+                self._prefetch_poll_id = self.root.after(40, self.poll_prefetch)
+
+        # página atual = a que ocupa o topo da área visível
+        self.current_page = min(max(bisect_right(self.page_tops, top + self.CONTINUOUS_GAP) - 1, 0), n - 1)
+        self.page_label.config(text=f"Página: {self.current_page+1}/{n}")
+        self.sync_overlay(wanted)
+        self.schedule_thumb_update()
+
+    def page_bitmap(self, page, zoom: float):
+        """Devolve (PhotoImage, largura, altura) da página inteira, usando o cache/worker se possível."""
+        key = self.cache_key(page.number, zoom)
+        cached = self.page_cached(page.number, zoom)
+        if cached is None and self.prefetcher and page.number not in self.dirty_pages:
+            # se o worker já está renderizando esta página, aproveita o resultado
+            result = self.prefetcher.take(page.number, zoom)
+            if result is not None:
+                cached = self.store_rendered(result)
+        if cached is None:
+            frame = pixmap_to_frame(self.session.render(page.number, zoom))
+            cached = (frame_to_photo(frame), frame[1], frame[2])
+            self.render_cache.put(key, cached, frame_nbytes(frame))
+            self.save_to_disk(page.number, f"{zoom:.4f}", frame)
+        return cached
+
+    # ---------------- Miniaturas ----------------
+    def on_thumb_scroll(self, *args):
+        self.thumb_canvas.yview(*args)
+        self.schedule_thumb_update()
+
+    def on_thumb_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.thumb_canvas.yview_scroll(-1, "units")
+        else:
+            self.thumb_canvas.yview_scroll(1, "units")
+        self.schedule_thumb_update()
+
+    def on_thumb_click(self, event):
+        if not self.doc:
+            return
+        pno = int(self.thumb_canvas.canvasy(event.y) // self.THUMB_SLOT)
+        if 0 <= pno < len(self.doc):
+            self.go_to_page(pno)
+
+    def schedule_thumb_update(self):
+        if self.doc and self._thumb_update_id is None:
+            self._thumb_update_id = self.root.after(30, self.update_thumbs)
+
+    def thumb_box(self):
+        """Tamanho máximo (pixels) da miniatura dentro do slot, descontando margem e número da página."""
+        return self.THUMB_WIDTH - 16, self.THUMB_SLOT - 26
+
+    def thumb_variant(self):
+        return "t{}x{}".format(*self.thumb_box())
+
+    def store_thumb(self, pno: int, frame):
+        """Guarda a miniatura vinda do worker (se a página não foi editada nesse meio tempo)."""
+        if pno in self.dirty_pages:
+            return
+        key = self.cache_key(pno, 0)
+        if self.thumb_cache.get(key) is None:
+            self.thumb_cache.put(key, (frame_to_photo(frame), frame[1], frame[2]), frame_nbytes(frame))
+            self.save_to_disk(pno, self.thumb_variant(), frame)
+        self.schedule_thumb_update()
+
+    def update_thumbs(self):
+        """Desenha só as miniaturas visíveis na barra; as demais nem existem no canvas."""
+        self._thumb_update_id = None
+        if not self.doc:
+            return
+        n = len(self.doc)
+        slot = self.THUMB_SLOT
+        max_w, max_h = self.thumb_box()
+        self.thumb_canvas.config(scrollregion=(0, 0, self.THUMB_WIDTH, n * slot))
+
+        # quando a página atual muda, rola a barra para mantê-la visível
+        top = self.thumb_canvas.canvasy(0)
+        height = self.thumb_canvas.winfo_height()
+        cur_y = self.current_page * slot
+        followed, self._thumb_followed = self._thumb_followed, self.current_page
+        if followed != self.current_page and (cur_y < top or cur_y + slot > top + height):
+            self.thumb_canvas.yview_moveto(max(0, cur_y - (height - slot) / 2) / (n * slot))
+            top = self.thumb_canvas.canvasy(0)
+        first = max(int(top // slot), 0)
+        last = min(int((top + height) // slot), n - 1)
+        wanted = range(first, last + 1)
+
+        for pno in list(self.thumb_items):
+            if pno not in wanted:
+                for item in self.thumb_items.pop(pno)[1]:
+                    self.thumb_canvas.delete(item)
+
+        requested = set()
+        for pno in wanted:
+            key = self.cache_key(pno, 0)
+            entry = self.thumb_items.get(pno)
+            if entry and entry[0] == key and entry[2]:
+                continue
+            cached = self.thumb_cache.get(key) or self.load_from_disk(self.thumb_cache, key, pno, self.thumb_variant())
+            if cached is None:
+                if self.prefetcher and pno not in self.dirty_pages:
+                    self.prefetcher.request_thumb(pno, max_w, max_h)
+                    requested.add(("thumb", pno))
+                else:
+                    # página editada: miniatura sai do DisplayList em cache, aqui mesmo
+                    zoom = thumb_zoom(self.doc[pno].rect, max_w, max_h)
+                    frame = pixmap_to_frame(self.session.render(pno, zoom))
+                    cached = (frame_to_photo(frame), frame[1], frame[2])
+                    self.thumb_cache.put(key, cached, frame_nbytes(frame))
+            if entry and entry[0] == key and cached is None:
+                continue
+            if entry:
+                for item in entry[1]:
+                    self.thumb_canvas.delete(item)
+            x = self.THUMB_WIDTH / 2
+            y = pno * slot + 4
+            if cached is not None:
+                img = self.thumb_canvas.create_image(x, y, anchor="n", image=cached[0])
+            else:
+                img = self.thumb_canvas.create_rectangle(x - max_w / 2, y, x + max_w / 2, y + max_h,
+                                                         fill="white", outline="")
+            label = self.thumb_canvas.create_text(x, (pno + 1) * slot - 12, text=str(pno + 1), fill="white")
+            self.thumb_items[pno] = (key, [img, label], cached is not None)
+
+        if self.prefetcher:
+            self.prefetcher.keep_only(requested, thumbs=True)
+            if self.prefetcher.pending and self._prefetch_poll_id is None:
+                self._prefetch_poll_id = self.root.after(40, self.poll_prefetch)
+
+        # destaca a página atual
+        self.thumb_canvas.delete("thumb_sel")
+        self.thumb_canvas.create_rectangle(3, self.current_page * slot + 1, self.THUMB_WIDTH - 3,
+                                           (self.current_page + 1) * slot - 1, outline="#3498db", width=2,
+                                           tags=("thumb_sel",))
+
+    # ---------------- Renderização progressiva ----------------
+    def preview_bitmap(self, page, zoom: float, width: int, height: int):
+        """Prévia barata: reescala o bitmap já exibido (só mudou o zoom) ou renderiza em baixa resolução."""
+        if self.photo_image is not None and self._shown_view and self._shown_view[0] == page.number:
+            img = ImageTk.getimage(self.photo_image)
+        else:
+            low = zoom * self.PREVIEW_SCALE
+            pix = self.session.render(page.number, low)
+            img = Image.frombytes("RGB" if pix.alpha == 0 else "RGBA", [pix.width, pix.height], pix.samples)
+        size = (max(1, width), max(1, height))
+        img = img.resize(size, Image.BILINEAR)
+        photo = self._preview_photo
+        if photo is not None and (photo.width(), photo.height()) == size:
+            photo.paste(img)  # reaproveita a mesma imagem do Tk em vez de alocar outra
+        else:
+            photo = self._preview_photo = ImageTk.PhotoImage(img)
+        return photo
+
+    def request_refine(self, key):
+        """Agenda a 2ª passada: pelo worker se a página está igual ao arquivo, senão na thread do Tk."""
+        self._pending_refine = key
+        pno, zoom = key[0], key[1]
+        if self.prefetcher and pno not in self.dirty_pages:
+            self.prefetcher.request(pno, zoom)
+            if self._prefetch_poll_id is None:
+                self._prefetch_poll_id = self.root.after(40, self.poll_prefetch)
+        elif self._refine_id is None:
+            # pequeno atraso para o Tk desenhar a prévia antes de bloquear na renderização
+            self._refine_id = self.root.after(10, self.refine_page)
+
+    def refine_page(self):
+        """2ª passada: troca a prévia pelo bitmap em resolução total (se a vista não mudou)."""
+        self._refine_id = None
+        key = self._pending_refine
+        if key is None or not self.doc or key != self.cache_key(self.current_page, self.scale or 1.0):
+            return
+        self._pending_refine = None
+        self.photo_image, width, height = self.page_bitmap(self.doc[self.current_page], key[1])
+        self.canvas.itemconfig(self.page_item, image=self.photo_image)
+        self.canvas.config(scrollregion=(0, 0, width, height))
+
+    # ---------------- Renderização em blocos (zoom alto) ----------------
+    def on_yscroll(self, *args):
+        self.canvas.yview(*args)
+        self.schedule_view_update()
+
+    def on_xscroll(self, *args):
+        self.canvas.xview(*args)
+        self.schedule_view_update()
+
+    def on_mousewheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.canvas.yview_scroll(-3, "units")
+        else:
+            self.canvas.yview_scroll(3, "units")
+        self.schedule_view_update()
+
+    def schedule_view_update(self):
+        """Atualiza (com pequeno atraso) o que depende da área visível: blocos ou páginas do modo contínuo."""
+        if (self.tiled or self.continuous) and self._view_update_id is None:
+            self._view_update_id = self.root.after(15, self.update_view)
+
+    def update_view(self):
+        self._view_update_id = None
+        if self.continuous:
+            self.update_continuous()
+        elif self.tiled:
+            self.update_tiles()
+
+    def update_tiles(self):
+        """Garante no canvas os blocos que cobrem a área visível + margem e remove os que saíram."""
+        if not self.doc or not self.tiled:
+            return
+        page = self.doc[self.current_page]
+        zoom = self.scale or 1.0
+        size = self.TILE_SIZE
+        width = int(page.rect.width * zoom)
+        height = int(page.rect.height * zoom)
+
+        # área visível em coordenadas do canvas (+ margem), limitada à página
+        x0 = max(0, self.canvas.canvasx(0) - self.TILE_MARGIN)
+        y0 = max(0, self.canvas.canvasy(0) - self.TILE_MARGIN)
+        x1 = min(width, self.canvas.canvasx(self.canvas.winfo_width()) + self.TILE_MARGIN)
+        y1 = min(height, self.canvas.canvasy(self.canvas.winfo_height()) + self.TILE_MARGIN)
+        wanted = {(tx, ty)
+                  for tx in range(int(x0 // size), int(max(x0, x1 - 1) // size) + 1)
+                  for ty in range(int(y0 // size), int(max(y0, y1 - 1) // size) + 1)}
 
-        # desenha objetos que pertencem a essa página
-        for idx, obj in enumerate(self.objects):
-            if obj["page"] != self.current_page:
+        for tile in list(self.tile_items):
+            if tile not in wanted:
+                self.canvas.delete(self.tile_items.pop(tile))
+        for tile in wanted:
+            if tile in self.tile_items:
                 continue
-            # posição no canvas = coord_pdf * zoom
-            cx = obj["x"] * zoom
-            cy = obj["y"] * zoom
-            fsize = max(1, int(obj["size"] * zoom))
-            # cria texto no canvas com tag 'obj' e tag única
-            cid = self.canvas.create_text(cx, cy, text=obj["text"], anchor="nw",
-                                          font=("Helvetica", fsize), fill="black",
-                                          tags=("obj", f"obj{idx}"))
-            obj["canvas_id"] = cid
-            # bind dinâmicos (um handler genérico usa 'current')
-            self.canvas.tag_bind(f"obj{idx}", "<Button-1>", self.on_object_click)
-            self.canvas.tag_bind(f"obj{idx}", "<B1-Motion>", self.on_object_drag)
-            self.canvas.tag_bind(f"obj{idx}", "<ButtonRelease-1>", self.on_object_release)
-            self.canvas.tag_bind(f"obj{idx}", "<Double-1>", self.on_object_double_click)
+            photo, x, y = self.tile_bitmap(page, zoom, tile)
+            self.tile_items[tile] = self.canvas.create_image(x, y, anchor="nw", image=photo, tags=("tile",))
+
+        # blocos ficam acima do fundo e abaixo dos objetos sobrepostos
+        self.canvas.tag_raise("tile", "page_bg")
+        if self.canvas.find_withtag("obj"):
+            self.canvas.tag_lower("tile", "obj")
+
+    def tile_bitmap(self, page, zoom: float, tile):
+        """Renderiza (ou busca no cache) um bloco da página via DisplayList.get_pixmap(clip=...)."""
+        key = self.cache_key(page.number, zoom) + (tile,)
+        cached = self.render_cache.get(key)
+        if cached is None:
+            tx, ty = tile
+            size = self.TILE_SIZE
+            r = page.rect
+            clip = fitz.Rect(r.x0 + tx * size / zoom, r.y0 + ty * size / zoom,
+                             r.x0 + (tx + 1) * size / zoom, r.y0 + (ty + 1) * size / zoom) & r
+            pix = self.session.render(page.number, zoom, clip)
+            frame = pixmap_to_frame(pix)
+            cached = (frame_to_photo(frame), pix.x, pix.y)
+            self.render_cache.put(key, cached, frame_nbytes(frame))
+        return cached
 
     # ---------------- Eventos canvas / objetos ----------------
     def on_click_canvas(self, event):
@@ -615,15 +4472,17 @@ class PDFEditorApp:
         if not self.doc:
             return
 
-        # coordenadas canvas
+        # coordenadas canvas -> (página, coords PDF) daquela página
         cx = self.canvas.canvasx(event.x)
         cy = self.canvas.canvasy(event.y)
-        zoom = self.scale or 1.0
-        px = cx / zoom
-        py = cy / zoom
+        pno, px, py = self.canvas_to_pdf(cx, cy)
+        if self.continuous:
+            w, h = self.page_sizes[pno]
+            if not (0 <= px <= w and 0 <= py <= h):
+                return  # clique no espaço entre páginas
 
         # 1) se clicou sobre um objeto canvas (tag 'obj'), deixamos o handler de objetos cuidar
-        items = self.canvas.find_overlapping(event.x, event.y, event.x, event.y)
+        items = self.canvas.find_overlapping(cx, cy, cx, cy)
         for it in items:
             tags = self.canvas.gettags(it)
             if "obj" in tags:
@@ -631,25 +4490,18 @@ class PDFEditorApp:
                 # forçamos chamada do handler (ele será acionado pelo tag_bind também)
                 return
 
-        # 2) verificar se clicou em palavra existente do PDF (usando coords PDF)
-        clicked_word = None
-        rect = None
-        for w in self.words:
-            x0, y0, x1, y1, word, *_ = w
-            if x0 <= px <= x1 and y0 <= py <= y1:
-                clicked_word = word
-                rect = fitz.Rect(x0, y0, x1, y1)
-                break
-
-        if clicked_word and rect:
+        # 2) verificar se clicou em palavra existente do PDF (consulta no índice espacial da página)
+        self.clear_word_selection()
+        w = self.page_words(pno).at(px, py)
+        if w:
             # Perguntar ação: Substituir / Mover / Cancelar
-            self.handle_existing_word_action(rect, clicked_word, cx, cy)
+            self.handle_existing_word_action(pno, fitz.Rect(w[:4]), w[4], cx, cy)
             return
 
         # 3) caso contrário, criar nova entry para objeto sobreposto (modo 'new')
         self.create_entry_at_canvas(cx, cy, mode="new")
 
-    def create_entry_at_canvas(self, cx, cy, mode="new", prefill_text=None, preset_size=None, edit_index=None):
+    def create_entry_at_canvas(self, cx, cy, mode="new", prefill_text=None, preset_size=None, edit_id=None):
         """Cria uma Entry sobre o canvas na posição (cx,cy) [coordenadas canvas].
            mode: 'new', 'edit', 'move_pdf'
         """
@@ -665,7 +4517,7 @@ class PDFEditorApp:
         self.active_entry.focus_set()
 
         self.entry_mode = mode
-        self.edit_obj_index = edit_index
+        self.edit_obj_id = edit_id
 
         # binds: arrastar da entry (para reposicionar antes de salvar)
         self.active_entry.bind("<Button-1>", self.start_drag)
@@ -682,8 +4534,8 @@ class PDFEditorApp:
     def do_drag(self, event):
         # movendo a entry pelo canvas (usando pointer)
         try:
-            pointer_x = self.canvas.winfo_pointerx() - self.canvas.winfo_rootx()
-            pointer_y = self.canvas.winfo_pointery() - self.canvas.winfo_rooty()
+            pointer_x = self.canvas.canvasx(self.canvas.winfo_pointerx() - self.canvas.winfo_rootx())
+            pointer_y = self.canvas.canvasy(self.canvas.winfo_pointery() - self.canvas.winfo_rooty())
             self.canvas.coords(self.entry_window, pointer_x - self.drag_offset_x, pointer_y - self.drag_offset_y)
         except Exception:
             pass
@@ -703,63 +4555,47 @@ class PDFEditorApp:
         if not text.strip():
             # nada para salvar
             self.entry_mode = None
-            self.edit_obj_index = None
+            self.edit_obj_id = None
             self.moving_pdf_word = None
             return
 
-        # converte coords canvas -> pdf
-        zoom = self.scale or 1.0
+        # converte coords canvas -> (página, coords pdf)
         x_canvas, y_canvas = coords[0], coords[1]
-        px = x_canvas / zoom
-        py = y_canvas / zoom
+        pno, px, py = self.canvas_to_pdf(x_canvas, y_canvas)
 
         if self.entry_mode == "new":
-            # <-- SALVA O ESTADO ANTES DE CRIAR O OBJETO (correção para undo funcionar) -->
-            self.save_state()
-            # cria objeto em memória (não grava no PDF ainda)
-            obj = {"page": self.current_page, "x": px, "y": py, "text": text, "size": self.font_size, "canvas_id": None}
-            self.objects.append(obj)
-            logger.info(f"Objeto criado na página {self.current_page+1}: '{text}' @ ({px:.1f},{py:.1f}) size={self.font_size}")
-            self.render_page()
-        elif self.entry_mode == "edit" and self.edit_obj_index is not None:
-            # <-- SALVA O ESTADO ANTES DE EDITAR O OBJETO (correção para undo funcionar) -->
-            self.save_state()
-            # atualiza objeto existente
-            idx = self.edit_obj_index
-            if 0 <= idx < len(self.objects):
-                self.objects[idx]["text"] = text
-                # atualiza posição para o local novo
-                self.objects[idx]["x"] = px
-                self.objects[idx]["y"] = py
-                self.objects[idx]["size"] = self.font_size
-                logger.info(f"Objeto editado idx={idx}: '{text}'")
-            self.render_page()
+            # cria objeto em memória (não grava no PDF ainda); desfazer = remover
+            obj = self.session.insert_text(pno, px, py, text, self.font_size)
+            logger.info(f"Objeto criado na página {pno+1}: '{text}' @ ({px:.1f},{py:.1f}) size={self.font_size}")
+        elif self.entry_mode == "edit" and self.edit_obj_id is not None:
+            # atualiza objeto existente (histórico guarda o estado antes/depois)
+            obj = self.objects.get(self.edit_obj_id)
+            if obj is not None:
+                # atualiza posição para o local novo (relativa à página do objeto)
+                x, y = self.canvas_to_page(obj.page, x_canvas, y_canvas)
+                self.session.update_object(obj.oid, "Editar texto", text=text, x=x, y=y, size=self.font_size)
+                logger.info(f"Objeto editado id={obj.oid}: '{text}'")
         elif self.entry_mode == "move_pdf" and self.moving_pdf_word:
             # mover palavra do PDF: apagar retângulo original e inserir no novo local
-            rect = self.moving_pdf_word["rect"]
-            original_word = self.moving_pdf_word["word"]
-            try:
-                self.save_state()
-                page = self.doc[self.current_page]
-                # apagar original (no doc) - atenção: isso afeta imediatamente o documento
-                page.draw_rect(rect, color=(1, 1, 1), fill=(1, 1, 1))
-                # tamanho de fonte baseado no tamanho original do rect
-                computed_font = max(4, (rect.height) * 0.8)
-                insert_y = py + computed_font * self.baseline_factor
-                page.insert_text((px, insert_y), text, fontsize=int(computed_font), fontname="helv", color=(0, 0, 0))
-                logger.info(f"Palavra '{original_word}' movida para ({px:.1f},{py:.1f}) fontsize={int(computed_font)}")
-                # limpar estado
-                self.moving_pdf_word = None
-                self.render_page()
-            except Exception as e:
-                logger.error(f"Erro ao mover palavra do PDF: {e}")
-                messagebox.showerror("Erro", f"Falha ao mover palavra:\n{e}")
+            pno = self.moving_pdf_word["page"]
+            px, py = self.canvas_to_page(pno, x_canvas, y_canvas)
+            self.move_pdf_word(pno, self.moving_pdf_word["rect"], text, px, py)
 
         # reset modes
         self.entry_mode = None
-        self.edit_obj_index = None
+        self.edit_obj_id = None
         self.moving_pdf_word = None
 
+    def move_pdf_word(self, pno: int, rect, text: str, px: float, py: float):
+        try:
+            # apagar original (no doc) - atenção: isso afeta imediatamente o documento
+            fontsize = self.session.move_word(pno, rect, text, px, py)
+            logger.info(f"Palavra movida para ({px:.1f},{py:.1f}): '{text}' fontsize={fontsize}")
+            self.render_page()
+        except Exception as e:
+            logger.error(f"Erro ao mover palavra do PDF: {e}")
+            messagebox.showerror("Erro", f"Falha ao mover palavra:\n{e}")
+
     def cancel_entry(self):
         if self.active_entry:
             self.canvas.delete(self.entry_window)
@@ -767,7 +4603,7 @@ class PDFEditorApp:
             self.active_entry = None
             self.entry_window = None
         self.entry_mode = None
-        self.edit_obj_index = None
+        self.edit_obj_id = None
         self.moving_pdf_word = None
 
     # ---------------- Manipulação de objetos já desenhados no canvas ----------------
@@ -778,20 +4614,13 @@ class PDFEditorApp:
         if not items:
             return
         cid = items[0]
-        # encontra index do objeto
-        idx = None
-        for i, obj in enumerate(self.objects):
-            if obj.get("canvas_id") == cid:
-                idx = i
-                break
-        if idx is None:
+        obj = self.objects.by_canvas_id(cid)
+        if obj is None:
             return
 
-        # <-- SALVA O ESTADO ANTES DE INICIAR O DRAG (correção para undo do movimento) -->
-        self.save_state()
-
-        # iniciar arraste
-        self.dragging_obj_index = idx
+        # iniciar arraste (só entra no histórico se o objeto realmente mudar de lugar)
+        self.dragging_obj_id = obj.oid
+        self._drag_start_state = obj.state()
         # calcula offset entre posição do mouse e posição do objeto
         pos = self.canvas.coords(cid)
         if pos:
@@ -800,9 +4629,9 @@ class PDFEditorApp:
 
     def on_object_drag(self, event):
         """Arrastar objeto (apenas movimenta a representação canvas)."""
-        if self.dragging_obj_index is None:
+        if self.dragging_obj_id is None:
             return
-        cid = self.objects[self.dragging_obj_index]["canvas_id"]
+        cid = self.objects.canvas_id(self.dragging_obj_id)
         # mantem no canvas
         new_x = event.x - self.drag_offset_x
         new_y = event.y - self.drag_offset_y
@@ -810,41 +4639,39 @@ class PDFEditorApp:
 
     def on_object_release(self, event):
         """Ao soltar, atualiza coordenadas do objeto (converte para coords PDF)."""
-        if self.dragging_obj_index is None:
+        if self.dragging_obj_id is None:
             return
-        cid = self.objects[self.dragging_obj_index]["canvas_id"]
-        coords = self.canvas.coords(cid)
+        obj = self.objects.get(self.dragging_obj_id)
+        coords = self.canvas.coords(self.objects.canvas_id(obj.oid))
         if coords:
-            cx, cy = coords[0], coords[1]
-            zoom = self.scale or 1.0
-            self.objects[self.dragging_obj_index]["x"] = cx / zoom
-            self.objects[self.dragging_obj_index]["y"] = cy / zoom
-            logger.info(f"Objeto idx={self.dragging_obj_index} movido para pdf coords ({self.objects[self.dragging_obj_index]['x']:.1f},{self.objects[self.dragging_obj_index]['y']:.1f})")
-        self.dragging_obj_index = None
+            # no modo contínuo o texto pode ter sido solto em outra página: vai para ela,
+            # preso aos limites da página (solto no espaço entre páginas fica na borda)
+            pno, x, y = self.canvas_to_pdf(coords[0], coords[1])
+            rect = self.doc[pno].rect
+            x = min(max(x, 0.0), rect.width)
+            y = min(max(y, 0.0), rect.height)
+            obj = self.session.update_object(obj.oid, "Mover texto", page=pno, x=x, y=y)
+            if obj.state() != self._drag_start_state:
+                logger.info(f"Objeto id={obj.oid} movido para pdf coords ({obj.x:.1f},{obj.y:.1f}) na página {obj.page + 1}")
+        self.dragging_obj_id = None
+        self._drag_start_state = None
 
     def on_object_double_click(self, event):
         """Edição rápida: ao dar duplo clique em um objeto, abre entry para editar."""
         items = self.canvas.find_withtag("current")
         if not items:
             return
-        cid = items[0]
-        idx = None
-        for i, obj in enumerate(self.objects):
-            if obj.get("canvas_id") == cid:
-                idx = i
-                break
-        if idx is None:
+        obj = self.objects.by_canvas_id(items[0])
+        if obj is None:
             return
         # abre entry pré-preenchida no local do objeto
-        zoom = self.scale or 1.0
-        cx = self.objects[idx]["x"] * zoom
-        cy = self.objects[idx]["y"] * zoom
-        self.font_size = self.objects[idx]["size"]
-        self.create_entry_at_canvas(cx, cy, mode="edit", prefill_text=self.objects[idx]["text"],
-                                    preset_size=self.objects[idx]["size"], edit_index=idx)
+        cx, cy = self.pdf_to_canvas(obj.page, obj.x, obj.y)
+        self.font_size = obj.size
+        self.create_entry_at_canvas(cx, cy, mode="edit", prefill_text=obj.text,
+                                    preset_size=obj.size, edit_id=obj.oid)
 
     # ---------------- Click em palavra do PDF (substituir/mover) ----------------
-    def handle_existing_word_action(self, rect, word, canvas_x, canvas_y):
+    def handle_existing_word_action(self, pno, rect, word, canvas_x, canvas_y):
         """Mostra um diálogo simples com opções: Substituir, Mover, Cancelar."""
         dlg = tk.Toplevel(self.root)
         dlg.title("Ação sobre texto")
@@ -867,27 +4694,14 @@ class PDFEditorApp:
         def do_replace():
             dlg.destroy()
             new_text = simpledialog.askstring("Substituir Texto", f"Substituir '{word}' por:")
-            if new_text is None:
-                return
-            try:
-                self.save_state()
-                page = self.doc[self.current_page]
-                # apaga área original e insere novo texto
-                page.draw_rect(rect, color=(1, 1, 1), fill=(1, 1, 1))
-                fontsize = max(4, rect.height * 0.8)
-                insert_y = rect.y0 + rect.height * 0.8
-                page.insert_text((rect.x0, insert_y), new_text, fontsize=fontsize, fontname="helv", color=(0, 0, 0))
-                self.render_page()
-                logger.info(f"Substituído '{word}' por '{new_text}'")
-            except Exception as e:
-                logger.error(f"Erro ao substituir: {e}")
-                messagebox.showerror("Erro", f"Falha ao substituir:\n{e}")
+            if new_text is not None:
+                self.replace_word(pno, rect, new_text)
 
         def do_move():
             dlg.destroy()
             # modo move: criamos entry pré-preenchida no ponto clicado
             # definimos entry_mode = 'move_pdf' e armazenamos rect+word
-            self.moving_pdf_word = {"rect": rect, "word": word}
+            self.moving_pdf_word = {"page": pno, "rect": rect, "word": word}
             # definir font_size baseado no rect (para visual corresponder)
             self.font_size = max(4, int(rect.height * 0.8))
             self.create_entry_at_canvas(canvas_x, canvas_y, mode="move_pdf", prefill_text=word, preset_size=self.font_size)
@@ -899,19 +4713,266 @@ class PDFEditorApp:
         tk.Button(btn_frame, text="Mover", width=8, command=do_move).pack(side="left", padx=6)
         tk.Button(btn_frame, text="Cancelar", width=8, command=do_cancel).pack(side="left", padx=6)
 
+    def replace_word(self, pno: int, rect, new_text: str):
+        try:
+            # apaga área original e insere novo texto
+            self.session.replace(pno, rect, new_text)
+            self.render_page()
+            logger.info(f"Substituído texto da página {pno+1} por '{new_text}'")
+        except Exception as e:
+            logger.error(f"Erro ao substituir: {e}")
+            messagebox.showerror("Erro", f"Falha ao substituir:\n{e}")
+
+    # ---------------- Destaque / seleção de palavras do PDF ----------------
+    def on_canvas_hover(self, event):
+        """Contorna a palavra sob o mouse (só redesenha quando a palavra muda)."""
+        if not self.doc or self.active_entry or self.dragging_obj_id is not None:
+            return
+        hit = self.word_under(self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+        if hit[1] is None:
+            self.clear_word_hover()
+            return
+        if hit == self._hover_word:
+            return
+        self.canvas.delete("word_hover")
+        self.canvas.create_rectangle(*self.word_canvas_rect(*hit), outline="#3498db", tags=("word_hover",))
+        self._hover_word = hit
+
+    def clear_word_hover(self):
+        if self._hover_word is not None:
+            self.canvas.delete("word_hover")
+            self._hover_word = None
+
+    def start_word_selection(self, event):
+        """Shift + clique: começa o retângulo de seleção de palavras."""
+        if not self.doc:
+            return
+        cx = self.canvas.canvasx(event.x)
+        cy = self.canvas.canvasy(event.y)
+        self.clear_word_selection()
+        self.clear_word_hover()
+        self._select_start = (self.canvas_to_pdf(cx, cy)[0], cx, cy)
+        self.canvas.create_rectangle(cx, cy, cx, cy, outline="#3498db", dash=(4, 2), tags=("word_band",))
+
+    def clear_word_selection(self):
+        self.canvas.delete("word_sel", "word_band")
+        self.selected_words = None
+        self._select_start = None
+
+    def draw_word_selection(self):
+        """(Re)desenha a seleção atual na escala/posição atual da página."""
+        self.canvas.delete("word_sel")
+        if not self.selected_words:
+            return
+        pno, words = self.selected_words
+        for w in words:
+            self.canvas.create_rectangle(*self.word_canvas_rect(pno, w), outline="",
+                                         fill="#3498db", stipple="gray50", tags=("word_sel",))
+
+    def copy_selected_words(self, event=None):
+        """Ctrl+C: copia o texto das palavras selecionadas (quebra de linha entre linhas do PDF)."""
+        if not self.selected_words or isinstance(self.root.focus_get(), (tk.Entry, tb.Entry)):
+            return
+        lines = []
+        last = None
+        for w in self.selected_words[1]:
+            if w[5:7] != last:
+                lines.append([])
+                last = w[5:7]
+            lines[-1].append(w[4])
+        text = "\n".join(" ".join(line) for line in lines)
+        self.root.clipboard_clear()
+        self.root.clipboard_append(text)
+        logger.info(f"Copiadas {len(self.selected_words[1])} palavras da página {self.selected_words[0]+1}")
+
+    # ---------------- Busca no documento ----------------
+    def poll_search_index(self):
+        """Recolhe as páginas já indexadas pelos workers e mostra o progresso."""
+        self._search_poll_id = None
+        index = self.search_index
+        if not index:
+            return
+        index.collect()
+        if index.complete:
+            self.search_status.config(text="")
+        else:
+            self.search_status.config(text=f"Indexando {index.indexed}/{len(index.texts)}")
+            self._search_poll_id = self.root.after(150, self.poll_search_index)
+
+    def find_next(self):
+        """Vai para a próxima ocorrência (na mesma página ou na próxima página que contém o texto)."""
+        raw = self.search_var.get().strip()
+        query = normalize_text(raw)
+        if not self.doc or not self.search_index or not query:
+            return
+        if query != self.search_query:
+            self.search_query = query
+            self.clear_search_hit()
+        hit = self.search_hit
+        if hit and hit[2] + 1 < len(hit[1]):
+            self.show_search_hit(hit[0], hit[1], hit[2] + 1)
+            return
+
+        # páginas editadas: o texto é refeito aqui mesmo, a partir do índice de palavras em cache
+        index = self.search_index
+        for pno in list(index.stale):
+            index.update(pno, words_text(self.page_words(pno).words))
+        start = hit[0] + 1 if hit else self.current_page
+        pno = index.find(query, start)
+        if pno is None:
+            if index.complete:
+                messagebox.showinfo("Buscar", f"'{raw}' não encontrado.")
+            else:
+                self.search_status.config(text=f"Sem resultado em {index.indexed}/{len(index.texts)} págs.")
+            return
+        rects = self.doc[pno].search_for(raw)
+        self.show_search_hit(pno, rects, 0)
+        logger.info(f"Busca '{raw}': página {pno+1} ({len(rects)} ocorrência(s))")
+
+    def show_search_hit(self, pno: int, rects, i: int):
+        """Abre a página da ocorrência, destaca os retângulos e centraliza o atual na tela."""
+        self.search_hit = (pno, rects, i)
+        if pno != self.current_page or (self.continuous and self.page_tops is None):
+            self.go_to_page(pno)
+        self.draw_search_hit()
+        if rects:
+            x0, y0 = self.pdf_to_canvas(pno, rects[i].x0, rects[i].y0)
+            x1, y1 = self.pdf_to_canvas(pno, rects[i].x1, rects[i].y1)
+            region = [float(v) for v in str(self.canvas.cget("scrollregion")).split()]
+            if len(region) == 4 and region[2] > 0 and region[3] > 0:
+                self.canvas.xview_moveto(max(0, (x0 + x1 - self.canvas.winfo_width()) / 2) / region[2])
+                self.canvas.yview_moveto(max(0, (y0 + y1 - self.canvas.winfo_height()) / 2) / region[3])
+                self.schedule_view_update()
+
+    def open_replace_dialog(self):
+        """Diálogo de localizar/substituir em todo o documento (texto literal ou expressão regular)."""
+        if not self.doc:
+            return
+        dlg = tk.Toplevel(self.root)
+        dlg.title("Substituir em todo o documento")
+        dlg.geometry("380x190")
+        dlg.transient(self.root)
+        dlg.grab_set()
+
+        find_var = tk.StringVar(value=self.search_var.get())
+        repl_var = tk.StringVar()
+        regex_var = tk.BooleanVar(value=False)
+        case_var = tk.BooleanVar(value=True)
+
+        form = tk.Frame(dlg)
+        form.pack(pady=8, padx=8, fill=tk.X)
+        tk.Label(form, text="Localizar:").grid(row=0, column=0, sticky="w")
+        find_entry = tk.Entry(form, textvariable=find_var, width=34)
+        find_entry.grid(row=0, column=1, pady=2)
+        tk.Label(form, text="Substituir por:").grid(row=1, column=0, sticky="w")
+        tk.Entry(form, textvariable=repl_var, width=34).grid(row=1, column=1, pady=2)
+        tk.Checkbutton(form, text="Expressão regular", variable=regex_var).grid(row=2, column=1, sticky="w")
+        tk.Checkbutton(form, text="Diferenciar maiúsculas/minúsculas", variable=case_var).grid(row=3, column=1, sticky="w")
+        find_entry.focus_set()
+
+        def do_replace_all():
+            pattern = find_var.get()
+            if not pattern:
+                return
+            dlg.destroy()
+            self.replace_all(pattern, repl_var.get(), regex_var.get(), case_var.get())
+
+        btn_frame = tk.Frame(dlg)
+        btn_frame.pack(pady=6)
+        tk.Button(btn_frame, text="Substituir tudo", width=14, command=do_replace_all).pack(side="left", padx=6)
+        tk.Button(btn_frame, text="Cancelar", width=8, command=dlg.destroy).pack(side="left", padx=6)
+        dlg.bind("<Return>", lambda e: do_replace_all())
+        dlg.bind("<Escape>", lambda e: dlg.destroy())
+
+    def replace_all(self, pattern: str, replacement: str, use_regex: bool = False, match_case: bool = True):
+        """Substitui todas as ocorrências no documento como uma única ação (um undo, uma renderização)."""
+        try:
+            compile_replacement(pattern, replacement, use_regex, match_case)
+        except re.error as e:
+            messagebox.showerror("Erro", f"Expressão regular inválida:\n{e}")
+            return
+
+        # páginas que o índice de busca já sabe que não contêm o texto literal nem são abertas
+        started = time.perf_counter()
+        texts = self.search_index.texts if self.search_index else None
+        try:
+            total, pages = self.session.replace_all(pattern, replacement, use_regex, match_case, texts)
+        except re.error as e:
+            messagebox.showerror("Erro", f"Substituição inválida:\n{e}")
+            return
+        except Exception as e:
+            self.render_page()
+            logger.error(f"Erro ao substituir em lote: {e}")
+            messagebox.showerror("Erro", f"Falha ao substituir:\n{e}")
+            return
+        if not total:
+            messagebox.showinfo("Substituir", f"'{pattern}' não encontrado.")
+            return
+        self.render_page()
+        logger.info(f"Substituídas {total} ocorrência(s) de '{pattern}' em {pages} página(s) "
+                    f"em {time.perf_counter() - started:.2f}s")
+        messagebox.showinfo("Substituir", f"{total} ocorrência(s) substituída(s) em {pages} página(s).")
+
+    def draw_search_hit(self):
+        self.canvas.delete("search_hit")
+        if not self.search_hit:
+            return
+        pno, rects, current = self.search_hit
+        for i, r in enumerate(rects):
+            x0, y0 = self.pdf_to_canvas(pno, r.x0, r.y0)
+            x1, y1 = self.pdf_to_canvas(pno, r.x1, r.y1)
+            self.canvas.create_rectangle(x0, y0, x1, y1, outline="#e67e22" if i == current else "#f1c40f",
+                                         width=2, tags=("search_hit",))
+
+    def clear_search_hit(self):
+        self.canvas.delete("search_hit")
+        self.search_hit = None
+
     # ---------------- Canvas geral drag (para não conflitar) ----------------
     def on_canvas_motion(self, event):
-        # usado se necessário para interações gerais; mantemos vazio para não atrapalhar
-        pass
+        # arrastar com Shift pressionado: estica o retângulo de seleção
+        if self._select_start is None:
+            return
+        _, sx, sy = self._select_start
+        self.canvas.coords("word_band", sx, sy, self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
 
     def on_canvas_release(self, event):
-        # usado se necessário
-        pass
+        # fim do retângulo de seleção: consulta o índice espacial da página onde ele começou
+        if self._select_start is None:
+            return
+        pno, sx, sy = self._select_start
+        self._select_start = None
+        self.canvas.delete("word_band")
+        ex = self.canvas.canvasx(event.x)
+        ey = self.canvas.canvasy(event.y)
+        x0, y0 = self.canvas_to_page(pno, min(sx, ex), min(sy, ey))
+        x1, y1 = self.canvas_to_page(pno, max(sx, ex), max(sy, ey))
+        words = self.page_words(pno).in_rect(x0, y0, x1, y1)
+        self.selected_words = (pno, words) if words else None
+        self.draw_word_selection()
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # necessário para o worker no executável (PyInstaller)
+    STARTUP.mark("import")
+    setup_logging()
+    STARTUP.mark("log")
+    if sys.argv[1:2] == ["batch"]:
+        sys.exit(batch_main(sys.argv[2:]))
+    if sys.argv[1:2] == ["merge"]:
+        sys.exit(merge_main(sys.argv[2:]))
+    if sys.argv[1:2] == ["serve"]:
+        sys.exit(serve_main(sys.argv[2:]))
+    if sys.argv[1:2] == ["startup-report"]:
+        sys.exit(startup_main(sys.argv[2:]))
+    load_gui()
+    STARTUP.mark("gui")
     app = tb.Window(themename="darkly")
+    STARTUP.mark("tema")
     app.title("Editor de PDF")
     app.geometry("1200x650")
     LicenseMenu(app)
+    STARTUP.mark("interface")
+    # roda depois dos desenhos pendentes: a primeira janela já está na tela
+    app.after_idle(lambda: (STARTUP.mark("janela"), STARTUP.report()))
     app.mainloop()
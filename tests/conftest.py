@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+# editor_trial.py fica na raiz do repositório (não é um pacote instalado)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import editor_trial as et  # noqa: E402
+
+LINES = [
+    "Pagina {n} contrato Fulano de Tal",
+    "clausula primeira do CONTRATO",
+    "Outro texto Fulano aqui",
+]
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    """PDF gerado na hora: 3 páginas A4 com as linhas de LINES (Helvetica 12pt)."""
+    path = str(tmp_path / "doc.pdf")
+    doc = et.fitz.open()
+    for n in range(3):
+        page = doc.new_page()
+        for i, line in enumerate(LINES):
+            page.insert_text((72, 72 + 24 * i), line.format(n=n), fontsize=12, fontname="helv")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.fixture
+def session(pdf_path):
+    s = et.EditorSession(undo_spill=False)
+    s.open(pdf_path)
+    yield s
+    s.shutdown()
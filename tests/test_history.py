@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+import editor_trial as et
+
+
+def _ops(n: int, size: int = 1000):
+    return [("page", n, ("antes", "x" * size), ("depois", "y" * size))]
+
+
+def test_history_spills_old_entries_and_restores_them():
+    history = et.EditHistory(max_bytes=5000, spill=True)
+    for n in range(10):
+        history.push(f"edição {n}", _ops(n))
+    spilled = [entry for entry in history.undo_stack if entry.ops is None]
+    assert spilled and all(os.path.exists(entry.path) for entry in spilled)
+    assert history.undo_stack[-1].ops is not None  # a mais recente fica sempre em memória
+    spill_dir = history._spill_dir
+    for n in reversed(range(10)):
+        entry = history.undo()
+        assert entry.label == f"edição {n}"
+        assert entry.ops == _ops(n)
+    assert history.undo() is None
+    assert [history.redo().label for _ in range(10)] == [f"edição {n}" for n in range(10)]
+    history.close()
+    assert not os.path.exists(spill_dir)
+
+
+def test_history_without_spill_drops_oldest():
+    history = et.EditHistory(max_bytes=5000, spill=False)
+    for n in range(10):
+        history.push(f"edição {n}", _ops(n))
+    assert history._spill_dir is None
+    assert 0 < len(history.undo_stack) < 10
+    assert history.undo_stack[-1].label == "edição 9"
+
+
+def test_push_clears_redo():
+    history = et.EditHistory(max_bytes=1 << 20)
+    history.push("a", _ops(0, 10))
+    history.undo()
+    history.push("b", _ops(1, 10))
+    assert history.redo() is None
+    assert history.undo().label == "b"
+
+
+def test_overlay_store_buckets_and_canvas_ids():
+    store = et.OverlayStore()
+    a = store.add(0, 10, 20, "a", 12)
+    b = store.add(1, 30, 40, "b", 12)
+    assert [o.oid for o in store.on_page(0)] == [a.oid]
+    store.bind(a.oid, 101)
+    assert store.by_canvas_id(101) is a and store.canvas_id(a.oid) == 101
+    moved = store.put((a.oid, 1, 5, 5, "a", 14))
+    assert list(store.pages()) == [1]
+    assert {o.oid for o in store.on_page(1)} == {a.oid, b.oid}
+    assert store.canvas_id(a.oid) == 101 and store.get(a.oid) is moved
+    store.remove(b.oid)
+    store.remove(a.oid)
+    assert len(store) == 0 and list(store.pages()) == [] and store.by_canvas_id(101) is None
+    assert store.add(0, 0, 0, "c", 12).oid > b.oid  # ids não são reaproveitados
+
+
+def test_replace_undo_redo_restores_page(session):
+    before = session.doc[0].read_contents()
+    session.replace(0, (72, 60, 120, 76), "Trocado")
+    assert session.doc[0].read_contents() != before
+    assert session.undo().label == "Substituir"
+    assert session.doc[0].read_contents() == before
+    session.redo()
+    assert "Trocado" in session.doc[0].get_text()
+
+
+def test_object_moved_to_another_page_is_one_undo_step(session):
+    obj = session.insert_text(0, 100, 100, "Oi")
+    session.update_object(obj.oid, "Mover texto", page=2, x=50, y=60)
+    assert list(session.objects.pages()) == [2]
+    session.undo()
+    assert list(session.objects.pages()) == [0]
+    assert session.objects.get(obj.oid).state() == (obj.oid, 0, 100, 100, "Oi", 12)
+    with pytest.raises(IndexError):
+        session.update_object(obj.oid, page=3)
+    with pytest.raises(AttributeError):
+        session.update_object(obj.oid, color="red")
+    session.redo()
+    session.bake()
+    assert "Oi" in session.doc[2].get_text() and "Oi" not in session.doc[0].get_text()
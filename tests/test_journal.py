@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+import editor_trial as et
+
+HEADER = {"op": "open", "path": "/docs/a.pdf", "fingerprint": "f0"}
+
+
+def test_pending_edits_without_edits_is_none():
+    assert et.EditJournal.pending_edits([]) is None
+    assert et.EditJournal.pending_edits([HEADER]) is None
+    assert et.EditJournal.pending_edits([{"op": "replace"}]) is None  # sem cabeçalho
+
+
+def test_pending_edits_starts_after_last_completed_save():
+    records = [HEADER, {"op": "replace", "page": 0}, {"op": "save_start", "id": "s1"},
+               {"op": "saved", "id": "s1", "fingerprint": "f1"}, {"op": "bake"},
+               {"op": "save_start", "id": "s2"}, {"op": "replace", "page": 1}]
+    path, fingerprint, edits = et.EditJournal.pending_edits(records)
+    # s2 não terminou: vale o arquivo de s1, com tudo o que veio depois dele
+    assert (path, fingerprint) == ("/docs/a.pdf", "f1")
+    assert edits == [{"op": "bake"}, {"op": "replace", "page": 1}]
+
+
+def test_pending_edits_fully_saved_is_none():
+    records = [HEADER, {"op": "bake"}, {"op": "save_start", "id": "s"},
+               {"op": "saved", "id": "s", "fingerprint": "f1"}]
+    assert et.EditJournal.pending_edits(records) is None
+
+
+def _replay(pdf_path, records):
+    pending = et.EditJournal.pending_edits(records)
+    session = et.EditorSession(undo_spill=False)
+    session.open(pdf_path)
+    assert session.fingerprint == pending[1]
+    for rec in pending[2]:
+        session.apply_record(rec)
+    return session
+
+
+def test_replay_rebuilds_the_same_document(session, pdf_path):
+    records = [dict(HEADER, fingerprint=session.fingerprint)]
+    session.on_edit = records.append
+    session.replace(0, (72, 60, 120, 76), "Trocado")
+    session.replace_all("Fulano", "Beltrano")
+    obj = session.insert_text(1, 100, 300, "Novo")
+    session.update_object(obj.oid, "Mover texto", page=2, x=80, y=320)
+    session.undo()
+    session.redo()
+    session.bake()
+    expected = [session.doc[pno].get_text() for pno in range(3)]
+    session.close()
+    records = json.loads(json.dumps(records))  # como volta do arquivo
+    replayed = _replay(pdf_path, records)
+    assert [replayed.doc[pno].get_text() for pno in range(3)] == expected
+    replayed.shutdown()
+
+
+def test_replay_after_save_rejects_undo_of_pre_save_edit(session, pdf_path):
+    records = [dict(HEADER, fingerprint=session.fingerprint)]
+    session.on_edit = records.append
+    session.replace(0, (72, 60, 120, 76), "Trocado")
+    session.save()  # incremental sobre o próprio arquivo
+    records += [{"op": "save_start", "id": "s"},
+                {"op": "saved", "id": "s", "fingerprint": et.file_fingerprint(pdf_path)}]
+    session.undo()  # desfaz uma edição que já está no arquivo salvo
+    session.close()
+    pending = et.EditJournal.pending_edits(records)
+    assert pending[2] == [{"op": "undo"}]
+    replay = et.EditorSession(undo_spill=False)
+    replay.open(pdf_path)
+    with pytest.raises(ValueError):
+        replay.apply_record(pending[2][0])
+    replay.shutdown()
+
+
+def test_apply_record_unknown_op():
+    with pytest.raises(ValueError):
+        et.EditorSession().apply_record({"op": "format_disk"})
+
+
+def test_journal_file_roundtrip_and_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(et, "JOURNAL_DIR", str(tmp_path))
+    path = str(tmp_path / "20260101_000000_1.jsonl")
+    journal = et.EditJournal(path, {"path": "/docs/a.pdf", "fingerprint": "f0"})
+    journal.append({"op": "replace", "page": 0, "rect": [1, 2, 3, 4], "text": "á"})
+    # travado enquanto a sessão está viva: não é sobra de uma queda
+    assert et.EditJournal.leftovers() == []
+    journal.close()
+    assert et.EditJournal.leftovers() == [path]
+    records = et.EditJournal.load(path)
+    assert [r["op"] for r in records] == ["open", "replace"]
+    assert records[1]["text"] == "á"
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "repl')  # última linha cortada pela queda
+    assert len(et.EditJournal.load(path)) == 2
+    et.EditJournal.remove(path)
+    et.EditJournal.remove(path)  # já apagado: só registra no log
+    assert et.EditJournal.leftovers() == []
@@ -0,0 +1,58 @@
+import datetime
+import json
+import os
+
+import editor_trial as et
+
+
+def test_missing_file_gets_defaults_and_is_saved(tmp_path):
+    path = str(tmp_path / "sub" / "license.json")
+    state = et.LicenseState.load(path, trial_days=7, trial_uses=30)
+    assert state.dirty and not state.activated
+    assert state.uses_left == 30 and state.days_left in (6, 7)
+    assert state.save()
+    assert not os.path.exists(path + ".tmp")
+    again = et.LicenseState.load(path, 7, 30)
+    assert not again.dirty and again.data == state.data
+
+
+def test_use_trial_and_activate_persist(tmp_path):
+    path = str(tmp_path / "license.json")
+    state = et.LicenseState.load(path, 7, 2)
+    state.use_trial()
+    state.use_trial()
+    state.use_trial()
+    assert state.uses_left == 0
+    state.activate("abc123")
+    state.save()
+    again = et.LicenseState.load(path, 7, 2)
+    assert again.activated and again.data["key"] == "abc123" and again.data["uses"] == 3
+
+
+def test_save_without_changes_does_not_write(tmp_path):
+    path = str(tmp_path / "license.json")
+    state = et.LicenseState.load(path, 7, 30)
+    state.save()
+    mtime = os.stat(path).st_mtime_ns
+    assert et.LicenseState.load(path, 7, 30).save()
+    assert os.stat(path).st_mtime_ns == mtime
+
+
+def test_corrupt_or_incomplete_file_is_repaired(tmp_path):
+    path = str(tmp_path / "license.json")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{não é json")
+    state = et.LicenseState.load(path, 7, 30)
+    assert state.dirty and state.uses_left == 30
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"uses": 5, "max_uses": 30, "trial_expire": "ontem", "activated": False}, f)
+    state = et.LicenseState.load(path, 7, 30)
+    assert state.dirty and state.uses_left == 25
+    # data inválida volta para o padrão (agora + dias do trial)
+    assert datetime.datetime.fromisoformat(state.data["trial_expire"]) > datetime.datetime.now()
+    assert "install_date" in state.data and state.data["key"] == ""
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([1, 2, 3], f)
+    assert et.LicenseState.load(path, 7, 30).dirty
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+import editor_trial as et
+
+
+@pytest.fixture
+def service(tmp_path):
+    out = tmp_path / "saida"
+    out.mkdir()
+    svc = et.DocumentService(1, output_dir=str(out))
+    yield svc
+    svc.shutdown()
+
+
+def test_save_target_stays_inside_output_dir(service, tmp_path):
+    out = service.output_dir
+    assert service.save_target("a.pdf") == os.path.join(out, "a.pdf")
+    assert service.save_target("sub/b.PDF") == os.path.join(out, "sub", "b.PDF")
+    assert service.save_target(os.path.join(out, "c.pdf")) == os.path.join(out, "c.pdf")
+    for target in ("../fora.pdf", str(tmp_path / "fora.pdf"), "sub/../../fora.pdf"):
+        with pytest.raises(PermissionError):
+            service.save_target(target)
+    with pytest.raises(ValueError):
+        service.save_target("a.txt")
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink") or os.name == "nt", reason="symlink")
+def test_save_target_rejects_symlink_escape(service, tmp_path):
+    os.symlink(str(tmp_path), os.path.join(service.output_dir, "link"))
+    with pytest.raises(PermissionError):
+        service.save_target("link/fora.pdf")
+
+
+def test_save_without_path_needs_allow_overwrite(service):
+    with pytest.raises(PermissionError):
+        service.save_target(None)
+    service.allow_overwrite = True
+    assert service.save_target(None) is None
+
+
+def test_save_without_output_dir_is_refused():
+    svc = et.DocumentService(1)
+    try:
+        with pytest.raises(PermissionError):
+            svc.save_target("a.pdf")
+    finally:
+        svc.shutdown()
+
+
+@pytest.mark.parametrize("rect", ["abc", [1, 2, 3], [1, 2, "x", 4], [True, 0, 5, 5], {"x0": 1}, None])
+def test_json_rect_rejects_bad_input(rect):
+    with pytest.raises(ValueError):
+        et._json_rect(rect)
+
+
+def test_json_rect_accepts_four_numbers():
+    assert tuple(et._json_rect([1, 2.5, 30, 40])) == (1, 2.5, 30, 40)
+    with pytest.raises(ValueError):
+        et._json_rect([10, 10, 10, 20])  # vazio
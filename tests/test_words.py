@@ -0,0 +1,85 @@
+import random
+import re
+
+import pytest
+
+import editor_trial as et
+
+
+def _word(x0, y0, x1, y1, text, line=0, no=0):
+    return (x0, y0, x1, y1, text, 0, line, no)
+
+
+def test_word_index_matches_brute_force():
+    rnd = random.Random(7)
+    words = []
+    for i in range(300):
+        x, y = rnd.uniform(0, 550), rnd.uniform(0, 800)
+        words.append(_word(x, y, x + rnd.uniform(5, 80), y + rnd.uniform(6, 14), f"w{i}", no=i))
+    index = et.WordIndex(words)
+    for _ in range(200):
+        x, y = rnd.uniform(0, 600), rnd.uniform(0, 820)
+        hit = index.at(x, y)
+        if hit is None:
+            assert not any(w[0] <= x <= w[2] and w[1] <= y <= w[3] for w in words)
+        else:
+            assert hit[0] <= x <= hit[2] and hit[1] <= y <= hit[3]
+    for _ in range(50):
+        x0, y0 = rnd.uniform(0, 500), rnd.uniform(0, 700)
+        x1, y1 = x0 + rnd.uniform(0, 120), y0 + rnd.uniform(0, 120)
+        expected = [w for w in words if w[0] <= x1 and w[2] >= x0 and w[1] <= y1 and w[3] >= y0]
+        assert index.in_rect(x0, y0, x1, y1) == expected
+
+
+def test_word_index_empty_page():
+    index = et.WordIndex([])
+    assert index.at(10, 10) is None
+    assert index.in_rect(0, 0, 600, 800) == []
+
+
+LINE = [_word(10, 0, 40, 10, "Fulano", no=0), _word(45, 0, 60, 10, "de", no=1),
+        _word(65, 0, 90, 10, "Tal,", no=2), _word(95, 0, 140, 10, "contrato", no=3)]
+
+
+def test_literal_replacement_keeps_rest_of_word():
+    regex, repl = et.compile_replacement("Tal", "Souza")
+    [(rect, text)] = et.find_replacements(LINE, regex, repl)
+    assert text == "Souza,"
+    assert tuple(rect) == (65, 0, 90, 10)
+
+
+def test_replacement_across_words_joins_their_rects():
+    regex, repl = et.compile_replacement("Fulano de Tal", "Beltrano")
+    [(rect, text)] = et.find_replacements(LINE, regex, repl)
+    assert text == "Beltrano,"
+    assert tuple(rect) == (10, 0, 90, 10)
+
+
+def test_literal_pattern_is_escaped_and_case_option():
+    regex, repl = et.compile_replacement("CONTRATO", "acordo", match_case=False)
+    assert [t for _, t in et.find_replacements(LINE, regex, repl)] == ["acordo"]
+    regex, repl = et.compile_replacement("CONTRATO", "acordo")
+    assert et.find_replacements(LINE, regex, repl) == []
+    regex, repl = et.compile_replacement("Tal,", "x")  # '.' e ',' literais, não regex
+    assert [t for _, t in et.find_replacements(LINE, regex, repl)] == ["x"]
+
+
+def test_regex_groups_and_separate_lines():
+    words = LINE + [_word(10, 20, 50, 30, "Fulano", line=1), _word(55, 20, 90, 30, "Silva", line=1)]
+    regex, repl = et.compile_replacement(r"Fulano (\w+)", r"\1 Fulano", use_regex=True)
+    found = et.find_replacements(words, regex, repl)
+    assert [t for _, t in found] == ["de Fulano", "Silva Fulano"]
+
+
+def test_invalid_regex_raises():
+    with pytest.raises(re.error):
+        et.compile_replacement("(", "x", use_regex=True)
+
+
+def test_session_words_and_replace_all(session):
+    assert session.word_at(0, 80, 68)[4] == "Pagina"
+    found, pages = session.replace_all("contrato", "acordo", match_case=False)
+    assert (found, pages) == (6, 3)
+    assert "acordo" in session.doc[2].get_text()
+    # o índice de palavras da página editada é refeito (revisão nova)
+    assert any(w[4] == "acordo" for w in session.words(0).words)